@@ -0,0 +1,231 @@
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta, timezone
+import glob
+import logging
+import os
+import threading
+
+import crud
+import parquet_export
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Analytics over the Parquet snapshot (parquet_export.py) with embedded DuckDB.
+# ANALYTICS_BACKEND=duckdb routes the /analytics/* panels here: scans run vectorized
+# on local cores and never reach Postgres, at the cost of trailing the database by
+# the export schedule. The panel functions take the same arguments and return the
+# same shapes as their crud.py counterparts (`db` is only read by the dashboard's
+# live recent-transactions list).
+# Heavy reports that only make sense on the column store live here only.
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "postgres").lower()
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", "0")) # 0 = all cores
+DUCKDB_MEMORY_LIMIT = os.getenv("DUCKDB_MEMORY_LIMIT")
+
+ENABLED = ANALYTICS_BACKEND == "duckdb"
+
+_connection = None
+_lock = threading.Lock()
+
+def _connect():
+    """
+    The process-wide DuckDB connection (in-memory database, views over the files).
+    """
+    global _connection
+    if _connection is not None:
+        return _connection
+    with _lock:
+        if _connection is None:
+            import duckdb # Optional: only needed with ANALYTICS_BACKEND=duckdb
+            facts = os.path.join(parquet_export.SALES_FACTS_DIR, "**", "*.parquet")
+            if not glob.glob(facts, recursive=True):
+                raise RuntimeError("No Parquet snapshot yet: run `python parquet_export.py incremental`")
+            config = {"threads": DUCKDB_THREADS} if DUCKDB_THREADS > 0 else {}
+            if DUCKDB_MEMORY_LIMIT:
+                config["memory_limit"] = DUCKDB_MEMORY_LIMIT
+            conn = duckdb.connect(config=config)
+            conn.execute(f"""
+                CREATE VIEW sales_facts AS SELECT * FROM read_parquet('{facts}',
+                    hive_partitioning = true, hive_types = {{'month': VARCHAR, 'location': INTEGER}})
+            """)
+            for name in parquet_export.DIMENSION_SCHEMAS:
+                path = os.path.join(parquet_export.DIMENSIONS_DIR, f"{name}.parquet")
+                conn.execute(f"CREATE VIEW {name} AS SELECT * FROM read_parquet('{path}')")
+            _connection = conn
+            logger.info(f"DuckDB analytics over {parquet_export.PARQUET_EXPORT_DIR}.")
+    return _connection
+
+def snapshot_version():
+    """
+    Changes whenever a new export lands (for ETags).
+    """
+    return (str(parquet_export.read_watermark()), os.path.getmtime(parquet_export.DIMENSIONS_DIR) if os.path.isdir(parquet_export.DIMENSIONS_DIR) else None)
+
+def _id_list(location_ids) -> str:
+    return ", ".join(str(int(i)) for i in location_ids) or "NULL"
+
+def _query(sql: str, params=None) -> list[dict]:
+    cursor = _connect().cursor() # One cursor per call: cursors are safe across threads
+    try:
+        cursor.execute(sql, params or [])
+        names = [column[0] for column in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def _sales(location_ids, days: int, tz: str = None, shift: int = 0):
+    """
+    Completed sale lines of each store's last `days` local days (ending `shift` days
+    before its local today), as a subquery with day / hour (store local), revenue and
+    cost. Like crud's panels, every store is cut at its own midnight unless tz forces
+    one timezone. month / location filters prune files.
+    """
+    # A store's local today is within a day of the UTC date, and a local day's sales
+    # within a day of it too
+    utc_today = datetime.now(timezone.utc).date()
+    first_month = (utc_today - timedelta(days=days + shift + 1)).strftime("%Y-%m")
+    last_month = (utc_today - timedelta(days=shift - 2)).strftime("%Y-%m")
+    sql = f"""(
+        SELECT *, CAST(local_at AS DATE) AS day, hour(local_at) AS hour,
+               quantity * unit_price AS revenue, quantity * unit_cost_at_sale AS cost
+        FROM (
+            SELECT *, timezone(zone, created_at) AS local_at, CAST(timezone(zone, current_timestamp) AS DATE) AS local_today
+            FROM (
+                SELECT f.*, coalesce(CAST(? AS VARCHAR), l.timezone, ?) AS zone
+                FROM sales_facts f LEFT JOIN locations l ON l.id = f.location_id
+                WHERE f.location IN ({_id_list(location_ids)})
+                  AND f.month BETWEEN ? AND ?
+                  AND f.status = 'completed'
+            ) facts
+        ) lines
+        WHERE CAST(local_at AS DATE) BETWEEN local_today - CAST(? AS INTEGER) AND local_today - CAST(? AS INTEGER)
+    )"""
+    return sql, [tz, crud.STORE_TIMEZONE, first_month, last_month, days - 1 + shift, shift]
+
+def get_daily_sales_stats(db: Session, location_ids: list[int], tz: str = None):
+    sales, params = _sales(location_ids, 1, tz)
+    row = _query(f"SELECT sum(revenue) AS total_revenue, count(DISTINCT transaction_id) AS tx_count FROM {sales} s", params)[0]
+    return {"total_revenue": row["total_revenue"] or 0.0, "tx_count": row["tx_count"] or 0}
+
+def get_dashboard_kpis(db: Session, location_ids: list[int], tz: str = None):
+    stats = get_daily_sales_stats(db, location_ids, tz)
+    count_today = int(stats["tx_count"])
+    revenue_today = float(stats["total_revenue"])
+    return {
+        "revenue_today": revenue_today,
+        "count_today": count_today,
+        "avg_ticket": revenue_today / count_today if count_today > 0 else 0.0
+    }
+
+def get_sales_over_time(db: Session, location_ids: list[int], days: int = 7, tz: str = None):
+    sales, params = _sales(location_ids, days, tz)
+    rows = _query(f"""
+        SELECT day, sum(revenue) AS revenue, count(DISTINCT transaction_id) AS count
+        FROM {sales} s GROUP BY day ORDER BY day
+    """, params)
+    return [{"date": str(r["day"]), "revenue": float(r["revenue"]), "count": int(r["count"])} for r in rows]
+
+def get_top_products(db: Session, location_ids: list[int], limit: int = 10, days: int = 30, tz: str = None):
+    sales, params = _sales(location_ids, days, tz)
+    rows = _query(f"""
+        SELECT arg_max(product_name, created_at) AS name, sum(quantity) AS quantity
+        FROM {sales} s GROUP BY product_id HAVING sum(quantity) > 0
+        ORDER BY quantity DESC LIMIT ?
+    """, params + [limit])
+    return [{"name": r["name"], "quantity": int(r["quantity"])} for r in rows]
+
+def get_sales_by_category(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    sales, params = _sales(location_ids, days, tz)
+    rows = _query(f"""
+        SELECT c.name, sum(s.quantity) AS value
+        FROM {sales} s JOIN categories c ON c.id = s.category_id
+        GROUP BY c.id, c.name HAVING sum(s.quantity) > 0
+    """, params)
+    return [{"name": r["name"], "value": int(r["value"])} for r in rows]
+
+def get_revenue_by_location(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    sales, params = _sales(location_ids, days, tz)
+    rows = _query(f"""
+        SELECT l.name AS location, sum(s.revenue) AS revenue
+        FROM {sales} s JOIN locations l ON l.id = s.location_id
+        GROUP BY l.id, l.name
+    """, params)
+    return [{"location": r["location"], "revenue": float(r["revenue"])} for r in rows]
+
+def get_dashboard(db: Session, location_ids: list[int], days: int = 7, period_days: int = 30, limit: int = 10, tz: str = None):
+    """
+    Same payload as crud.get_dashboard. Panels come from the snapshot; the recent
+    transactions list is a short indexed read of the live database.
+    """
+    recent = crud.get_recent_transactions(db, location_ids)
+    return {
+        "kpis": get_dashboard_kpis(db, location_ids, tz),
+        "sales_over_time": get_sales_over_time(db, location_ids, days, tz),
+        "top_products": get_top_products(db, location_ids, limit, period_days, tz),
+        "categories": get_sales_by_category(db, location_ids, period_days, tz),
+        "locations": get_revenue_by_location(db, location_ids, period_days, tz),
+        "daily": {
+            "stats": get_daily_sales_stats(db, location_ids, tz),
+            "recent_transactions": [
+                {
+                    "id": t.id,
+                    "total_amount": t.total_amount,
+                    "created_at": t.created_at,
+                    "item_count": len(t.details)
+                } for t in recent
+            ]
+        }
+    }
+
+# --- Heavy reports (column store only) ---
+
+def get_category_location_yoy(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    """
+    Revenue by category and location over the last `days`, next to the same days
+    52 weeks earlier (same weekdays).
+    """
+    current, current_params = _sales(location_ids, days, tz)
+    last_year, last_year_params = _sales(location_ids, days, tz, shift=364)
+    rows = _query(f"""
+        WITH periods AS (
+            SELECT 'current' AS period, * FROM {current} s
+            UNION ALL BY NAME
+            SELECT 'last_year' AS period, * FROM {last_year} p
+        )
+        SELECT coalesce(c.name, 'Uncategorized') AS category, l.name AS location,
+               sum(revenue) FILTER (WHERE period = 'current') AS revenue,
+               sum(revenue) FILTER (WHERE period = 'last_year') AS revenue_last_year
+        FROM periods
+        JOIN locations l ON l.id = periods.location_id
+        LEFT JOIN categories c ON c.id = periods.category_id
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """, current_params + last_year_params)
+    return [
+        {
+            "category": r["category"],
+            "location": r["location"],
+            "revenue": float(r["revenue"] or 0),
+            "revenue_last_year": float(r["revenue_last_year"] or 0),
+            "growth": float(r["revenue"] / r["revenue_last_year"] - 1) if r["revenue"] is not None and r["revenue_last_year"] else None
+        } for r in rows
+    ]
+
+def get_margin_by_hour(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    """
+    Revenue, cost and margin by store-local hour of day over the last `days`.
+    """
+    sales, params = _sales(location_ids, days, tz)
+    rows = _query(f"""
+        SELECT hour, sum(revenue) AS revenue, sum(cost) AS cost
+        FROM {sales} s GROUP BY hour ORDER BY hour
+    """, params)
+    return [
+        {
+            "hour": int(r["hour"]),
+            "revenue": float(r["revenue"]),
+            "cost": float(r["cost"]),
+            "margin": float(r["revenue"] - r["cost"]),
+            "margin_pct": float((r["revenue"] - r["cost"]) / r["revenue"]) if r["revenue"] else 0.0
+        } for r in rows
+    ]
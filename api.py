@@ -1,20 +1,39 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Header, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import Annotated
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import IntegrityError
+from datetime import date, timedelta
+from typing import Annotated, Optional
 
 import crud
+import crud_async
 import schemas
 import service_logic
 import service_admin
 import recommendation_engine
-from database import SessionLocal
+import idempotency
+import sale_writer
+import hot_stock
+import reservations
+import partitioning
+import security
+import authorization
+import exports
+import parquet_export
+import analytics_duckdb
+import heavy_hitters
+import events
+import margin_analytics
+from database import SessionLocal, AsyncSessionLocal, pool_status
+import database
+from fastapi.concurrency import run_in_threadpool
 import init_db
 import logging
+import hashlib
 
 # Setup Logging
 logging.basicConfig(level=logging.INFO)
@@ -50,6 +69,55 @@ async def read_css():
 async def read_js():
     return FileResponse('frontend/app.js')
 
+@app.on_event("startup")
+def start_sale_writer():
+    if sale_writer.GROUP_COMMIT_ENABLED:
+        sale_writer.writer.start()
+
+@app.on_event("startup")
+def start_hot_sku_rebalancer():
+    hot_stock.rebalancer.start()
+
+@app.on_event("startup")
+def start_reservation_keeper():
+    reservations.keeper.start()
+
+@app.on_event("startup")
+def start_partition_maintainer():
+    partitioning.maintainer.start()
+
+@app.on_event("startup")
+def start_event_broker():
+    events.broker.start()
+
+@app.on_event("shutdown")
+def stop_event_broker():
+    events.broker.stop()
+
+@app.on_event("startup")
+def start_sketch_persister():
+    heavy_hitters.persister.start()
+
+@app.on_event("shutdown")
+def stop_sketch_persister():
+    heavy_hitters.persister.stop()
+
+@app.on_event("shutdown")
+def stop_partition_maintainer():
+    partitioning.maintainer.stop()
+
+@app.on_event("shutdown")
+def stop_reservation_keeper():
+    reservations.keeper.stop()
+
+@app.on_event("shutdown")
+def stop_sale_writer():
+    sale_writer.writer.stop()
+
+@app.on_event("shutdown")
+def stop_hot_sku_rebalancer():
+    hot_stock.rebalancer.stop()
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -58,71 +126,231 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Read-only dependencies: analytics, reports and inventory reads go to the replica
+# when one is configured and within lag, so they never queue behind /sales writes.
+def get_read_db():
+    db = database.read_session()
+    try:
+        yield db
+    finally:
+        db.close()
+
+async def get_async_read_db():
+    use_replica = await run_in_threadpool(database.replica_available)
+    async with database.async_read_session(use_replica) as db:
+        yield db
+
 # Auth config (Simplified for Demo)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: Session = Depends(get_db)):
-    # In production, verify JWT signature here
-    # For this demo, token IS the username (Very insecure, but proof of concept)
-    user = db.query(crud.Employee).filter(crud.Employee.username == token).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid authentication credentials",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    return user
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)], db: AsyncSession = Depends(get_async_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid authentication credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    try:
+        claims = security.decode_access_token(token)
+    except ValueError:
+        raise credentials_exception
+
+    # Cached principal: no auth query on the hot path
+    employee_id = int(claims["sub"])
+    principal = security.get_cached_principal(employee_id)
+    if principal is None:
+        employee = await crud_async.get_employee(db, employee_id)
+        if not employee:
+            raise credentials_exception
+        principal = security.Principal.from_employee(employee)
+        security.cache_principal(principal)
+
+    # Role or store changed since the token was issued: log in again
+    if not security.claims_match(claims, principal):
+        raise credentials_exception
+    return principal
 
 # --- Routes ---
 
 @app.post("/token", response_model=schemas.Token)
-async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: Session = Depends(get_db)):
-    user = crud.get_employee_by_username(db, form_data.username)
+async def login_for_access_token(form_data: Annotated[OAuth2PasswordRequestForm, Depends()], db: AsyncSession = Depends(get_async_db)):
+    user = await crud_async.get_employee_by_username(db, form_data.username)
+
+    valid = False
+    if user:
+        # Hash verification runs on the bounded hasher pool, never on the event loop
+        try:
+            valid, needs_rehash = await security.hasher.verify(form_data.password, user.password_hash)
+        except security.HasherBusy as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
         
-    if not user or user.password_hash != form_data.password: # Hashing skipped for demo
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    # Return username as token for simplicity in this non-JWT demo
-    return {"access_token": user.username, "token_type": "bearer"}
+    if needs_rehash:
+        security.hasher.schedule_rehash(user.id, form_data.password)
+    security.cache_principal(security.Principal.from_employee(user))
+    return {
+        "access_token": security.create_access_token(user),
+        "token_type": "bearer",
+        "role": user.role,
+        "assigned_location_id": user.assigned_location_id
+    }
 
 @app.post("/sales", response_model=schemas.TransactionResponse, status_code=status.HTTP_201_CREATED)
-def process_sale_endpoint(sale_req: schemas.SaleRequest, current_user: Annotated[crud.Employee, Depends(get_current_user)], db: Session = Depends(get_db)):
-    try:
-        # Convert Pydantic items to list of dicts, populating unit_price if missing
-        items_dict = []
-        for item in sale_req.items:
-            data = item.model_dump()
-            if data['unit_price'] is None:
-                prod = crud.get_product(db, item.product_id)
-                if not prod:
-                    raise ValueError(f"Product {item.product_id} not found")
-                data['unit_price'] = float(prod.price)
-            items_dict.append(data)
+async def process_sale_endpoint(
+    sale_req: schemas.SaleRequest,
+    current_user: Annotated[security.Principal, Depends(get_current_user)],
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Annotated[Optional[str], Header()] = None
+):
+    # Retries carrying an already processed Idempotency-Key get the original response back
+    if idempotency_key is not None:
+        try:
+            idempotency.validate_key(idempotency_key)
+            replay = await db.run_sync(idempotency.lookup, idempotency_key, current_user.id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except idempotency.IdempotencyConflict as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if replay:
+            return replay
+
+    try:
+        # Missing unit prices are filled in by service_logic.process_sale from the cart's products
+        items_dict = [item.model_dump() for item in sale_req.items]
         
-        tx = service_logic.process_sale(
-            db, 
-            sale_req.selling_location_id, 
-            current_user.id, 
-            items_dict, 
-            sale_req.customer_id
-        )
-        # Re-fetch to guarantee attachment after commit
-        db.refresh(tx)
+        if sale_writer.GROUP_COMMIT_ENABLED:
+            # Shares one commit with the sales arriving in the same few milliseconds
+            tx = await sale_writer.writer.submit_async(
+                sale_req.selling_location_id,
+                current_user.id,
+                items_dict,
+                sale_req.customer_id,
+                idempotency_key,
+                sale_req.reservation_id
+            )
+        else:
+            # The sale logic is shared with the sync callers; run_sync drives it over the async connection
+            tx = await db.run_sync(
+                service_logic.process_sale,
+                sale_req.selling_location_id, 
+                current_user.id, 
+                items_dict, 
+                sale_req.customer_id,
+                idempotency_key=idempotency_key,
+                reservation_id=sale_req.reservation_id
+            )
+            # Re-fetch to guarantee attachment after commit
+            await db.refresh(tx)
         
-        return schemas.TransactionResponse(
+        response = schemas.TransactionResponse(
             id=tx.id,
             total_amount=tx.total_amount,
             status=tx.status,
             created_at=tx.created_at
         )
+        if idempotency_key is not None:
+            idempotency.remember(idempotency_key, current_user.id, response)
+        return response
+    except IntegrityError as e:
+        # A concurrent retry with the same key committed first: replay its result
+        if idempotency_key is not None:
+            try:
+                replay = await db.run_sync(idempotency.lookup, idempotency_key, current_user.id)
+            except idempotency.IdempotencyConflict as conflict:
+                raise HTTPException(status_code=409, detail=str(conflict))
+            if replay:
+                return replay
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/sales/batch", response_model=schemas.SaleBatchResponse)
+async def process_sale_batch_endpoint(batch: schemas.SaleBatchRequest, current_user: Annotated[security.Principal, Depends(get_current_user)], db: AsyncSession = Depends(get_async_db)):
+    # Offline queue replay: one commit for the whole batch, one result per sale
+    sales = []
+    for sale in batch.sales:
+        data = sale.model_dump()
+        if data['idempotency_key'] is not None:
+            try:
+                idempotency.validate_key(data['idempotency_key'])
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+        sales.append(data)
+
+    try:
+        results = await db.run_sync(service_logic.process_sale_batch, current_user.id, sales)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return schemas.SaleBatchResponse(results=[
+        schemas.SaleBatchResult(
+            index=r['index'],
+            status=r['status'],
+            error=r['error'],
+            transaction=schemas.TransactionResponse(
+                id=r['transaction_id'],
+                total_amount=r['total_amount'],
+                status=r['transaction_status'],
+                created_at=r['created_at']
+            ) if r['transaction_id'] else None
+        ) for r in results
+    ])
+
+# --- Cart Reservations ---
+def get_managed_reservation(reservation_id: str, current_user: security.Principal):
+    # Only the hold's creator, staff of its store or a super admin may change it
+    reservation = reservations.ledger.get(reservation_id)
+    if not reservation:
+        raise HTTPException(status_code=404, detail="Reservation not found or expired.")
+    if not reservations.may_manage(reservation, current_user):
+        raise HTTPException(status_code=403, detail="Not authorized for this reservation.")
+    return reservation
+
+@app.post("/reservations", response_model=schemas.ReservationResponse)
+def reserve_stock(req: schemas.ReservationRequest, current_user: Annotated[security.Principal, Depends(get_current_user)], db: Session = Depends(get_db)):
+    if req.reservation_id and reservations.ledger.get(req.reservation_id):
+        get_managed_reservation(req.reservation_id, current_user)
+    items = {}
+    for item in req.items:
+        items[item.product_id] = items.get(item.product_id, 0) + item.quantity
+    try:
+        reservation = reservations.ledger.reserve(
+            db,
+            req.location_id,
+            items,
+            current_user.id,
+            ttl_seconds=req.ttl_seconds or reservations.DEFAULT_TTL_SECONDS,
+            reservation_id=req.reservation_id
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return reservation.to_dict()
+
+@app.post("/reservations/{reservation_id}/extend", response_model=schemas.ReservationResponse)
+def extend_reservation(reservation_id: str, req: schemas.ReservationExtend, current_user: Annotated[security.Principal, Depends(get_current_user)]):
+    get_managed_reservation(reservation_id, current_user)
+    try:
+        reservation = reservations.ledger.extend(reservation_id, req.ttl_seconds or reservations.DEFAULT_TTL_SECONDS)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return reservation.to_dict()
+
+@app.delete("/reservations/{reservation_id}", status_code=status.HTTP_204_NO_CONTENT)
+def release_reservation(reservation_id: str, current_user: Annotated[security.Principal, Depends(get_current_user)]):
+    get_managed_reservation(reservation_id, current_user)
+    if not reservations.ledger.release(reservation_id):
+        raise HTTPException(status_code=404, detail="Reservation not found or expired.")
+
 @app.post("/admin/stores", response_model=schemas.StoreResponse)
-def create_store(store: schemas.StoreCreate, current_user: Annotated[crud.Employee, Depends(get_current_user)], db: Session = Depends(get_db)):
+def create_store(store: schemas.StoreCreate, current_user: Annotated[security.Principal, Depends(get_current_user)], db: Session = Depends(get_db)):
     try:
         new_loc = service_admin.register_new_store(
             db, 
@@ -131,7 +359,8 @@ def create_store(store: schemas.StoreCreate, current_user: Annotated[crud.Employ
             store.address, 
             store.tax_id, 
             store.contact_info, 
-            store.store_type
+            store.store_type,
+            store.timezone
         )
         return new_loc
     except PermissionError:
@@ -140,7 +369,7 @@ def create_store(store: schemas.StoreCreate, current_user: Annotated[crud.Employ
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/admin/users")
-def create_user(user: schemas.UserCreate, current_user: Annotated[crud.Employee, Depends(get_current_user)], db: Session = Depends(get_db)):
+def create_user(user: schemas.UserCreate, current_user: Annotated[security.Principal, Depends(get_current_user)], db: Session = Depends(get_db)):
     try:
         new_user = service_admin.create_user_profile(
             db, 
@@ -156,14 +385,41 @@ def create_user(user: schemas.UserCreate, current_user: Annotated[crud.Employee,
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@app.post("/admin/hot-skus")
+def configure_hot_sku(req: schemas.HotSkuRequest, current_user: Annotated[security.Principal, Depends(get_current_user)], db: Session = Depends(get_db)):
+    if current_user.role != 'super_admin':
+        raise HTTPException(status_code=403, detail="Not Authorized")
+    try:
+        if req.shard_count > 1:
+            stock = hot_stock.enable_hot_sku(db, req.location_id, req.product_id, req.shard_count)
+        else:
+            stock = hot_stock.disable_hot_sku(db, req.location_id, req.product_id)
+        return {"location_id": stock.location_id, "product_id": stock.product_id, "shard_count": stock.shard_count}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/inventory/low-stock")
+def get_low_stock(current_user: Annotated[security.Principal, Depends(get_current_user)] = None, db: Session = Depends(get_read_db)):
+    return crud.get_low_stock_items(db, location_id=current_user.assigned_location_id or 1)
+
+@app.patch("/admin/users/{employee_id}")
+def update_user(employee_id: int, update: schemas.UserRoleUpdate, current_user: Annotated[security.Principal, Depends(get_current_user)], db: Session = Depends(get_db)):
+    try:
+        employee = service_admin.update_user_role(db, current_user.id, employee_id, update.role, update.target_store_id)
+        return {"username": employee.username, "id": employee.id, "role": employee.role, "assigned_location_id": employee.assigned_location_id}
+    except PermissionError:
+        raise HTTPException(status_code=403, detail="Not Authorized")
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/loyalty/upsell", response_model=schemas.UpsellOffer)
-def get_upsell(req: schemas.RecommendationRequest, db: Session = Depends(get_db)):
+async def get_upsell(req: schemas.RecommendationRequest, db: AsyncSession = Depends(get_async_db)):
     # No auth required for upsell check? Or maybe yes. usually POS machine is authenticated.
     # We'll skip auth for this endpoint to simulate "Kiosk Mode" or just passing through.
     
     items_dict = [item.model_dump() for item in req.cart_items]
-    offer = recommendation_engine.generate_upsell_offer(
-        db, 
+    offer = await db.run_sync(
+        recommendation_engine.generate_upsell_offer,
         req.location_id, 
         req.customer_id, 
         items_dict
@@ -178,14 +434,49 @@ def get_upsell(req: schemas.RecommendationRequest, db: Session = Depends(get_db)
         
     return offer
 
+def get_report_locations(location_id: Optional[int] = None, current_user: Annotated[security.Principal, Depends(get_current_user)] = None, db: Session = Depends(get_read_db)):
+    """
+    Location set of a report: ?location_id= when given (and allowed), otherwise the
+    caller's own store, or every store for a super admin.
+    """
+    try:
+        return authorization.analytics_location_ids(db, current_user.id, location_id)
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+
+ReportLocations = Annotated[list[int], Depends(get_report_locations)]
+
+# Analytics panels: Postgres rollups (crud) or the DuckDB Parquet snapshot (ANALYTICS_BACKEND=duckdb)
+analytics = analytics_duckdb if analytics_duckdb.ENABLED else crud
+
+def analytics_watermark(db: Session, location_ids: list[int], days: int, live: bool = False):
+    # live: the payload also carries rows read from the database (dashboard recent list)
+    if analytics_duckdb.ENABLED:
+        return analytics_duckdb.snapshot_version(), crud.get_sales_watermark(db, location_ids, days) if live else None
+    return crud.get_sales_watermark(db, location_ids, days)
+
+def not_modified(request: Request, response: Response, *watermark):
+    """
+    Conditional GET: the ETag hashes the request (path, query, location set) and a
+    watermark of the data behind it. Returns a 304 response when the client already
+    has this version, so the caller skips its query; otherwise tags `response`.
+    """
+    fingerprint = repr((request.url.path, sorted(request.query_params.items()), watermark))
+    etag = f'W/"{hashlib.sha1(fingerprint.encode()).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
+
 @app.get("/reports/daily")
-def get_daily_reports(current_user: Annotated[crud.Employee, Depends(get_current_user)], db: Session = Depends(get_db)):
-    # Simple check: Only Managers/Admins/Owners can see reports
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized to view reports")
-        
-    stats = crud.get_daily_sales_stats(db, current_user.assigned_location_id or 1) # Default to 1 for super_admin if None
-    recent = crud.get_recent_transactions(db, current_user.assigned_location_id or 1)
+def get_daily_reports(request: Request, response: Response, location_ids: ReportLocations, db: Session = Depends(get_read_db)):
+    # Managers / owners see their store, super admin every store (or ?location_id=)
+    cached = not_modified(request, response, location_ids, crud.get_sales_watermark(db, location_ids, days=7))
+    if cached:
+        return cached
+    stats = crud.get_daily_sales_stats(db, location_ids)
+    recent = crud.get_recent_transactions(db, location_ids)
     
     return {
         "stats": stats,
@@ -200,42 +491,207 @@ def get_daily_reports(current_user: Annotated[crud.Employee, Depends(get_current
     }
 
 # --- Analytics Endpoints ---
+# Days are cut at each store's own local midnight (see crud.get_location_todays).
+# Polled dashboards revalidate with If-None-Match and get 304 while no sale changed.
 @app.get("/analytics/sales-over-time")
-def analytics_sales_over_time(days: int = 7, current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    # Hardcoded Loc 1 for demo
-    return crud.get_sales_over_time(db, location_id=1, days=days)
+def analytics_sales_over_time(request: Request, response: Response, location_ids: ReportLocations, days: int = 7, db: Session = Depends(get_read_db)):
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, days))
+    if cached:
+        return cached
+    return analytics.get_sales_over_time(db, location_ids, days=days)
 
 @app.get("/analytics/top-products")
-def analytics_top_products(limit: int = 10, current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return crud.get_top_products(db, location_id=1, limit=limit)
+def analytics_top_products(request: Request, response: Response, location_ids: ReportLocations, limit: int = 10, days: int = 30, exact: bool = False, db: Session = Depends(get_read_db)):
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, days))
+    if cached:
+        return cached
+    # Short windows come from the in-memory heavy-hitter sketches (single worker); exact=true (audits) reads the rollup
+    if not exact and heavy_hitters.ENABLED and not analytics_duckdb.ENABLED and days <= heavy_hitters.HH_WINDOW_DAYS and limit <= heavy_hitters.HH_CAPACITY:
+        return heavy_hitters.top_products(db, location_ids, limit=limit, days=days)
+    return analytics.get_top_products(db, location_ids, limit=limit, days=days)
 
 @app.get("/analytics/kpis")
-def analytics_kpis(current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return crud.get_dashboard_kpis(db, location_id=1)
+def analytics_kpis(request: Request, response: Response, location_ids: ReportLocations, db: Session = Depends(get_read_db)):
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, days=1))
+    if cached:
+        return cached
+    return analytics.get_dashboard_kpis(db, location_ids)
 
 @app.get("/analytics/categories")
-def analytics_categories(current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return crud.get_sales_by_category(db, location_id=1)
+def analytics_categories(request: Request, response: Response, location_ids: ReportLocations, days: int = 30, db: Session = Depends(get_read_db)):
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, days))
+    if cached:
+        return cached
+    return analytics.get_sales_by_category(db, location_ids, days=days)
 
 @app.get("/inventory")
-def get_inventory(current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
+async def get_inventory(request: Request, response: Response, current_user: Annotated[security.Principal, Depends(get_current_user)] = None, db: AsyncSession = Depends(get_async_read_db)):
     # Inventory is visible to all authenticated employees
-    return crud.get_inventory_levels(db, location_id=1)
+    # Watermark: stock rows at the location + open-cart holds (this worker's ledger)
+    cached = not_modified(request, response, 1, await crud_async.get_stock_watermark(db, 1), reservations.ledger.version)
+    if cached:
+        return cached
+    levels = await crud_async.get_inventory_levels(db, location_id=1)
+    # Available = on-hand - held by open carts
+    reserved = reservations.ledger.reserved_for(1)
+    for level in levels:
+        level["reserved"] = reserved.get(level["id"], 0)
+        level["available"] = level["stock"] - level["reserved"]
+    return levels
+
+@app.get("/analytics/dashboard")
+def analytics_dashboard(request: Request, response: Response, location_ids: ReportLocations, days: int = 7, period_days: int = 30, limit: int = 10, db: Session = Depends(get_read_db)):
+    # All dashboard panels from one request / one session (see crud.get_dashboard)
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, max(days, period_days, 7), live=True))
+    if cached:
+        return cached
+    return analytics.get_dashboard(db, location_ids, days=days, period_days=period_days, limit=limit)
 
 @app.get("/analytics/locations")
-def analytics_locations(current_user: Annotated[crud.Employee, Depends(get_current_user)] = None, db: Session = Depends(get_db)):
-    if current_user.role not in ['branch_manager', 'super_admin', 'partner_owner']:
-        raise HTTPException(status_code=403, detail="Not authorized")
-    return crud.get_revenue_by_location(db)
+def analytics_locations(request: Request, response: Response, location_ids: ReportLocations, days: int = 30, db: Session = Depends(get_read_db)):
+    cached = not_modified(request, response, location_ids, analytics_watermark(db, location_ids, days))
+    if cached:
+        return cached
+    return analytics.get_revenue_by_location(db, location_ids, days=days)
+
+@app.get("/analytics/category-location-yoy")
+def analytics_category_location_yoy(request: Request, response: Response, location_ids: ReportLocations, days: int = 30, db: Session = Depends(get_read_db)):
+    # Heavy reports scan raw lines: served from the column store only
+    if not analytics_duckdb.ENABLED:
+        raise HTTPException(status_code=503, detail="Requires ANALYTICS_BACKEND=duckdb")
+    cached = not_modified(request, response, location_ids, analytics_duckdb.snapshot_version())
+    if cached:
+        return cached
+    return analytics_duckdb.get_category_location_yoy(db, location_ids, days=days)
+
+@app.get("/analytics/margin-by-hour")
+def analytics_margin_by_hour(request: Request, response: Response, location_ids: ReportLocations, days: int = 30, db: Session = Depends(get_read_db)):
+    if not analytics_duckdb.ENABLED:
+        raise HTTPException(status_code=503, detail="Requires ANALYTICS_BACKEND=duckdb")
+    cached = not_modified(request, response, location_ids, analytics_duckdb.snapshot_version())
+    if cached:
+        return cached
+    return analytics_duckdb.get_margin_by_hour(db, location_ids, days=days)
+
+@app.get("/analytics/margin")
+def analytics_margin(
+    request: Request,
+    response: Response,
+    location_ids: ReportLocations,
+    days: int = 30,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    granularity: str = "month",
+    limit: int = 50,
+    db: Session = Depends(get_read_db)
+):
+    # Gross margin from the rollup's cost at sale (days <= 0: all history)
+    try:
+        start, end = margin_analytics.period_range(db, location_ids, days, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    watermark = crud.get_sales_watermark_between(db, location_ids, start, end)
+    cached = not_modified(request, response, location_ids, watermark)
+    if cached:
+        return cached
+    try:
+        return margin_analytics.get_margin(db, location_ids, start, end, granularity, limit, watermark=watermark)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# --- Live Dashboard Stream ---
+SSE_KEEPALIVE_SECONDS = 15
+
+async def get_stream_user(token: str, db: AsyncSession = Depends(get_async_db)):
+    # EventSource cannot send headers: the token comes as a query parameter
+    try:
+        return await get_current_user(token, db)
+    finally:
+        await db.close() # The stream outlives the request: release the connection now
+
+def get_stream_locations(location_id: Optional[int] = None, current_user: Annotated[security.Principal, Depends(get_stream_user)] = None, db: Session = Depends(get_read_db)):
+    try:
+        location_ids = get_report_locations(location_id, current_user, db)
+        return location_ids, crud.get_location_timezones(db, location_ids)
+    finally:
+        db.close()
+
+@app.get("/analytics/stream")
+async def analytics_stream(request: Request, scope: Annotated[tuple, Depends(get_stream_locations)]):
+    """
+    Server-Sent Events for the dashboard of the caller's locations:
+    kpi (today's revenue / tx_count deltas), low_stock, and resync (reload the
+    dashboard: day rollover or a slow client). No database access while idle.
+    """
+    location_ids, zones = scope
+    subscription = events.broker.subscribe([events.location_topic(i) for i in location_ids])
+
+    def local_todays():
+        # Each store's own local day
+        return {location_id: crud.local_today(zone).isoformat() for location_id, zone in zones.items()}
+
+    async def stream():
+        todays = local_todays()
+        try:
+            yield "retry: 5000\n\n"
+            while not await request.is_disconnected():
+                event = await subscription.get(SSE_KEEPALIVE_SECONDS)
+                if local_todays() != todays:
+                    todays = local_todays()
+                    event = {"type": "resync"}
+                if event is None:
+                    yield ": keepalive\n\n"
+                    continue
+                if event["type"] == "kpi" and event["day"] != todays.get(event["location_id"]):
+                    continue # Late change to a past day: only the charts show it
+                yield events.format_sse(event)
+        finally:
+            events.broker.unsubscribe(subscription)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+# --- Exports ---
+@app.get("/exports/transactions")
+def export_transactions(location_ids: ReportLocations, date_from: date, date_to: date, format: str = "csv", db: Session = Depends(get_read_db)):
+    # Transaction lines for local days date_from..date_to, streamed from a server-side cursor
+    if format not in exports.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}' (use csv or ndjson)")
+    try:
+        start, end = exports.export_range(db, location_ids, date_from, date_to)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = f"transactions_{date_from}_{date_to}.{format}"
+    return StreamingResponse(
+        exports.stream_export(format, location_ids, start, end),
+        media_type=exports.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/exports/parquet")
+def export_parquet(current_user: Annotated[security.Principal, Depends(get_current_user)], date_from: Optional[date] = None, date_to: Optional[date] = None, location_id: Optional[int] = None, db: Session = Depends(get_read_db)):
+    # Without dates: append new sales to the incremental dataset; with dates: one-off range export
+    if current_user.role != 'super_admin':
+        raise HTTPException(status_code=403, detail="Not Authorized")
+    if date_from is None and date_to is None:
+        result = parquet_export.export_incremental()
+        return {"rows": result["rows"], "files": len(result["files"]), "directory": parquet_export.SALES_FACTS_DIR, "exported_xid": result["until"]}
+    if date_from is None or date_to is None:
+        raise HTTPException(status_code=400, detail="Give both date_from and date_to")
+    location_ids = [location_id] if location_id else None
+    tz = crud.get_reporting_timezone(db, location_ids) if location_ids else crud.STORE_TIMEZONE
+    try:
+        result = parquet_export.export_date_range(date_from, date_to, location_ids, tz)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"rows": result["rows"], "files": len(result["files"]), "directory": parquet_export.range_dir(date_from, date_to)}
 
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics/pool")
+def pool_metrics(current_user: Annotated[security.Principal, Depends(get_current_user)]):
+    # Pool sizing data: checkout wait, in-use connections, overflow and timeouts per engine
+    if current_user.role != 'super_admin':
+        raise HTTPException(status_code=403, detail="Not Authorized")
+    return pool_status()
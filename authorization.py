@@ -0,0 +1,183 @@
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+import logging
+import os
+
+from cache import TTLCache
+from models import Employee, Location
+import security
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Central RBAC decisions.
+# - Facts (an employee's role/store, a location's type) are kept in a process-wide
+#   LRU and evicted as soon as a session commits a write to that employee/location.
+# - Decisions (employee, location, action) are memoized on the Session, i.e. once
+#   per request: a multi-line void checks the supervisor a single time.
+FACTS_CACHE_SIZE = int(os.getenv("AUTHZ_FACTS_CACHE_SIZE", "4096"))
+FACTS_CACHE_TTL = float(os.getenv("AUTHZ_FACTS_CACHE_TTL", "300"))
+
+employee_facts = TTLCache(maxsize=FACTS_CACHE_SIZE, ttl=FACTS_CACHE_TTL)
+location_facts = TTLCache(maxsize=FACTS_CACHE_SIZE, ttl=FACTS_CACHE_TTL)
+
+# --- Actions ---
+MANAGER_OVERRIDE = 'manager_override'
+REGISTER_STORE = 'register_store'
+DELETE_PRODUCT = 'delete_product'
+CHANGE_ROLE = 'change_role'
+VIEW_ANALYTICS = 'view_analytics'
+
+_SUPER_ADMIN_ONLY = {
+    REGISTER_STORE: "Only Super Admin can register new stores.",
+    DELETE_PRODUCT: "Only Super Admin can delete products.",
+    CHANGE_ROLE: "Only Super Admin can change user roles.",
+}
+
+class EmployeeFacts:
+    def __init__(self, id: int, username: str, role: str, assigned_location_id: int = None):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.assigned_location_id = assigned_location_id
+
+class LocationFacts:
+    def __init__(self, id: int, name: str, location_type: str, timezone: str = None):
+        self.id = id
+        self.name = name
+        self.location_type = location_type
+        self.timezone = timezone
+
+def get_employee_facts(db: Session, employee_id: int):
+    facts = employee_facts.get(employee_id)
+    if facts is None:
+        row = db.query(Employee.id, Employee.username, Employee.role, Employee.assigned_location_id).filter(
+            Employee.id == employee_id
+        ).first()
+        if not row:
+            return None
+        facts = EmployeeFacts(row.id, row.username, row.role, row.assigned_location_id)
+        employee_facts.set(employee_id, facts)
+    return facts
+
+def get_location_facts(db: Session, location_id: int):
+    facts = location_facts.get(location_id)
+    if facts is None:
+        row = db.query(Location.id, Location.name, Location.location_type, Location.timezone).filter(
+            Location.id == location_id
+        ).first()
+        if not row:
+            return None
+        facts = LocationFacts(row.id, row.name, row.location_type, row.timezone)
+        location_facts.set(location_id, facts)
+    return facts
+
+def _decide(db: Session, employee_id: int, action: str, location_id: int = None):
+    """
+    Returns None if allowed, or the denial message.
+    """
+    employee = get_employee_facts(db, employee_id)
+
+    if action == MANAGER_OVERRIDE:
+        # 1. 'super_admin' -> Access ALL.
+        # 2. 'branch_manager' / 'partner_owner' -> Access ONLY their assigned_location_id.
+        if not employee:
+            return "Supervisor not found."
+        if employee.role == 'super_admin':
+            return None
+        if employee.role in ['branch_manager', 'partner_owner']:
+            if location_id and employee.assigned_location_id != location_id:
+                return "Supervisor does not have authority over this location."
+            return None
+        return f"User role '{employee.role}' is not authorized for Manager Override."
+
+    if action == VIEW_ANALYTICS:
+        # Super admin: any location. Managers / partner owners: their own store only.
+        if not employee:
+            return "Employee not found."
+        if employee.role == 'super_admin':
+            return None
+        if employee.role in ['branch_manager', 'partner_owner'] and employee.assigned_location_id:
+            if location_id and employee.assigned_location_id != location_id:
+                return "Not authorized to view analytics for this location."
+            return None
+        return "Not authorized to view analytics."
+
+    if action in _SUPER_ADMIN_ONLY:
+        if not employee or employee.role != 'super_admin':
+            return _SUPER_ADMIN_ONLY[action]
+        return None
+
+    return f"Unknown action '{action}'."
+
+def authorize(db: Session, employee_id: int, action: str, location_id: int = None):
+    """
+    Returns True if `employee_id` may perform `action` (at `location_id`),
+    raises PermissionError otherwise. Memoized for the lifetime of `db`.
+    """
+    decisions = db.info.setdefault('authz_decisions', {})
+    key = (employee_id, location_id, action)
+    if key not in decisions:
+        decisions[key] = _decide(db, employee_id, action, location_id)
+    denial = decisions[key]
+    if denial:
+        raise PermissionError(denial)
+    return True
+
+def analytics_location_ids(db: Session, employee_id: int, location_id: int = None) -> list[int]:
+    """
+    The location set a report of `employee_id` covers: the requested location, else
+    every selling location for a super admin and the own store for everyone else.
+    Raises PermissionError if the employee may not see it.
+    """
+    authorize(db, employee_id, VIEW_ANALYTICS, location_id)
+    if location_id is not None:
+        return [location_id]
+    employee = get_employee_facts(db, employee_id)
+    if employee.role == 'super_admin':
+        return [row.id for row in db.query(Location.id).filter(Location.location_type.in_(['store', 'partner']))]
+    return [employee.assigned_location_id]
+
+def invalidate_employee(employee_id: int):
+    employee_facts.invalidate(employee_id)
+    security.invalidate_principal(employee_id)
+
+def invalidate_location(location_id: int):
+    location_facts.invalidate(location_id)
+
+# --- Invalidation on write ---
+# Track Employee/Location rows flushed by a session; evict them once it commits.
+# Employee updates that leave the cached fields alone (a password rehash) keep
+# the cache.
+_EMPLOYEE_FACT_FIELDS = ('username', 'role', 'assigned_location_id')
+
+def _changes_employee_facts(employee):
+    state = inspect(employee)
+    return any(state.attrs[name].history.has_changes() for name in _EMPLOYEE_FACT_FIELDS)
+
+@event.listens_for(Session, "after_flush")
+def _collect_written(session, flush_context):
+    written = session.info.setdefault('authz_written', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (Employee, Location)) and obj.id is not None:
+            if isinstance(obj, Employee) and obj in session.dirty and not _changes_employee_facts(obj):
+                continue
+            written.add((type(obj), obj.id))
+
+@event.listens_for(Session, "after_commit")
+def _evict_written(session):
+    written = session.info.pop('authz_written', None)
+    if not written:
+        return
+    session.info.pop('authz_decisions', None)
+    for model, obj_id in written:
+        if model is Employee:
+            invalidate_employee(obj_id)
+        else:
+            invalidate_location(obj_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_written(session):
+    session.info.pop('authz_written', None)
+    session.info.pop('authz_decisions', None)
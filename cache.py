@@ -0,0 +1,48 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    Used for in-process caches shared by the request threads of one worker.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict() # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -1,5 +1,6 @@
 from database import SessionLocal
 import crud
+import security
 from models import Location
 
 def create_super_admin():
@@ -13,17 +14,17 @@ def create_super_admin():
         
         # 2. Create Super Admin
         username = "super_admin_user"
-        password = "secure_password_123" # In production, hash this!
+        password = "secure_password_123"
         
         existing_user = crud.get_employee_by_username(db, username)
         if existing_user:
             print(f"User '{username}' already exists.")
             # Update password for safety/ensuring knowledge
-            existing_user.password_hash = password
+            existing_user.password_hash = security.hash_password(password)
             db.commit()
             print(f"Password updated for '{username}'.")
         else:
-            crud.create_employee(db, username, "super_admin", password, hq.id)
+            crud.create_employee(db, username, "super_admin", security.hash_password(password), hq.id)
             print(f"User '{username}' created.")
 
         print("\n--- Credentials ---")
@@ -1,7 +1,11 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func, desc, text
-from models import Product, Category, Location, StockLevel, Customer, Transaction, TransactionDetail, Employee, StockTransfer
-from datetime import datetime, timedelta, date
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import func, desc, text, insert, update, select, tuple_, and_, or_, false
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from models import Product, Category, Location, StockLevel, Customer, Transaction, TransactionDetail, Employee, StockTransfer, SaleIdempotencyKey, StockShard, StockReservation, DailySalesRollup, DailyLocationRollup
+from datetime import datetime, timedelta, date, time, timezone
+from zoneinfo import ZoneInfo
+from decimal import Decimal
+import os
 
 # --- Categories ---
 def create_category(db: Session, name: str):
@@ -35,9 +39,20 @@ def get_product(db: Session, product_id: int):
 def get_product_by_barcode(db: Session, barcode: str):
     return db.query(Product).filter(Product.barcode == barcode).first()
 
+def get_products_by_ids(db: Session, product_ids):
+    """
+    Loads every requested product in a single query.
+    Returns a dict keyed by product id (missing ids are simply absent).
+    """
+    ids = set(product_ids)
+    if not ids:
+        return {}
+    products = db.query(Product).filter(Product.id.in_(ids)).all()
+    return {p.id: p for p in products}
+
 # --- Locations ---
-def create_location(db: Session, name: str, location_type: str, address: str = None, tax_id: str = None, contact_info: str = None):
-    db_location = Location(name=name, location_type=location_type, address=address, tax_id=tax_id, contact_info=contact_info)
+def create_location(db: Session, name: str, location_type: str, address: str = None, tax_id: str = None, contact_info: str = None, timezone: str = None):
+    db_location = Location(name=name, location_type=location_type, address=address, tax_id=tax_id, contact_info=contact_info, timezone=timezone)
     db.add(db_location)
     db.commit()
     db.refresh(db_location)
@@ -62,6 +77,24 @@ def create_employee(db: Session, username: str, role: str, password_hash: str, l
 def get_employee_by_username(db: Session, username: str):
     return db.query(Employee).filter(Employee.username == username).first()
 
+def update_employee_password(db: Session, employee_id: int, password_hash: str):
+    employee = db.query(Employee).filter(Employee.id == employee_id).first()
+    if employee:
+        employee.password_hash = password_hash
+        db.commit()
+    return employee
+
+def update_employee(db: Session, employee_id: int, role: str = None, location_id: int = None):
+    employee = db.query(Employee).filter(Employee.id == employee_id).first()
+    if employee:
+        if role is not None:
+            employee.role = role
+        if location_id is not None:
+            employee.assigned_location_id = location_id
+        db.commit()
+        db.refresh(employee)
+    return employee
+
 # --- Customers ---
 def create_customer(db: Session, name: str, email: str = None, phone: str = None):
     db_customer = Customer(name=name, email=email, phone=phone)
@@ -70,6 +103,12 @@ def create_customer(db: Session, name: str, email: str = None, phone: str = None
     db.refresh(db_customer)
     return db_customer
 
+def get_customers_by_ids(db: Session, customer_ids):
+    ids = set(customer_ids)
+    if not ids:
+        return {}
+    return {c.id: c for c in db.query(Customer).filter(Customer.id.in_(ids)).all()}
+
 def update_customer_metrics(db: Session, customer_id: int, purchase_amount: float, purchase_date: datetime):
     customer = db.query(Customer).filter(Customer.id == customer_id).first()
     if customer:
@@ -87,13 +126,64 @@ def get_stock_level(db: Session, location_id: int, product_id: int):
         StockLevel.product_id == product_id
     ).first()
 
-def update_stock(db: Session, location_id: int, product_id: int, quantity_change: int, commit: bool = True):
+def get_stock_levels_for_products(db: Session, location_id: int, product_ids):
+    """
+    Loads the StockLevel rows of a location for a set of products in a single query.
+    Returns a dict keyed by product id (products without a row are absent).
+    """
+    ids = set(product_ids)
+    if not ids:
+        return {}
+    rows = db.query(StockLevel).filter(
+        StockLevel.location_id == location_id,
+        StockLevel.product_id.in_(ids)
+    ).all()
+    return {row.product_id: row for row in rows}
+
+def get_stock_levels_for_pairs(db: Session, pairs, for_update: bool = False):
+    """
+    Loads the StockLevel rows for a set of (location_id, product_id) pairs in a single query.
+    for_update=True locks the rows until the surrounding transaction ends.
+    Returns a dict keyed by (location_id, product_id).
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    query = db.query(StockLevel).filter(
+        tuple_(StockLevel.location_id, StockLevel.product_id).in_(pairs)
+    )
+    if for_update:
+        query = query.with_for_update()
+    return {(row.location_id, row.product_id): row for row in query.all()}
+
+def update_stock(db: Session, location_id: int, product_id: int, quantity_change: int, commit: bool = True, atomic: bool = False):
     """
     Updates stock level. quantity_change can be positive (add) or negative (subtract).
     Creates StockLevel record if it doesn't exist.
+
+    atomic=True skips the read-modify-write and lets the database apply the change
+    in a single statement (see update_stock_atomic). In that mode the new stock
+    level (int) is returned instead of the StockLevel row.
     """
+    if atomic:
+        new_stock = update_stock_atomic(db, location_id, product_id, quantity_change)
+        if commit:
+            db.commit()
+        return new_stock
+
     stock = get_stock_level(db, location_id, product_id)
 
+    if stock and stock.shard_count > 1:
+        # Hot SKU: move stock through the shards, leaving the contended row alone
+        if quantity_change < 0:
+            claim_stock_sharded(db, location_id, product_id, -quantity_change)
+        elif quantity_change > 0:
+            release_stock_sharded(db, location_id, product_id, quantity_change)
+        if commit:
+            db.commit()
+            db.refresh(stock)
+        return stock
+
     if not stock:
         # Create new record if creating stock checks normally implies existence, 
         # but here we allow auto-creation for initialization
@@ -114,6 +204,253 @@ def update_stock(db: Session, location_id: int, product_id: int, quantity_change
         db.refresh(stock)
     return stock
 
+def update_stock_atomic(db: Session, location_id: int, product_id: int, quantity_change: int):
+    """
+    Applies a stock change with one statement and no prior SELECT:
+    - Decrements: UPDATE ... SET current_stock = current_stock - q WHERE current_stock >= q RETURNING current_stock.
+      No row back means the product is missing or short, and a ValueError is raised.
+    - Increments: INSERT ... ON CONFLICT (location_id, product_id) DO UPDATE (auto-creates the row).
+    Does NOT commit. Returns the new stock level.
+    """
+    if quantity_change < 0:
+        new_stock = db.execute(
+            update(StockLevel)
+            .where(
+                StockLevel.location_id == location_id,
+                StockLevel.product_id == product_id,
+                StockLevel.current_stock >= -quantity_change
+            )
+            .values(current_stock=StockLevel.current_stock + quantity_change, updated_at=func.now())
+            .returning(StockLevel.current_stock)
+            .execution_options(synchronize_session=False)
+        ).scalar_one_or_none()
+
+        if new_stock is None:
+            # Short on the row itself: a hot SKU keeps its stock in shards (raises if truly short)
+            claim_stock_sharded(db, location_id, product_id, -quantity_change)
+            new_stock = get_on_hand(db, location_id, product_id)
+    else:
+        stmt = pg_insert(StockLevel).values(
+            location_id=location_id,
+            product_id=product_id,
+            current_stock=quantity_change
+        )
+        stmt = stmt.on_conflict_do_update(
+            constraint='uq_location_product',
+            set_={
+                'current_stock': StockLevel.current_stock + stmt.excluded.current_stock,
+                'updated_at': func.now()
+            }
+        ).returning(StockLevel.current_stock)
+        new_stock = db.execute(stmt).scalar_one()
+
+    _expire_stock_rows(db, location_id, [product_id])
+    return new_stock
+
+def decrement_stock_bulk(db: Session, location_id: int, quantities: dict, raise_on_short: bool = True, with_reorder_points: bool = False):
+    """
+    Decrements several products at one location with a single conditional UPDATE.
+    quantities: {product_id: quantity_to_remove}
+
+    Rows that would go negative (or don't exist) are left untouched and reported
+    through a ValueError. The other rows ARE updated, so the caller must roll back
+    the surrounding transaction on error. Does NOT commit.
+    Returns {product_id: new_stock}, or ({product_id: new_stock}, [short product ids])
+    when raise_on_short=False. with_reorder_points=True makes the values
+    (new_stock, reorder_point) tuples.
+    """
+    if not quantities:
+        return {}
+
+    product_ids = list(quantities.keys())
+    rows = db.execute(text("""
+        UPDATE stock_levels AS s
+        SET current_stock = s.current_stock - v.qty,
+            updated_at = now()
+        FROM (
+            SELECT unnest(CAST(:product_ids AS integer[])) AS product_id,
+                   unnest(CAST(:quantities AS integer[])) AS qty
+        ) AS v
+        WHERE s.location_id = :location_id
+          AND s.product_id = v.product_id
+          AND s.current_stock >= v.qty
+        RETURNING s.product_id, s.current_stock, s.reorder_point
+    """), {
+        "location_id": location_id,
+        "product_ids": product_ids,
+        "quantities": [quantities[pid] for pid in product_ids]
+    }).all()
+
+    _expire_stock_rows(db, location_id, product_ids)
+
+    new_levels = {
+        row.product_id: (row.current_stock, row.reorder_point) if with_reorder_points else row.current_stock
+        for row in rows
+    }
+    short = [pid for pid in product_ids if pid not in new_levels]
+    if not raise_on_short:
+        return new_levels, short
+    if short:
+        raise ValueError(f"Insufficient stock for product(s) {short} at location {location_id}.")
+    return new_levels
+
+def _expire_stock_rows(db: Session, location_id: int, product_ids):
+    """
+    Expires StockLevel objects held by the session after a statement-level update,
+    so the next access re-reads current_stock instead of a stale value.
+    """
+    product_ids = set(product_ids)
+    for obj in list(db.identity_map.values()):
+        if not isinstance(obj, StockLevel):
+            continue
+        # Read from __dict__ so expired objects don't trigger a load here
+        if obj.__dict__.get('location_id') == location_id and obj.__dict__.get('product_id') in product_ids:
+            db.expire(obj, ['current_stock', 'updated_at'])
+
+# --- Stock (Hot SKU shards) ---
+def stock_on_hand_expr():
+    """
+    SQL expression for the on-hand quantity of a StockLevel row: its own
+    current_stock plus whatever its hot-SKU shards hold.
+    """
+    shard_total = select(
+        func.coalesce(func.sum(StockShard.quantity), 0)
+    ).where(
+        StockShard.location_id == StockLevel.location_id,
+        StockShard.product_id == StockLevel.product_id
+    ).correlate(StockLevel).scalar_subquery()
+    return StockLevel.current_stock + shard_total
+
+def get_on_hand(db: Session, location_id: int, product_id: int):
+    return db.query(stock_on_hand_expr()).filter(
+        StockLevel.location_id == location_id,
+        StockLevel.product_id == product_id
+    ).scalar() or 0
+
+def get_on_hand_for_products(db: Session, location_id: int, product_ids):
+    """
+    On-hand quantity (shards included) of several products at one location, in one query.
+    Returns {product_id: on_hand}; products without a stock row are absent.
+    """
+    ids = set(product_ids)
+    if not ids:
+        return {}
+    rows = db.query(
+        StockLevel.product_id,
+        stock_on_hand_expr().label('on_hand')
+    ).filter(
+        StockLevel.location_id == location_id,
+        StockLevel.product_id.in_(ids)
+    ).all()
+    return {r.product_id: r.on_hand for r in rows}
+
+def get_shard_totals(db: Session, pairs):
+    """
+    Sums shard quantities for a set of (location_id, product_id) pairs in one query.
+    Returns a dict keyed by the pair.
+    """
+    pairs = set(pairs)
+    if not pairs:
+        return {}
+    rows = db.query(
+        StockShard.location_id,
+        StockShard.product_id,
+        func.sum(StockShard.quantity).label('total')
+    ).filter(
+        tuple_(StockShard.location_id, StockShard.product_id).in_(pairs)
+    ).group_by(StockShard.location_id, StockShard.product_id).all()
+    return {(r.location_id, r.product_id): int(r.total) for r in rows}
+
+def claim_stock_sharded(db: Session, location_id: int, product_id: int, quantity: int):
+    """
+    Takes `quantity` from a hot SKU without touching the stock_levels row in the common case:
+    1. Fast path: one random shard that can cover it, skipping shards other sales hold locked.
+    2. Slow path: lock the row and all shards, and drain them in order (row first).
+    Raises ValueError if the summed stock is short. Does NOT commit.
+    """
+    shard_id = db.execute(text("""
+        UPDATE stock_shards
+        SET quantity = quantity - :quantity
+        WHERE id = (
+            SELECT id FROM stock_shards
+            WHERE location_id = :location_id
+              AND product_id = :product_id
+              AND quantity >= :quantity
+            ORDER BY random()
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    """), {"location_id": location_id, "product_id": product_id, "quantity": quantity}).scalar_one_or_none()
+    if shard_id is not None:
+        return
+
+    base = db.query(StockLevel).filter(
+        StockLevel.location_id == location_id,
+        StockLevel.product_id == product_id
+    ).with_for_update().populate_existing().first()
+    shards = db.query(StockShard).filter(
+        StockShard.location_id == location_id,
+        StockShard.product_id == product_id
+    ).order_by(StockShard.quantity.desc()).with_for_update().populate_existing().all()
+
+    total = (base.current_stock if base else 0) + sum(shard.quantity for shard in shards)
+    if total < quantity:
+        raise ValueError(f"Insufficient stock for product {product_id} at location {location_id}. Current: {total}, Requested Change: {-quantity}")
+
+    remaining = quantity
+    for holder in ([base] if base else []) + shards:
+        field = 'current_stock' if holder is base else 'quantity'
+        take = min(getattr(holder, field), remaining)
+        setattr(holder, field, getattr(holder, field) - take)
+        remaining -= take
+        if remaining == 0:
+            break
+    db.flush()
+
+def release_stock_sharded(db: Session, location_id: int, product_id: int, quantity: int):
+    """
+    Returns stock (voids, cancellations, receipts) to a random unlocked shard.
+    Falls back to the stock_levels row when every shard is busy. Does NOT commit.
+    """
+    shard_id = db.execute(text("""
+        UPDATE stock_shards
+        SET quantity = quantity + :quantity
+        WHERE id = (
+            SELECT id FROM stock_shards
+            WHERE location_id = :location_id
+              AND product_id = :product_id
+            ORDER BY random()
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id
+    """), {"location_id": location_id, "product_id": product_id, "quantity": quantity}).scalar_one_or_none()
+    if shard_id is None:
+        update_stock_atomic(db, location_id, product_id, quantity)
+
+def get_low_stock_items(db: Session, location_id: int):
+    """
+    Reorder check: products whose on-hand quantity (shards included) is at or below their reorder point.
+    """
+    on_hand = stock_on_hand_expr()
+    results = db.query(
+        StockLevel.product_id,
+        Product.name,
+        on_hand.label('stock'),
+        StockLevel.reorder_point
+    ).join(
+        Product, Product.id == StockLevel.product_id
+    ).filter(
+        StockLevel.location_id == location_id,
+        on_hand <= StockLevel.reorder_point
+    ).all()
+
+    return [
+        {"id": r.product_id, "name": r.name, "stock": r.stock, "reorder_point": r.reorder_point}
+        for r in results
+    ]
+
 # --- Transactions (Complex) ---
 def create_transaction_with_details(
     db: Session, 
@@ -121,12 +458,17 @@ def create_transaction_with_details(
     employee_id: int,
     items: list[dict], # [{'product_id': 1, 'quantity': 2, 'unit_price': 10.0}]
     customer_id: int = None,
-    commit: bool = True
+    commit: bool = True,
+    products: dict = None
 ):
     """
     Creates a transaction and its details atomically.
     Does NOT decrement stock (business logic usually separates this or wraps it).
     For this CRUD, we just save the record.
+
+    `products` is an optional {product_id: Product} map already loaded by the caller;
+    when omitted the cart's products are fetched in one query.
+    Details are written with a single multi-row INSERT.
     """
     total_amount = sum(item['quantity'] * item['unit_price'] for item in items)
     
@@ -141,25 +483,107 @@ def create_transaction_with_details(
     db.flush() # Flush to get transaction.id
 
     # 2. Create Details
+    if products is None:
+        products = get_products_by_ids(db, [item['product_id'] for item in items])
+
+    detail_rows = []
     for item in items:
         # Get product cost for margin analysis (simplified: current cost)
-        product = get_product(db, item['product_id'])
+        product = products.get(item['product_id'])
+        if not product:
+            raise ValueError(f"Product {item['product_id']} not found")
         current_cost = product.cost_price if product.cost_price else 0
         
-        detail = TransactionDetail(
-            transaction_id=transaction.id,
-            product_id=item['product_id'],
-            quantity=item['quantity'],
-            unit_price=item['unit_price'],
-            unit_cost_at_sale=current_cost
-        )
-        db.add(detail)
+        detail_rows.append({
+            'transaction_id': transaction.id,
+            'product_id': item['product_id'],
+            'quantity': item['quantity'],
+            'unit_price': item['unit_price'],
+            'unit_cost_at_sale': current_cost,
+            'transaction_created_at': transaction.created_at
+        })
+
+    if detail_rows:
+        db.execute(insert(TransactionDetail), detail_rows)
     
     if commit:
         db.commit()
         db.refresh(transaction)
     return transaction
 
+def create_idempotency_key(db: Session, key: str, transaction_id: int, employee_id: int):
+    """
+    Records the idempotency key of a sale. Does NOT commit: it must land in the
+    same DB transaction as the sale so a key never exists without its sale.
+    """
+    record = SaleIdempotencyKey(key=key, transaction_id=transaction_id, employee_id=employee_id)
+    db.add(record)
+    return record
+
+def get_idempotency_key(db: Session, key: str):
+    return db.query(SaleIdempotencyKey).filter(SaleIdempotencyKey.key == key).first()
+
+def create_transactions_bulk(db: Session, transactions: list[dict], details: list[list[dict]]):
+    """
+    Writes many transactions with multi-row INSERTs (one for headers, one for details).
+    transactions: header rows (selling_location_id, employee_id, customer_id, total_amount, status, created_at)
+    details: per transaction, its detail rows (product_id, quantity, unit_price, unit_cost_at_sale)
+    Does NOT commit. Returns [(id, created_at)] in the order of `transactions`.
+    """
+    if not transactions:
+        return []
+
+    headers = db.execute(
+        insert(Transaction).returning(Transaction.id, Transaction.created_at, sort_by_parameter_order=True),
+        transactions
+    ).all()
+
+    detail_rows = []
+    for header, rows in zip(headers, details):
+        for row in rows:
+            detail_rows.append({**row, 'transaction_id': header.id, 'transaction_created_at': header.created_at})
+    if detail_rows:
+        db.execute(insert(TransactionDetail), detail_rows)
+
+    return [(header.id, header.created_at) for header in headers]
+
+def get_idempotency_keys(db: Session, keys):
+    keys = set(keys)
+    if not keys:
+        return {}
+    records = db.query(SaleIdempotencyKey).options(
+        joinedload(SaleIdempotencyKey.transaction)
+    ).filter(SaleIdempotencyKey.key.in_(keys)).all()
+    return {r.key: r for r in records}
+
+def create_idempotency_keys_bulk(db: Session, rows: list[dict]):
+    """
+    Multi-row variant of create_idempotency_key. Does NOT commit.
+    rows: [{'key': ..., 'transaction_id': ..., 'employee_id': ...}]
+    """
+    if rows:
+        db.execute(insert(SaleIdempotencyKey), rows)
+
+# --- Stock Reservations (ledger snapshots) ---
+def save_stock_reservations(db: Session, reservation_ids, rows: list[dict], now: datetime):
+    """
+    Writes one worker's ledger changes: the rows of `reservation_ids` become `rows`
+    (none for released holds), and expired rows of any worker are dropped. Holds
+    of other workers are left alone. Does NOT commit.
+    """
+    db.query(StockReservation).filter(
+        or_(StockReservation.reservation_id.in_(list(reservation_ids)), StockReservation.expires_at <= now)
+    ).delete(synchronize_session=False)
+    if rows:
+        stmt = pg_insert(StockReservation).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=['reservation_id', 'product_id'],
+            set_={c: stmt.excluded[c] for c in ('location_id', 'employee_id', 'quantity', 'expires_at')}
+        ))
+
+def get_active_stock_reservations(db: Session, now: datetime):
+    return db.query(StockReservation).filter(StockReservation.expires_at > now).all()
+
 def create_stock_transfer(
     db: Session, 
     product_id: int, 
@@ -226,19 +650,139 @@ def get_employee(db: Session, employee_id: int):
     return db.query(Employee).filter(Employee.id == employee_id).first()
 
 # --- Reporting ---
-def get_daily_sales_stats(db: Session, location_id: int):
+# Date filters are plain half-open ranges on created_at (never func.date(created_at)):
+# they use ix_transactions_location_status_created and let the planner prune
+# partitions when the tables are partitioned (partitioning.py).
+# "Today" / "last N days" are days in the store's local timezone (Location.timezone,
+# default STORE_TIMEZONE), converted to UTC bounds before they reach the query.
+STORE_TIMEZONE = os.getenv("STORE_TIMEZONE", "UTC")
+
+def details_join():
     """
-    Returns total revenue and transaction count for today.
-    Simplicity: Ignores timezone (uses server/db local time logic for 'today').
+    transactions -> transaction_details join condition. Includes the copied date
+    so each month's headers only meet the same month's lines.
+    """
+    return and_(
+        TransactionDetail.transaction_id == Transaction.id,
+        TransactionDetail.transaction_created_at == Transaction.created_at
+    )
+
+def created_between(start: datetime, end: datetime, details: bool = False):
     """
-    today = datetime.now().date()
+    [start, end) on transactions.created_at, repeated on the details copy when the
+    query reads transaction_details (the planner does not carry ranges across joins).
+    """
+    conditions = [Transaction.created_at >= start, Transaction.created_at < end]
+    if details:
+        conditions += [TransactionDetail.transaction_created_at >= start, TransactionDetail.transaction_created_at < end]
+    return and_(*conditions)
+
+def get_reporting_timezone(db: Session, location_ids) -> str:
+    """
+    Timezone the days of a report are cut in: the stores' own timezone when they
+    share one, otherwise STORE_TIMEZONE.
+    """
+    zones = {tz or STORE_TIMEZONE for (tz,) in db.query(Location.timezone).filter(Location.id.in_(location_ids))}
+    return zones.pop() if len(zones) == 1 else STORE_TIMEZONE
+
+def local_day_range(tz: str, days: int = 1, today: date = None):
+    """
+    UTC bounds [start, end) of the last `days` local days, today included.
+    Each bound is a local midnight, so DST days are 23 or 25 hours long.
+    """
+    zone = ZoneInfo(tz)
+    today = today or datetime.now(zone).date()
+    start = datetime.combine(today - timedelta(days=days - 1), time.min, tzinfo=zone)
+    end = datetime.combine(today + timedelta(days=1), time.min, tzinfo=zone)
+    return start.astimezone(timezone.utc), end.astimezone(timezone.utc)
+
+def _completed_sales(location_ids):
+    # Leading columns of ix_transactions_location_status_created
+    return and_(Transaction.selling_location_id.in_(location_ids), Transaction.status == 'completed')
+
+def local_today(tz: str) -> date:
+    return datetime.now(ZoneInfo(tz)).date()
+
+def get_location_timezones(db: Session, location_ids) -> dict:
+    return {
+        location_id: zone or STORE_TIMEZONE
+        for location_id, zone in db.query(Location.id, Location.timezone).filter(Location.id.in_(location_ids))
+    }
+
+def get_location_todays(db: Session, location_ids, tz: str = None) -> dict:
+    """
+    Current local day of each location, grouped: {day: [location_id, ...]}.
+    Stores in different timezones can be on different days; tz forces one
+    timezone for all of them.
+    """
+    zones = dict.fromkeys(location_ids, tz) if tz else get_location_timezones(db, location_ids)
+    todays = {}
+    for location_id, zone in zones.items():
+        todays.setdefault(local_today(zone), []).append(location_id)
+    return todays
+
+# --- Rollups ---
+# Dashboards read daily_sales_rollup / daily_location_rollup (kept current by rollup.py):
+# cost is O(days x products), independent of the number of line items.
+
+def _increment_rollup(model, key_columns, rows):
+    if not rows:
+        return
+    # Sorted so concurrent sales lock shared rows in the same order (no deadlocks)
+    rows = sorted(rows, key=lambda r: tuple(r[c] for c in key_columns))
+    stmt = pg_insert(model).values(rows)
+    table = model.__table__
+    increments = {c: table.c[c] + stmt.excluded[c] for c in ('qty', 'revenue', 'cost', 'tx_count')}
+    if 'last_transaction_id' in table.c:
+        increments['last_transaction_id'] = func.greatest(table.c.last_transaction_id, stmt.excluded.last_transaction_id)
+    return stmt.on_conflict_do_update(index_elements=key_columns, set_=increments)
+
+def increment_sales_rollup(db: Session, rows: list[dict]):
+    """
+    Adds deltas to daily_sales_rollup. rows: location_id, day, product_id, bucket,
+    qty, revenue, cost, tx_count (one row per key). Does NOT commit.
+    """
+    stmt = _increment_rollup(DailySalesRollup, ['location_id', 'day', 'product_id', 'bucket'], rows)
+    if stmt is not None:
+        db.execute(stmt)
+
+def increment_location_rollup(db: Session, rows: list[dict]):
+    """
+    Adds deltas to daily_location_rollup. rows: location_id, day, bucket, qty,
+    revenue, cost, tx_count, last_transaction_id (one row per key). Does NOT commit.
+    """
+    stmt = _increment_rollup(DailyLocationRollup, ['location_id', 'day', 'bucket'], rows)
+    if stmt is not None:
+        db.execute(stmt)
+
+def _location_days(location_ids, start: date, end: date):
+    return and_(
+        DailyLocationRollup.location_id.in_(location_ids),
+        DailyLocationRollup.day >= start,
+        DailyLocationRollup.day <= end
+    )
+
+def _store_days(model, todays: dict, days: int):
+    """
+    Rollup rows of each store's last `days` local days (todays: get_location_todays).
+    """
+    if not todays:
+        return false()
+    return or_(*[
+        and_(model.location_id.in_(location_ids), model.day >= today - timedelta(days=days - 1), model.day <= today)
+        for today, location_ids in todays.items()
+    ])
+
+def get_daily_sales_stats(db: Session, location_ids: list[int], tz: str = None):
+    """
+    Returns total revenue and transaction count for today (store local time).
+    """
+    todays = get_location_todays(db, location_ids, tz)
     stats = db.query(
-        func.sum(Transaction.total_amount).label('total_revenue'),
-        func.count(Transaction.id).label('tx_count')
+        func.sum(DailyLocationRollup.revenue).label('total_revenue'),
+        func.sum(DailyLocationRollup.tx_count).label('tx_count')
     ).filter(
-        Transaction.selling_location_id == location_id,
-        Transaction.status == 'completed',
-        func.date(Transaction.created_at) == today
+        _store_days(DailyLocationRollup, todays, 1)
     ).first()
     
     return {
@@ -246,79 +790,68 @@ def get_daily_sales_stats(db: Session, location_id: int):
         "tx_count": stats.tx_count or 0
     }
 
-def get_recent_transactions(db: Session, location_id: int, limit: int = 5):
+def get_recent_transactions(db: Session, location_ids: list[int], limit: int = 5):
     """
-    Returns the last N transactions for the location.
+    Returns the last N transactions for the locations.
     """
-    return db.query(Transaction).filter(
-        Transaction.selling_location_id == location_id,
-        Transaction.status == 'completed'
+    return db.query(Transaction).options(selectinload(Transaction.details)).filter(
+        _completed_sales(location_ids)
     ).order_by(Transaction.created_at.desc()).limit(limit).all()
 
 # --- Analytics ---
-def get_sales_over_time(db: Session, location_id: int, days: int = 7):
-    start_date = datetime.utcnow() - timedelta(days=days)
-    
-    # SQLite/Postgres difference in date truncation usually requires careful handling.
-    # We will cast created_at to Date for grouping.
+# All take the authorized location set (authorization.analytics_location_ids).
+# `days` counts back from each store's own local today (rollup days are store-local
+# days), so stores in different timezones are each cut at their own midnight.
+
+def get_sales_over_time(db: Session, location_ids: list[int], days: int = 7, tz: str = None):
+    todays = get_location_todays(db, location_ids, tz)
     results = db.query(
-        func.date(Transaction.created_at).label('date'),
-        func.sum(Transaction.total_amount).label('total_revenue'),
-        func.count(Transaction.id).label('tx_count')
+        DailyLocationRollup.day.label('date'),
+        func.sum(DailyLocationRollup.revenue).label('total_revenue'),
+        func.sum(DailyLocationRollup.tx_count).label('tx_count')
     ).filter(
-        Transaction.created_at >= start_date,
-        Transaction.location_id == location_id
+        _store_days(DailyLocationRollup, todays, days)
     ).group_by(
-        func.date(Transaction.created_at)
+        DailyLocationRollup.day
     ).order_by(
-        func.date(Transaction.created_at)
+        DailyLocationRollup.day
     ).all()
     
     return [
-        {"date": str(r.date), "revenue": float(r.total_revenue or 0), "count": r.tx_count}
+        {"date": str(r.date), "revenue": float(r.total_revenue or 0), "count": int(r.tx_count or 0)}
         for r in results
     ]
 
-def get_top_products(db: Session, location_id: int, limit: int = 10):
+def get_top_products(db: Session, location_ids: list[int], limit: int = 10, days: int = 30, tz: str = None):
+    todays = get_location_todays(db, location_ids, tz)
+    total_qty = func.sum(DailySalesRollup.qty)
     results = db.query(
         Product.name,
-        func.sum(TransactionDetail.quantity).label('total_qty')
-    ).join(
-        TransactionDetail, Product.id == TransactionDetail.product_id
+        total_qty.label('total_qty')
     ).join(
-        Transaction, TransactionDetail.transaction_id == Transaction.id
+        DailySalesRollup, Product.id == DailySalesRollup.product_id
     ).filter(
-        Transaction.location_id == location_id
+        _store_days(DailySalesRollup, todays, days)
     ).group_by(
         Product.id
+    ).having(
+        total_qty > 0
     ).order_by(
         desc('total_qty')
     ).limit(limit).all()
     
     return [
-        {"name": r.name, "quantity": r.total_qty}
+        {"name": r.name, "quantity": int(r.total_qty)}
         for r in results
     ]
 
-def get_dashboard_kpis(db: Session, location_id: int):
-    # For simplicity, getting "Lifetime" stats or "Today's" stats? 
-    # Let's do Today vs Total to be useful.
-    
-    today = datetime.utcnow().date()
-    
-    # 1. Total Revenue (Today)
-    revenue_today = db.query(func.sum(Transaction.total_amount)).filter(
-        Transaction.location_id == location_id,
-        func.date(Transaction.created_at) == today
-    ).scalar() or 0.0
-
-    # 2. Tx Count (Today)
-    count_today = db.query(func.count(Transaction.id)).filter(
-        Transaction.location_id == location_id,
-        func.date(Transaction.created_at) == today
-    ).scalar() or 0
+def get_dashboard_kpis(db: Session, location_ids: list[int], tz: str = None):
+    # Today's stats in store local time
+    stats = get_daily_sales_stats(db, location_ids, tz)
+    revenue_today = stats["total_revenue"]
+    count_today = int(stats["tx_count"])
 
-    # 3. Avg Ticket (Today)
+    # Avg Ticket (Today)
     avg_ticket = revenue_today / count_today if count_today > 0 else 0.0
 
     return {
@@ -327,53 +860,38 @@ def get_dashboard_kpis(db: Session, location_id: int):
         "avg_ticket": float(avg_ticket)
     }
 
-def get_sales_by_category(db: Session, location_id: int):
+def get_sales_by_category(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    todays = get_location_todays(db, location_ids, tz)
+    total_qty = func.sum(DailySalesRollup.qty)
     results = db.query(
         Category.name,
-        func.sum(TransactionDetail.quantity).label('total_qty')
+        total_qty.label('total_qty')
     ).join(
         Product, Category.id == Product.category_id
     ).join(
-        TransactionDetail, Product.id == TransactionDetail.product_id
-    ).join(
-        Transaction, TransactionDetail.transaction_id == Transaction.id
+        DailySalesRollup, Product.id == DailySalesRollup.product_id
     ).filter(
-        Transaction.location_id == location_id
+        _store_days(DailySalesRollup, todays, days)
     ).group_by(
         Category.id
+    ).having(
+        total_qty > 0
     ).all()
 
     return [
-        {"name": r.name, "value": r.total_qty}
-        for r in results
-    ]
-
-# --- Inventory ---
-def get_inventory_levels(db: Session, location_id: int):
-    results = db.query(
-        Product.id, 
-        Product.name, 
-        Category.name.label('category'), 
-        StockLevel.current_stock
-    ).join(
-        StockLevel, Product.id == StockLevel.product_id
-    ).join(
-        Category, Product.category_id == Category.id
-    ).filter(
-        StockLevel.location_id == location_id
-    ).all()
-    
-    return [
-        {"id": r.id, "name": r.name, "category": r.category, "stock": r.current_stock}
+        {"name": r.name, "value": int(r.total_qty)}
         for r in results
     ]
 
-def get_revenue_by_location(db: Session):
+def get_revenue_by_location(db: Session, location_ids: list[int], days: int = 30, tz: str = None):
+    todays = get_location_todays(db, location_ids, tz)
     results = db.query(
         Location.name,
-        func.sum(Transaction.total_amount).label('revenue')
+        func.sum(DailyLocationRollup.revenue).label('revenue')
     ).join(
-        Transaction, Location.id == Transaction.selling_location_id
+        DailyLocationRollup, Location.id == DailyLocationRollup.location_id
+    ).filter(
+        _store_days(DailyLocationRollup, todays, days)
     ).group_by(
         Location.id
     ).all()
@@ -383,17 +901,174 @@ def get_revenue_by_location(db: Session):
         for r in results
     ]
 
-def get_revenue_by_location(db: Session):
-    results = db.query(
-        Location.name,
-        func.sum(Transaction.total_amount).label('revenue')
+# --- Change Watermarks ---
+# Cheap fingerprints of the data a read endpoint returns: while the watermark is
+# unchanged the response is too, so the API can answer If-None-Match with 304
+# without running the query.
+
+def _rollup_watermark(db: Session, condition):
+    # Count / sums / newest transaction of the matching store-day rollup rows
+    row = db.query(
+        func.count(),
+        func.sum(DailyLocationRollup.tx_count),
+        func.sum(DailyLocationRollup.qty),
+        func.sum(DailyLocationRollup.revenue),
+        func.max(DailyLocationRollup.last_transaction_id)
+    ).filter(condition).one()
+    return tuple(row)
+
+def get_sales_watermark(db: Session, location_ids: list[int], days: int, tz: str = None):
+    """
+    Sales watermark of each store's last `days` local days: the stores' local dates
+    (panels roll over at midnight), then count / sums / newest transaction of the
+    store-day rollup rows. Every sale, cancel and void changes it.
+    """
+    todays = get_location_todays(db, location_ids, tz)
+    return (sorted(str(today) for today in todays), *_rollup_watermark(db, _store_days(DailyLocationRollup, todays, days)))
+
+def get_sales_watermark_between(db: Session, location_ids: list[int], start: date, end: date):
+    """
+    Count / sums / newest transaction of the store-day rollup rows of days [start, end].
+    """
+    return _rollup_watermark(db, _location_days(location_ids, start, end))
+
+def stock_watermark_query(location_id: int):
+    """
+    Stock rows, on-hand totals and last stock-row update at a location (the shard
+    sum covers hot SKUs, whose sales do not touch stock_levels).
+    """
+    shards = select(func.coalesce(func.sum(StockShard.quantity), 0)).where(
+        StockShard.location_id == location_id
+    ).scalar_subquery()
+    return select(
+        func.count(),
+        func.sum(StockLevel.current_stock),
+        func.max(StockLevel.updated_at),
+        shards
+    ).where(StockLevel.location_id == location_id)
+
+def get_stock_watermark(db: Session, location_id: int):
+    return tuple(db.execute(stock_watermark_query(location_id)).one())
+
+def get_dashboard(db: Session, location_ids: list[int], days: int = 7, period_days: int = 30, limit: int = 10, tz: str = None):
+    """
+    Every dashboard panel in one call: kpis, sales_over_time (last `days`),
+    top_products / categories / locations (last `period_days`) and the daily report.
+    One pass over each rollup table plus the recent-transactions query, instead of
+    one query (and one request) per panel.
+    """
+    todays = get_location_todays(db, location_ids, tz)
+    today_of = {location_id: today for today, ids in todays.items() for location_id in ids}
+
+    # 1. Store-day totals for the widest window: trend, KPIs, revenue by location
+    location_days = db.query(
+        DailyLocationRollup.location_id,
+        DailyLocationRollup.day,
+        func.sum(DailyLocationRollup.revenue).label('revenue'),
+        func.sum(DailyLocationRollup.tx_count).label('tx_count')
+    ).filter(
+        _store_days(DailyLocationRollup, todays, max(days, period_days))
+    ).group_by(
+        DailyLocationRollup.location_id, DailyLocationRollup.day
+    ).all()
+
+    trend = {}
+    by_location = {}
+    revenue_today = Decimal(0)
+    count_today = 0
+    for row in location_days:
+        today = today_of[row.location_id] # Each store's own local today
+        if row.day > today - timedelta(days=days):
+            point = trend.setdefault(row.day, [Decimal(0), 0])
+            point[0] += row.revenue
+            point[1] += row.tx_count
+        if row.day > today - timedelta(days=period_days):
+            by_location[row.location_id] = by_location.get(row.location_id, Decimal(0)) + row.revenue
+        if row.day == today:
+            revenue_today += row.revenue
+            count_today += int(row.tx_count)
+
+    # 2. Product totals for the period: top products and categories
+    total_qty = func.sum(DailySalesRollup.qty)
+    product_rows = db.query(
+        Product.name,
+        Category.id.label('category_id'),
+        Category.name.label('category'),
+        total_qty.label('total_qty')
     ).join(
-        Transaction, Location.id == Transaction.selling_location_id
+        DailySalesRollup, Product.id == DailySalesRollup.product_id
+    ).outerjoin(
+        Category, Category.id == Product.category_id
+    ).filter(
+        _store_days(DailySalesRollup, todays, period_days)
     ).group_by(
-        Location.id
+        Product.id, Category.id
+    ).having(
+        total_qty > 0
+    ).order_by(
+        desc('total_qty')
     ).all()
 
+    categories = {}
+    for row in product_rows:
+        if row.category_id is not None:
+            name, qty = categories.get(row.category_id, (row.category, 0))
+            categories[row.category_id] = (name, qty + int(row.total_qty))
+
+    location_names = dict(db.query(Location.id, Location.name).filter(Location.id.in_(by_location.keys()))) if by_location else {}
+    recent = get_recent_transactions(db, location_ids)
+
+    return {
+        "kpis": {
+            "revenue_today": float(revenue_today),
+            "count_today": count_today,
+            "avg_ticket": float(revenue_today / count_today) if count_today > 0 else 0.0
+        },
+        "sales_over_time": [
+            {"date": str(day), "revenue": float(revenue), "count": int(count)}
+            for day, (revenue, count) in sorted(trend.items())
+        ],
+        "top_products": [
+            {"name": row.name, "quantity": int(row.total_qty)}
+            for row in product_rows[:limit]
+        ],
+        "categories": [
+            {"name": name, "value": qty}
+            for name, qty in categories.values()
+        ],
+        "locations": [
+            {"location": location_names.get(location_id), "revenue": float(revenue)}
+            for location_id, revenue in by_location.items()
+        ],
+        "daily": {
+            "stats": {"total_revenue": revenue_today, "tx_count": count_today},
+            "recent_transactions": [
+                {
+                    "id": t.id,
+                    "total_amount": t.total_amount,
+                    "created_at": t.created_at,
+                    "item_count": len(t.details)
+                } for t in recent
+            ]
+        }
+    }
+
+# --- Inventory ---
+def get_inventory_levels(db: Session, location_id: int):
+    results = db.query(
+        Product.id, 
+        Product.name, 
+        Category.name.label('category'), 
+        stock_on_hand_expr().label('current_stock')
+    ).join(
+        StockLevel, Product.id == StockLevel.product_id
+    ).join(
+        Category, Product.category_id == Category.id
+    ).filter(
+        StockLevel.location_id == location_id
+    ).all()
+    
     return [
-        {"location": r.name, "revenue": float(r.revenue)}
+        {"id": r.id, "name": r.name, "category": r.category, "stock": r.current_stock}
         for r in results
     ]
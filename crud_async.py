@@ -0,0 +1,41 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from models import Product, Category, StockLevel, Employee
+from crud import stock_on_hand_expr, stock_watermark_query
+
+# Async counterparts of the crud.py reads on the hot request path (auth, /token,
+# /inventory). /sales and /loyalty/upsell need the full business logic and run the
+# sync service functions through AsyncSession.run_sync.
+
+# --- Employees ---
+async def get_employee(db: AsyncSession, employee_id: int):
+    return await db.get(Employee, employee_id)
+
+async def get_employee_by_username(db: AsyncSession, username: str):
+    result = await db.execute(select(Employee).where(Employee.username == username))
+    return result.scalars().first()
+
+# --- Inventory ---
+async def get_inventory_levels(db: AsyncSession, location_id: int):
+    result = await db.execute(
+        select(
+            Product.id,
+            Product.name,
+            Category.name.label('category'),
+            stock_on_hand_expr().label('current_stock')
+        ).join(
+            StockLevel, Product.id == StockLevel.product_id
+        ).join(
+            Category, Product.category_id == Category.id
+        ).where(
+            StockLevel.location_id == location_id
+        )
+    )
+    return [
+        {"id": r.id, "name": r.name, "category": r.category, "stock": r.current_stock}
+        for r in result.all()
+    ]
+
+async def get_stock_watermark(db: AsyncSession, location_id: int):
+    result = await db.execute(stock_watermark_query(location_id))
+    return tuple(result.one())
@@ -1,12 +1,19 @@
 import os
+import logging
+import threading
+import time
 import urllib.parse
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, exc
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
 # Load environment variables
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_USER = os.getenv("DB_USER")
@@ -24,9 +31,225 @@ else:
 # Create Database URL - using psycopg (v3)
 DATABASE_URL = f"postgresql+psycopg://{DB_USER}:{encoded_password}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL)
+# --- Connection Pool ---
+# Sized per deployment from the /metrics/pool numbers rather than SQLAlchemy defaults.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30")) # Seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Seconds; -1 disables
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0")) # 0 = server default
+
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+class PoolMetrics:
+    """
+    Checkout statistics of one engine's pool: wait time to get a connection,
+    timeouts and overflow connections opened.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.checkouts = 0
+            self.wait_total_ms = 0.0
+            self.wait_max_ms = 0.0
+            self.timeouts = 0
+            self.overflow_events = 0
+            self.wait_buckets = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def record_checkout(self, wait_ms: float, opened_overflow: bool):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+            if opened_overflow:
+                self.overflow_events += 1
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                if wait_ms <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+            else:
+                self.wait_buckets[-1] += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        with self._lock:
+            buckets = {f"le_{bound}ms": count for bound, count in zip(WAIT_BUCKETS_MS, self.wait_buckets)}
+            buckets["gt_max"] = self.wait_buckets[-1]
+            return {
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max_ms, 3),
+                "timeouts": self.timeouts,
+                "overflow_events": self.overflow_events,
+                "wait_histogram": buckets
+            }
+
+class _InstrumentedPoolMixin:
+    metrics = None # Set per engine by _instrumented_pool
+
+    def _do_get(self):
+        overflow_before = self.overflow()
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            raise
+        self.metrics.record_checkout((time.perf_counter() - start) * 1000.0, self.overflow() > overflow_before)
+        return conn
+
+POOL_METRICS = {}
+
+def _instrumented_pool(name: str, base):
+    # A class per engine: SQLAlchemy re-creates pools via self.__class__, which keeps the metrics
+    metrics = POOL_METRICS[name] = PoolMetrics(name)
+    return type(f"Instrumented{base.__name__}_{name}", (_InstrumentedPoolMixin, base), {"metrics": metrics})
+
+def _pool_options(statement_timeout_ms=DB_STATEMENT_TIMEOUT_MS, read_only=False):
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    server_options = []
+    if statement_timeout_ms > 0:
+        server_options.append(f"-c statement_timeout={statement_timeout_ms}")
+    if read_only:
+        server_options.append("-c default_transaction_read_only=on")
+    if server_options:
+        options["connect_args"] = {"options": " ".join(server_options)}
+    return options
+
+engine = create_engine(DATABASE_URL, poolclass=_instrumented_pool("primary", QueuePool), **_pool_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
 
+# Async variant (psycopg v3 async driver) for the hot request path in api.py.
+# Same URL: SQLAlchemy picks the async psycopg dialect for create_async_engine.
+async_engine = create_async_engine(DATABASE_URL, poolclass=_instrumented_pool("primary_async", AsyncAdaptedQueuePool), **_pool_options())
+AsyncSessionLocal = async_sessionmaker(autoflush=False, bind=async_engine, expire_on_commit=False)
+
+# --- Read Replica ---
+# Reporting, analytics and inventory reads go to a streaming replica so month-end
+# aggregations do not compete with checkout. Unset DB_REPLICA_HOST = everything on the primary.
+DB_REPLICA_HOST = os.getenv("DB_REPLICA_HOST")
+DB_REPLICA_PORT = os.getenv("DB_REPLICA_PORT", DB_PORT)
+DB_REPLICA_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_REPLICA_STATEMENT_TIMEOUT_MS", str(DB_STATEMENT_TIMEOUT_MS)))
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "0")) # 0 = no lag check
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", "5"))
+
+REPLICA_DATABASE_URL = (
+    f"postgresql+psycopg://{DB_USER}:{encoded_password}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+    if DB_REPLICA_HOST else None
+)
+
+if REPLICA_DATABASE_URL:
+    replica_engine = create_engine(
+        REPLICA_DATABASE_URL, poolclass=_instrumented_pool("replica", QueuePool),
+        **_pool_options(DB_REPLICA_STATEMENT_TIMEOUT_MS, read_only=True)
+    )
+    async_replica_engine = create_async_engine(
+        REPLICA_DATABASE_URL, poolclass=_instrumented_pool("replica_async", AsyncAdaptedQueuePool),
+        **_pool_options(DB_REPLICA_STATEMENT_TIMEOUT_MS, read_only=True)
+    )
+else:
+    replica_engine = None
+    async_replica_engine = None
+
+# Engine for offline readers (forecasting, batch jobs) that tolerate replica lag
+read_engine = replica_engine or engine
+
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine, expire_on_commit=False)
+AsyncReplicaSessionLocal = async_sessionmaker(autoflush=False, bind=async_replica_engine or async_engine, expire_on_commit=False)
+
+_replica_state = {"checked_at": 0.0, "lag": None, "healthy": REPLICA_DATABASE_URL is not None}
+_replica_lock = threading.Lock()
+
+def replica_lag_seconds():
+    """
+    Seconds the replica is behind the primary. 0 when it has replayed everything it
+    received, so an idle primary does not read as lag.
+    """
+    with replica_engine.connect() as conn:
+        lag = conn.execute(text(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )).scalar()
+    return float(lag or 0)
+
+def replica_ping():
+    with replica_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+def replica_available() -> bool:
+    """
+    Whether read traffic may use the replica: configured, reachable and within
+    DB_REPLICA_MAX_LAG_SECONDS. Re-checked at most every DB_REPLICA_LAG_CHECK_INTERVAL.
+    """
+    if replica_engine is None:
+        return False
+    now = time.monotonic()
+    if now - _replica_state["checked_at"] < DB_REPLICA_LAG_CHECK_INTERVAL:
+        return _replica_state["healthy"]
+    with _replica_lock:
+        if now - _replica_state["checked_at"] < DB_REPLICA_LAG_CHECK_INTERVAL:
+            return _replica_state["healthy"]
+        try:
+            if DB_REPLICA_MAX_LAG_SECONDS > 0:
+                lag = replica_lag_seconds()
+                healthy = lag <= DB_REPLICA_MAX_LAG_SECONDS
+            else:
+                replica_ping() # No lag limit: still only route reads to a reachable replica
+                lag, healthy = None, True
+        except exc.SQLAlchemyError:
+            lag, healthy = None, False
+        if healthy != _replica_state["healthy"]:
+            logger.warning(f"Read replica {'back in service' if healthy else 'unavailable, reading from primary'} (lag={lag})")
+        _replica_state.update(checked_at=now, lag=lag, healthy=healthy)
+        return healthy
+
+def read_session():
+    """
+    Session for read-only traffic: the replica when available, otherwise the primary.
+    """
+    return ReplicaSessionLocal() if replica_available() else SessionLocal()
+
+def async_read_session(use_replica: bool):
+    return AsyncReplicaSessionLocal() if use_replica else AsyncSessionLocal()
+
+def pool_status():
+    """
+    Live pool gauges plus checkout metrics for every engine, for /metrics/pool.
+    """
+    pools = {"primary": engine.pool, "primary_async": async_engine.sync_engine.pool}
+    if replica_engine is not None:
+        pools["replica"] = replica_engine.pool
+        pools["replica_async"] = async_replica_engine.sync_engine.pool
+    status = {}
+    for name, pool in pools.items():
+        status[name] = {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(), # In use
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            **type(pool).metrics.snapshot()
+        }
+    if replica_engine is not None:
+        status["replica"]["lag_seconds"] = _replica_state["lag"]
+        status["replica"]["in_service"] = _replica_state["healthy"]
+    return status
+
 if __name__ == "__main__":
     print(f"Connecting to database: {DB_NAME} at {DB_HOST}:{DB_PORT} as {DB_USER}")
     try:
@@ -1,8 +1,9 @@
-from database import SessionLocal, engine
+from database import SessionLocal, read_engine
 from init_db import init_db
 import crud
 import models
 import forecasting
+import rollup
 from datetime import datetime, timedelta
 import random
 import numpy as np
@@ -64,11 +65,12 @@ def demo_forecasting():
                 db.add(detail)
         
         db.commit()
+        rollup.rebuild(db) # Rows were inserted directly: derive the daily rollups
         print("Historical data generated.")
 
         # 2. Forecasting Pipeline
         print("\n--- Running ETL & Feature Engineering ---")
-        df = forecasting.fetch_sales_data(engine, loc.id, prod.id)
+        df = forecasting.fetch_sales_data(read_engine, loc.id, prod.id)
         print(f"Data Fetched: {len(df)} rows.")
         # print(df.tail())
         
@@ -0,0 +1,198 @@
+from sqlalchemy import event as sa_event, select, func
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+import asyncio
+import json
+import logging
+import os
+import threading
+import psycopg
+
+from database import DATABASE_URL
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Live events (KPI deltas, low stock) for push-driven dashboards.
+# Producers call `publish(db, topic, event)` inside their DB transaction; the event
+# goes out only if that transaction commits. Subscribers (the SSE endpoint) get
+# an asyncio queue per connection.
+#
+# EVENTS_BACKEND=memory (default) delivers within this process. EVENTS_BACKEND=postgres
+# sends events with pg_notify in the producing transaction (Postgres delivers them on
+# commit) and every worker LISTENs, so dashboards see sales made on any worker.
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory").lower()
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "pos_events")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "256"))
+
+_ON_COMMIT = "on_commit_callbacks"
+
+def location_topic(location_id: int) -> str:
+    return f"location:{location_id}"
+
+# --- Commit hooks ---
+
+def on_commit(db: Session, callback, *args):
+    """
+    Runs callback(*args) after the current transaction commits; dropped if the
+    transaction (or the savepoint it was registered in) rolls back.
+    """
+    owner = db.get_nested_transaction() or db.get_transaction()
+    db.info.setdefault(_ON_COMMIT, []).append((owner, callback, args))
+
+@sa_event.listens_for(Session, "after_commit")
+def _run_on_commit(session):
+    if session.in_nested_transaction() or _ON_COMMIT not in session.info:
+        return # A savepoint release: wait for the outer commit
+    for _, callback, args in session.info.pop(_ON_COMMIT):
+        try:
+            callback(*args)
+        except Exception as e:
+            logger.error(f"After-commit callback failed: {e}")
+
+@sa_event.listens_for(Session, "after_soft_rollback")
+def _drop_on_commit(session, previous_transaction):
+    staged = session.info.get(_ON_COMMIT)
+    if not staged:
+        return
+
+    def rolled_back(owner):
+        while owner is not None:
+            if owner is previous_transaction:
+                return True
+            owner = owner.parent
+        return False
+
+    session.info[_ON_COMMIT] = [entry for entry in staged if not rolled_back(entry[0])]
+
+# --- Subscriptions ---
+
+class Subscription:
+    """
+    One listener's queue. A listener that falls EVENTS_QUEUE_SIZE events behind
+    gets a single {"type": "resync"} instead of the backlog.
+    """
+
+    def __init__(self, topics, loop):
+        self.topics = set(topics)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def _deliver(self, event: dict):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout: float):
+        """
+        Next event, or None after `timeout` seconds without one.
+        """
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return {"type": "resync"}
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class LocalBroker:
+    """
+    In-process pub/sub: topic -> subscriptions. publish() may be called from any
+    thread; delivery hops onto each subscriber's event loop.
+    """
+
+    def __init__(self):
+        self._subscriptions = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topics) -> Subscription:
+        subscription = Subscription(topics, asyncio.get_running_loop())
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                listeners = self._subscriptions.get(topic)
+                if listeners:
+                    listeners.discard(subscription)
+                    if not listeners:
+                        del self._subscriptions[topic]
+
+    def dispatch(self, topic: str, event: dict):
+        with self._lock:
+            listeners = list(self._subscriptions.get(topic, ()))
+        for subscription in listeners:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, event)
+            except RuntimeError:
+                self.unsubscribe(subscription) # Its event loop is gone
+
+    def publish(self, db: Session, topic: str, event: dict):
+        on_commit(db, self.dispatch, topic, event)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+class PostgresBroker(LocalBroker):
+    """
+    LISTEN/NOTIFY transport: events ride in the producing transaction and each
+    worker's listener thread dispatches them to its local subscribers.
+    """
+
+    def __init__(self, channel: str = EVENTS_CHANNEL):
+        super().__init__()
+        self.channel = channel
+        self._stop = threading.Event()
+        self._thread = None
+
+    def publish(self, db: Session, topic: str, event: dict):
+        payload = json.dumps({"topic": topic, "event": event}, default=str)
+        db.execute(select(func.pg_notify(self.channel, payload)))
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="events-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        while not self._stop.is_set():
+            try:
+                with psycopg.connect(dsn, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {self.channel}")
+                    logger.info(f"Listening for events on '{self.channel}'.")
+                    while not self._stop.is_set():
+                        for notify in conn.notifies(timeout=1.0):
+                            message = json.loads(notify.payload)
+                            self.dispatch(message["topic"], message["event"])
+            except Exception as e:
+                logger.error(f"Event listener failed: {e}")
+                self._stop.wait(5)
+
+broker = PostgresBroker() if EVENTS_BACKEND == "postgres" else LocalBroker()
+
+def publish(db: Session, topic: str, event: dict):
+    broker.publish(db, topic, event)
+
+def format_sse(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
@@ -14,17 +14,17 @@ def fetch_sales_data(engine, location_id: int, product_id: int):
     """
     Fetches daily sales volume for a product at a location.
     Returns a DataFrame indexed by date with 'daily_sales_volume'.
+    Reads the daily rollup (store-local days), not the raw line items.
     """
     query = text("""
         SELECT 
-            DATE(t.created_at) as sale_date,
-            SUM(td.quantity) as daily_sales_volume
-        FROM transactions t
-        JOIN transaction_details td ON t.id = td.transaction_id
-        WHERE t.selling_location_id = :location_id
-          AND td.product_id = :product_id
-          AND t.status = 'completed'
-        GROUP BY DATE(t.created_at)
+            day as sale_date,
+            SUM(qty) as daily_sales_volume
+        FROM daily_sales_rollup
+        WHERE location_id = :location_id
+          AND product_id = :product_id
+        GROUP BY day
+        HAVING SUM(tx_count) > 0
         ORDER BY sale_date
     """)
     
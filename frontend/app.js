@@ -6,7 +6,9 @@ const app = {
         user: null,
         cart: [],
         products: [],
-        currentUpsell: null
+        currentUpsell: null,
+        kpis: null,
+        stream: null
     },
 
     // --- Views Configuration ---
@@ -87,6 +89,7 @@ const app = {
             title: 'Analytics Dashboard',
             render: () => `
                 <div class="dashboard-grid">
+                    <div id="dashboard-alerts"></div>
                     <!-- Row 1: KPIs -->
                     <div class="kpi-row">
                         <div class="kpi-card">
@@ -227,6 +230,9 @@ const app = {
             return;
         }
 
+        // Live updates only while the dashboard is on screen
+        app.closeStream();
+
         // 1. Show Loader / Fade Out
         container.classList.remove('active');
         container.innerHTML = '<div class="loader-container"><div class="loader"></div></div>'; // Spinner
@@ -261,9 +267,9 @@ const app = {
             const res = await fetch(`${API_URL}/token`, { method: 'POST', body: formData });
             if (res.ok) {
                 const data = await res.json();
-                let role = 'internal_cashier';
-                if (u === 'super_admin_user' || u === 'api_admin') role = 'super_admin';
-                app.state.user = { username: u, role: role };
+                let role = data.role || 'internal_cashier';
+                if (!data.role && (u === 'super_admin_user' || u === 'api_admin')) role = 'super_admin';
+                app.state.user = { username: u, role: role, location_id: data.assigned_location_id };
                 app.state.token = data.access_token;
                 localStorage.setItem('pos_token', data.access_token);
                 localStorage.setItem('pos_user', JSON.stringify(app.state.user));
@@ -276,6 +282,7 @@ const app = {
     },
 
     logout: () => {
+        app.closeStream();
         app.state.token = null;
         app.state.user = null;
         localStorage.removeItem('pos_token');
@@ -510,28 +517,22 @@ const app = {
             const days = document.getElementById('trend-range')?.value || 30;
             const headers = { 'Authorization': `Bearer ${app.state.token}` };
 
-            // Concurrent Fetch
-            const [kpiRes, trendRes, prodRes, catRes, locRes, recentRes] = await Promise.all([
-                fetch(`${API_URL}/analytics/kpis`, { headers }),
-                fetch(`${API_URL}/analytics/sales-over-time?days=${days}`, { headers }),
-                fetch(`${API_URL}/analytics/top-products?limit=5`, { headers }),
-                fetch(`${API_URL}/analytics/categories`, { headers }),
-                fetch(`${API_URL}/analytics/locations`, { headers }),
-                fetch(`${API_URL}/reports/daily`, { headers })
-            ]);
-
-            if (kpiRes.ok && trendRes.ok && prodRes.ok && catRes.ok && locRes.ok) {
-                const kpis = await kpiRes.json();
-                const trends = await trendRes.json();
-                const topProds = await prodRes.json();
-                const cats = await catRes.json();
-                const locs = await locRes.json();
-                const recentData = await recentRes.json();
-
-                // Render KPIs
-                document.getElementById('kpi-revenue').innerText = `$${kpis.revenue_today.toFixed(2)}`;
-                document.getElementById('kpi-tx').innerText = kpis.count_today;
-                document.getElementById('kpi-avg').innerText = `$${kpis.avg_ticket.toFixed(2)}`;
+            // All panels in one round trip
+            const res = await fetch(`${API_URL}/analytics/dashboard?days=${days}&limit=5`, { headers });
+
+            if (res.ok) {
+                const dashboard = await res.json();
+                const kpis = dashboard.kpis;
+                const trends = dashboard.sales_over_time;
+                const topProds = dashboard.top_products;
+                const cats = dashboard.categories;
+                const locs = dashboard.locations;
+                const recentData = dashboard.daily;
+
+                // Render KPIs (then kept current by the event stream)
+                app.state.kpis = { revenue_today: kpis.revenue_today, count_today: kpis.count_today };
+                app.renderKpis();
+                app.openStream();
 
                 // Render Charts
                 app.renderCharts(trends, topProds, cats, locs);
@@ -555,6 +556,42 @@ const app = {
         } catch (e) { console.error("Dashboard Load Error", e); }
     },
 
+    renderKpis: () => {
+        const kpis = app.state.kpis;
+        const avg = kpis.count_today > 0 ? kpis.revenue_today / kpis.count_today : 0;
+        document.getElementById('kpi-revenue').innerText = `$${kpis.revenue_today.toFixed(2)}`;
+        document.getElementById('kpi-tx').innerText = kpis.count_today;
+        document.getElementById('kpi-avg').innerText = `$${avg.toFixed(2)}`;
+    },
+
+    openStream: () => {
+        // Server-Sent Events: KPI deltas and low-stock alerts pushed as sales commit
+        if (app.state.stream) return;
+        const stream = new EventSource(`${API_URL}/analytics/stream?token=${encodeURIComponent(app.state.token)}`);
+        stream.addEventListener('kpi', (e) => {
+            const delta = JSON.parse(e.data);
+            if (!app.state.kpis || !document.getElementById('kpi-revenue')) return;
+            app.state.kpis.revenue_today += delta.revenue;
+            app.state.kpis.count_today += delta.tx_count;
+            app.renderKpis();
+        });
+        stream.addEventListener('low_stock', (e) => {
+            const item = JSON.parse(e.data);
+            const box = document.getElementById('dashboard-alerts');
+            if (box) box.insertAdjacentHTML('afterbegin', `<div class="card" style="margin-bottom: 10px; color: #ff3b30;">Low stock: ${item.name} (${item.stock} left, reorder at ${item.reorder_point})</div>`);
+        });
+        // Day rollover or missed events: reload the whole dashboard
+        stream.addEventListener('resync', () => app.loadDashboard());
+        app.state.stream = stream;
+    },
+
+    closeStream: () => {
+        if (app.state.stream) {
+            app.state.stream.close();
+            app.state.stream = null;
+        }
+    },
+
     renderCharts: (trends, topProds, cats, locs) => {
         // Destroy old charts to prevent overlay
         if (window.trendChart) window.trendChart.destroy();
@@ -764,6 +801,7 @@ openPaymentModal: () => {
                                     app.state.cartTotal = 0;
                                     app.state.paymentInput = "0";
                                     app.state.currentDiscount = null;
+                                    app.state.saleKey = null;
                                     console.log("DEBUG: State cleared. Cart length:", app.state.cart.length);
 
                                     // Reset Inputs
@@ -800,10 +838,16 @@ openPaymentModal: () => {
                                                     product_id: i.product_id, quantity: i.quantity, unit_price: i.price
                                                 }))
                                             };
+                                            // One key per cart: a retried request is replayed, not sold twice
+                                            app.state.saleKey = app.state.saleKey || crypto.randomUUID();
                                             try {
                                                 const res = await fetch(`${API_URL}/sales`, {
                                                     method: 'POST',
-                                                    headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${app.state.token}` },
+                                                    headers: {
+                                                        'Content-Type': 'application/json',
+                                                        'Authorization': `Bearer ${app.state.token}`,
+                                                        'Idempotency-Key': app.state.saleKey
+                                                    },
                                                     body: JSON.stringify(payload)
                                                 });
                                                 // Relaxed check to ensure compatibility if server returns 200 or 201
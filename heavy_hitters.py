@@ -0,0 +1,410 @@
+from sqlalchemy import func, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from array import array
+from datetime import date, datetime, timedelta, timezone
+import json
+import logging
+import os
+import threading
+
+import crud
+import events
+from database import SessionLocal
+from models import DailySalesRollup, DailyLocationRollup, HeavyHitterSketch, Product
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Approximate top products per location and store-local day, kept in memory.
+# Each (location, day) has a Space-Saving summary (the HH_CAPACITY best candidates,
+# each count an upper bound with a known maximum error) plus a Count-Min sketch that
+# tightens the counts of items re-entering the summary. A window of days / locations
+# is answered by merging at most HH_WINDOW_DAYS x locations summaries: O(k) per
+# summary, no table scan.
+#
+# Updates are staged by rollup.record / record_void inside the sale transaction and
+# applied after it commits (dropped if it, or its savepoint, rolls back). Sketches
+# are per process, like the reservation ledger; the persister snapshots them to
+# heavy_hitter_sketches for warm restarts and re-seeds from the rollup any store-day
+# whose unit total drifted from it (e.g. after `rollup.py rebuild`). Unit counts can
+# go down (cancels, voids), which keeps every estimate an upper bound but loosens the
+# error of evicted items: /analytics/top-products?exact=true reads the rollup for audits.
+#
+# A process only sees the sales it commits itself. With several API workers
+# (WEB_CONCURRENCY, which `uvicorn --workers` also reads) each would hold a partial,
+# worker-dependent count, so no sketches are kept and top products read the rollup.
+API_WORKERS = int(os.getenv("WEB_CONCURRENCY", "1"))
+ENABLED = API_WORKERS == 1
+
+HH_CAPACITY = int(os.getenv("HH_CAPACITY", "64"))
+HH_CMS_WIDTH = int(os.getenv("HH_CMS_WIDTH", "512"))
+HH_CMS_DEPTH = int(os.getenv("HH_CMS_DEPTH", "4"))
+HH_WINDOW_DAYS = int(os.getenv("HH_WINDOW_DAYS", "7"))
+HH_PERSIST_SECONDS = float(os.getenv("HH_PERSIST_SECONDS", "60"))
+
+class SpaceSaving:
+    """
+    Space-Saving summary: at most `capacity` counters, item -> [count, error].
+    count - error <= true count <= count for every tracked item; an untracked
+    item's count is at most min_count().
+    """
+
+    def __init__(self, capacity: int = HH_CAPACITY):
+        self.capacity = capacity
+        self.counters = {}
+
+    def min_count(self) -> int:
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def update(self, item, weight: int = 1, estimate: int = None):
+        """
+        estimate: an independent upper bound for the item (Count-Min), used to
+        tighten the count inherited from an evicted counter.
+        """
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+            if counter[0] <= 0:
+                del self.counters[item]
+            return
+        if weight <= 0:
+            return # Not tracked: nothing to take back
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0]
+            return
+        victim = min(self.counters, key=lambda key: self.counters[key][0])
+        floor = self.counters.pop(victim)[0]
+        count = floor + weight if estimate is None else min(floor + weight, estimate)
+        self.counters[item] = [count, max(count - weight, 0)]
+
+    def top(self, limit: int):
+        """
+        [(item, count, error)], highest count first.
+        """
+        ranked = sorted(self.counters.items(), key=lambda entry: entry[1][0], reverse=True)
+        return [(item, count, error) for item, (count, error) in ranked[:limit]]
+
+    @classmethod
+    def merge(cls, summaries, capacity: int = HH_CAPACITY):
+        """
+        Summary of the union of the streams: an item missing from a full summary
+        may still have up to that summary's min_count() there.
+        """
+        merged = cls(capacity)
+        floors = [summary.min_count() for summary in summaries]
+        items = set()
+        for summary in summaries:
+            items.update(summary.counters)
+        for item in items:
+            count = error = 0
+            for summary, floor in zip(summaries, floors):
+                counter = summary.counters.get(item)
+                count += counter[0] if counter else floor
+                error += counter[1] if counter else floor
+            merged.counters[item] = [count, error]
+        if len(merged.counters) > capacity:
+            merged.counters = dict(
+                sorted(merged.counters.items(), key=lambda entry: entry[1][0], reverse=True)[:capacity]
+            )
+        return merged
+
+class CountMinSketch:
+    """
+    depth x width counters; estimate(item) >= true count while counts stay >= 0.
+    """
+
+    def __init__(self, width: int = HH_CMS_WIDTH, depth: int = HH_CMS_DEPTH):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('q', bytes(8 * width)) for _ in range(depth)]
+
+    def _slots(self, item):
+        # hash() of ints / int tuples is stable across processes (persisted sketches)
+        return [hash((seed, item)) % self.width for seed in range(self.depth)]
+
+    def update(self, item, weight: int = 1) -> int:
+        estimate = None
+        for row, slot in zip(self.rows, self._slots(item)):
+            row[slot] += weight
+            estimate = row[slot] if estimate is None else min(estimate, row[slot])
+        return estimate
+
+    def estimate(self, item) -> int:
+        return min(row[slot] for row, slot in zip(self.rows, self._slots(item)))
+
+class ProductSketch:
+    """
+    Unit sales by product for one location and day.
+    """
+
+    def __init__(self):
+        self.summary = SpaceSaving()
+        self.cms = CountMinSketch()
+        self.total = 0 # Net units, checked against the rollup
+
+    def update(self, product_id: int, quantity: int):
+        estimate = self.cms.update(product_id, quantity)
+        self.summary.update(product_id, quantity, estimate)
+        self.total += quantity
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "total": self.total,
+            "capacity": self.summary.capacity,
+            "counters": [[item, count, error] for item, (count, error) in self.summary.counters.items()],
+            "width": self.cms.width,
+            "depth": self.cms.depth,
+            "cms": [row.tolist() for row in self.cms.rows],
+        })
+
+    @classmethod
+    def from_json(cls, payload: str):
+        """
+        None when the snapshot was taken with other sketch dimensions.
+        """
+        data = json.loads(payload)
+        sketch = cls()
+        if (data["capacity"], data["width"], data["depth"]) != (HH_CAPACITY, HH_CMS_WIDTH, HH_CMS_DEPTH):
+            return None
+        sketch.summary.counters = {item: [count, error] for item, count, error in data["counters"]}
+        sketch.cms.rows = [array('q', row) for row in data["cms"]]
+        sketch.total = data.get("total") # None (older snapshot): re-seeded on reconcile
+        return sketch
+
+class HeavyHitters:
+    """
+    Process-wide registry of (location_id, day) -> ProductSketch.
+    """
+
+    def __init__(self):
+        self._sketches = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+
+    def apply(self, updates):
+        """
+        updates: (location_id, day, product_id, quantity) tuples.
+        """
+        with self._lock:
+            for location_id, day, product_id, quantity in updates:
+                key = (location_id, day)
+                sketch = self._sketches.get(key)
+                if sketch is None:
+                    sketch = self._sketches[key] = ProductSketch()
+                sketch.update(product_id, quantity)
+                self._dirty.add(key)
+
+    def top(self, windows, limit: int):
+        """
+        [(product_id, count, error)] over windows: (location_ids, start, end) tuples,
+        each covering days [start, end] at its locations.
+        """
+        with self._lock:
+            summaries = [
+                sketch.summary for (location_id, day), sketch in self._sketches.items()
+                if any(location_id in location_ids and start <= day <= end for location_ids, start, end in windows)
+            ]
+            merged = SpaceSaving.merge(summaries) if summaries else SpaceSaving()
+        return [entry for entry in merged.top(limit) if entry[1] > 0]
+
+    def prune(self, oldest: date):
+        with self._lock:
+            for key in [key for key in self._sketches if key[1] < oldest]:
+                del self._sketches[key]
+                self._dirty.discard(key)
+
+    def persist(self, db: Session, oldest: date):
+        """
+        Writes the sketches changed since the last call, drops expired snapshots.
+        """
+        with self._lock:
+            rows = [
+                {"location_id": key[0], "day": key[1], "payload": self._sketches[key].to_json()}
+                for key in sorted(self._dirty) if key in self._sketches
+            ]
+            gone = [key for key in self._dirty if key not in self._sketches] # Emptied by a reconcile
+            self._dirty.clear()
+        try:
+            if gone:
+                db.query(HeavyHitterSketch).filter(
+                    tuple_(HeavyHitterSketch.location_id, HeavyHitterSketch.day).in_(gone)
+                ).delete(synchronize_session=False)
+            if rows:
+                stmt = pg_insert(HeavyHitterSketch).values(rows)
+                db.execute(stmt.on_conflict_do_update(
+                    index_elements=['location_id', 'day'],
+                    set_={"payload": stmt.excluded.payload, "updated_at": func.now()}
+                ))
+            db.query(HeavyHitterSketch).filter(HeavyHitterSketch.day < oldest).delete(synchronize_session=False)
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._dirty.update((row["location_id"], row["day"]) for row in rows)
+                self._dirty.update(gone)
+            raise
+        return len(rows)
+
+    def _seed(self, db: Session, oldest: date, keys=None, skip=()):
+        """
+        Sketches built from the (exact) daily rollup for the store-days since `oldest`
+        (only `keys` when given, never those in `skip`).
+        """
+        query = db.query(
+            DailySalesRollup.location_id, DailySalesRollup.day, DailySalesRollup.product_id,
+            func.sum(DailySalesRollup.qty).label('qty')
+        ).filter(
+            DailySalesRollup.day >= oldest
+        )
+        if keys is not None:
+            query = query.filter(tuple_(DailySalesRollup.location_id, DailySalesRollup.day).in_(list(keys)))
+        sketches = {}
+        for row in query.group_by(DailySalesRollup.location_id, DailySalesRollup.day, DailySalesRollup.product_id):
+            key = (row.location_id, row.day)
+            if key in skip or row.qty <= 0:
+                continue
+            sketches.setdefault(key, ProductSketch()).update(row.product_id, int(row.qty))
+        return sketches
+
+    def load(self, db: Session, oldest: date):
+        """
+        Warm start: snapshots where usable, otherwise sketches seeded from the rollup.
+        """
+        sketches = {}
+        for row in db.query(HeavyHitterSketch).filter(HeavyHitterSketch.day >= oldest):
+            sketch = ProductSketch.from_json(row.payload)
+            if sketch is not None:
+                sketches[(row.location_id, row.day)] = sketch
+        snapshots = set(sketches)
+        sketches.update(self._seed(db, oldest, skip=snapshots))
+        with self._lock:
+            self._sketches = sketches
+            self._dirty = set(sketches) - snapshots
+        logger.info(f"Heavy-hitter sketches loaded for {len(sketches)} store-days ({len(snapshots)} from snapshots).")
+
+    def reconcile(self, db: Session, oldest: date):
+        """
+        Re-seeds from the rollup the store-days whose net units no longer match it
+        (a rollup rebuild, or updates lost in a crash). Returns how many.
+        """
+        totals = {
+            (row.location_id, row.day): int(row.qty)
+            for row in db.query(
+                DailyLocationRollup.location_id, DailyLocationRollup.day, func.sum(DailyLocationRollup.qty).label('qty')
+            ).filter(
+                DailyLocationRollup.day >= oldest
+            ).group_by(DailyLocationRollup.location_id, DailyLocationRollup.day)
+        }
+        with self._lock:
+            stale = {
+                key for key in set(totals) | {key for key in self._sketches if key[1] >= oldest}
+                if totals.get(key, 0) != (self._sketches[key].total if key in self._sketches else 0)
+            }
+        if not stale:
+            return 0
+        seeded = self._seed(db, oldest, keys=stale)
+        with self._lock:
+            for key in stale:
+                if key in seeded:
+                    self._sketches[key] = seeded[key]
+                else:
+                    self._sketches.pop(key, None)
+                self._dirty.add(key)
+        logger.info(f"Heavy-hitter sketches re-seeded for {len(stale)} store-days.")
+        return len(stale)
+
+registry = HeavyHitters()
+
+def oldest_day() -> date:
+    # One spare day: store-local days run up to a day apart from UTC
+    return datetime.now(timezone.utc).date() - timedelta(days=HH_WINDOW_DAYS)
+
+def stage(db: Session, updates):
+    """
+    Queues (location_id, day, product_id, quantity) updates for when the current
+    transaction commits. Called from rollup.record / record_void.
+    """
+    if ENABLED:
+        events.on_commit(db, _apply, updates)
+
+def reconcile(db: Session):
+    """
+    Brings this process's sketches back in line with the rollup (rollup.rebuild).
+    """
+    if ENABLED:
+        registry.reconcile(db, oldest_day())
+
+def _apply(updates):
+    registry.apply(updates)
+
+def top_products(db: Session, location_ids: list[int], limit: int = 10, days: int = 7, tz: str = None):
+    """
+    get_top_products from the sketches (days <= HH_WINDOW_DAYS, limit <= HH_CAPACITY),
+    plus each quantity's maximum overestimate. Each store's window ends at its own
+    local today.
+    """
+    todays = crud.get_location_todays(db, location_ids, tz)
+    top = registry.top([(set(ids), today - timedelta(days=days - 1), today) for today, ids in todays.items()], limit)
+    names = dict(db.query(Product.id, Product.name).filter(Product.id.in_([entry[0] for entry in top]))) if top else {}
+    return [
+        {"name": names.get(product_id), "quantity": int(count), "max_error": int(error)}
+        for product_id, count, error in top
+    ]
+
+class SketchPersister:
+    """
+    Loads the sketches on start, then every `interval` seconds re-seeds drifted
+    store-days and snapshots changed ones. Idle when sketches are disabled.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = HH_PERSIST_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        db = self.session_factory()
+        try:
+            registry.load(db, oldest_day())
+        except Exception as e:
+            logger.error(f"Heavy-hitter sketch load failed: {e}")
+        finally:
+            db.close()
+        if self.interval <= 0:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="heavy-hitter-persister", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not ENABLED:
+            return
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._persist() # Final snapshot on shutdown
+
+    def _persist(self):
+        db = self.session_factory()
+        try:
+            registry.prune(oldest_day())
+            registry.reconcile(db, oldest_day())
+            registry.persist(db, oldest_day())
+        except Exception as e:
+            logger.error(f"Heavy-hitter sketch persist failed: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._persist()
+
+persister = SketchPersister()
@@ -0,0 +1,147 @@
+from sqlalchemy.orm import Session
+import logging
+import os
+import threading
+
+from database import SessionLocal
+from models import StockLevel, StockShard
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Hot-SKU mode: the stock of a fast seller at one location is split into N shards
+# (escrow buckets). Sales claim a random shard (see crud.claim_stock_sharded), so
+# concurrent checkouts rarely wait on the same row. A background task evens the
+# shards out again so the fast path keeps hitting.
+DEFAULT_SHARD_COUNT = int(os.getenv("HOT_SKU_SHARDS", "8"))
+REBALANCE_INTERVAL_SECONDS = float(os.getenv("HOT_SKU_REBALANCE_SECONDS", "30"))
+
+def _lock_sku(db: Session, location_id: int, product_id: int):
+    stock = db.query(StockLevel).filter(
+        StockLevel.location_id == location_id,
+        StockLevel.product_id == product_id
+    ).with_for_update().populate_existing().first()
+    shards = db.query(StockShard).filter(
+        StockShard.location_id == location_id,
+        StockShard.product_id == product_id
+    ).order_by(StockShard.shard_no).with_for_update().populate_existing().all()
+    return stock, shards
+
+def _distribute(total: int, shards: list):
+    share, extra = divmod(total, len(shards))
+    for i, shard in enumerate(shards):
+        shard.quantity = share + (1 if i < extra else 0)
+
+def enable_hot_sku(db: Session, location_id: int, product_id: int, shard_count: int = DEFAULT_SHARD_COUNT):
+    """
+    Switches a (location, product) to sharded stock, moving its current stock into
+    `shard_count` shards. Changing the shard count of a hot SKU re-shards it.
+    """
+    if shard_count < 2:
+        raise ValueError("A hot SKU needs at least 2 shards.")
+    try:
+        stock, shards = _lock_sku(db, location_id, product_id)
+        if not stock:
+            raise ValueError(f"No stock record for product {product_id} at location {location_id}.")
+
+        total = stock.current_stock + sum(s.quantity for s in shards)
+        for shard in shards[shard_count:]:
+            db.delete(shard)
+        shards = shards[:shard_count]
+        for shard_no in range(len(shards), shard_count):
+            shard = StockShard(location_id=location_id, product_id=product_id, shard_no=shard_no, quantity=0)
+            db.add(shard)
+            shards.append(shard)
+
+        _distribute(total, shards)
+        stock.current_stock = 0
+        stock.shard_count = shard_count
+        db.commit()
+        logger.info(f"Hot SKU enabled: product {product_id} at location {location_id} ({shard_count} shards, {total} units).")
+        return stock
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Enable hot SKU failed: {e}")
+        raise e
+
+def disable_hot_sku(db: Session, location_id: int, product_id: int):
+    """
+    Folds the shards back into the single stock_levels row.
+    """
+    try:
+        stock, shards = _lock_sku(db, location_id, product_id)
+        if not stock:
+            raise ValueError(f"No stock record for product {product_id} at location {location_id}.")
+        stock.current_stock += sum(s.quantity for s in shards)
+        stock.shard_count = 1
+        for shard in shards:
+            db.delete(shard)
+        db.commit()
+        return stock
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Disable hot SKU failed: {e}")
+        raise e
+
+def rebalance(db: Session, location_id: int, product_id: int):
+    """
+    Spreads the summed stock (row + shards) evenly over the shards again.
+    Commits. Returns the total.
+    """
+    stock, shards = _lock_sku(db, location_id, product_id)
+    if not stock or not shards:
+        db.rollback()
+        return 0
+    total = stock.current_stock + sum(s.quantity for s in shards)
+    _distribute(total, shards)
+    stock.current_stock = 0
+    db.commit()
+    return total
+
+def rebalance_all(db: Session):
+    hot = db.query(StockLevel.location_id, StockLevel.product_id).filter(StockLevel.shard_count > 1).all()
+    db.rollback() # Don't hold a snapshot while locking SKU by SKU
+    for location_id, product_id in hot:
+        try:
+            rebalance(db, location_id, product_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Rebalance of product {product_id} at location {location_id} failed: {e}")
+    return len(hot)
+
+class ShardRebalancer:
+    """
+    Background thread running rebalance_all every `interval` seconds.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = REBALANCE_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hot-sku-rebalancer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            db = self.session_factory()
+            try:
+                rebalance_all(db)
+            except Exception as e:
+                logger.error(f"Hot SKU rebalance cycle failed: {e}")
+            finally:
+                db.close()
+
+rebalancer = ShardRebalancer()
@@ -0,0 +1,49 @@
+from sqlalchemy.orm import Session
+import os
+import crud
+import schemas
+from cache import TTLCache
+
+# Recently answered keys are replayed from memory; older ones fall back to the
+# unique-indexed sale_idempotency_keys table.
+REPLAY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+REPLAY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))
+MAX_KEY_LENGTH = 100
+
+replay_cache = TTLCache(maxsize=REPLAY_CACHE_SIZE, ttl=REPLAY_CACHE_TTL)
+
+class IdempotencyConflict(Exception):
+    """The key was already used by a different employee."""
+
+def validate_key(key: str):
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise ValueError(f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters.")
+
+def lookup(db: Session, key: str, employee_id: int):
+    """
+    Returns the original TransactionResponse for a key that was already processed,
+    or None if the key is new. Never touches stock.
+    """
+    cached = replay_cache.get(key)
+    if cached is not None:
+        cached_employee_id, response = cached
+    else:
+        record = crud.get_idempotency_key(db, key)
+        if not record:
+            return None
+        tx = record.transaction
+        cached_employee_id = record.employee_id
+        response = schemas.TransactionResponse(
+            id=tx.id,
+            total_amount=tx.total_amount,
+            status=tx.status,
+            created_at=tx.created_at
+        )
+        replay_cache.set(key, (cached_employee_id, response))
+
+    if cached_employee_id != employee_id:
+        raise IdempotencyConflict("Idempotency-Key already used by another employee.")
+    return response
+
+def remember(key: str, employee_id: int, response: schemas.TransactionResponse):
+    replay_cache.set(key, (employee_id, response))
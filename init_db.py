@@ -1,5 +1,6 @@
 from database import engine
 from models import Base
+import partitioning
 import logging
 import os
 
@@ -19,6 +20,10 @@ def init_db():
         # Create all tables defined in models.py
         Base.metadata.create_all(bind=engine)
         logger.info("Tables created successfully!")
+
+        if partitioning.PARTITION_TRANSACTIONS:
+            partitioning.migrate_to_partitioned(engine)
+            partitioning.ensure_future_partitions(engine)
     except Exception as e:
         logger.error(f"Error creating tables: {e}")
 
@@ -0,0 +1,172 @@
+from sqlalchemy import func, cast, Integer, Float
+from sqlalchemy.orm import Session
+from datetime import date, timedelta
+import numpy as np
+import logging
+import os
+
+import crud
+from cache import TTLCache
+from models import DailySalesRollup, Product, Category, Location
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Gross margin (revenue - cost at sale) by product, category, location and period.
+# One GROUP BY over daily_sales_rollup (location x product x period, so full history
+# stays small) feeds NumPy arrays; every breakdown is a bincount over them.
+# Results are cached per (locations, period, options) and keyed on the sales
+# watermark of the period, so a sale, cancel or void in it is never served stale.
+MARGIN_CACHE_SIZE = int(os.getenv("MARGIN_CACHE_SIZE", "256"))
+MARGIN_CACHE_TTL = float(os.getenv("MARGIN_CACHE_TTL", "900"))
+
+GRANULARITIES = ("day", "month")
+
+margin_cache = TTLCache(maxsize=MARGIN_CACHE_SIZE, ttl=MARGIN_CACHE_TTL)
+
+def period_range(db: Session, location_ids: list[int], days: int = 30, date_from: date = None, date_to: date = None):
+    """
+    Local days [start, end]: date_from..date_to when given, else the last `days`
+    (days <= 0: all history) up to the latest local today among the stores, so a
+    store already on the next day is not cut off.
+    """
+    todays = crud.get_location_todays(db, location_ids)
+    end = date_to or (max(todays) if todays else crud.local_today(crud.STORE_TIMEZONE))
+    if date_from:
+        start = date_from
+    elif days > 0:
+        start = end - timedelta(days=days - 1)
+    else:
+        start = date.min
+    if end < start:
+        raise ValueError("date_to is before date_from")
+    return start, end
+
+def _period_key(granularity: str):
+    # Integer period codes: days since 1970-01-01, or months since year 0
+    day = DailySalesRollup.day
+    if granularity == "day":
+        return (day - date(1970, 1, 1)).label('period')
+    return cast(func.extract('year', day) * 12 + func.extract('month', day) - 1, Integer).label('period')
+
+def _period_label(code: int, granularity: str) -> str:
+    if granularity == "day":
+        return str(date(1970, 1, 1) + timedelta(days=int(code)))
+    return f"{int(code) // 12:04d}-{int(code) % 12 + 1:02d}"
+
+def _breakdown(codes, revenue, cost, qty):
+    """
+    Sums per distinct code: (codes, revenue, cost, margin, margin_pct, qty) arrays.
+    """
+    keys, inverse = np.unique(codes, return_inverse=True)
+    rev = np.bincount(inverse, weights=revenue, minlength=len(keys))
+    cst = np.bincount(inverse, weights=cost, minlength=len(keys))
+    units = np.bincount(inverse, weights=qty, minlength=len(keys))
+    margin = rev - cst
+    pct = np.divide(margin, rev, out=np.zeros_like(margin), where=rev != 0)
+    return keys, rev, cst, margin, pct, units
+
+def _rows(keys, rev, cst, margin, pct, units, label, order=None, limit: int = None):
+    order = np.argsort(-margin, kind="stable") if order is None else order
+    if limit:
+        order = order[:limit]
+    return [
+        {
+            **label(keys[i]),
+            "quantity": int(units[i]),
+            "revenue": round(float(rev[i]), 2),
+            "cost": round(float(cst[i]), 2),
+            "margin": round(float(margin[i]), 2),
+            "margin_pct": round(float(pct[i]) * 100, 2)
+        } for i in order
+    ]
+
+def compute_margin(db: Session, location_ids: list[int], start: date, end: date, granularity: str = "month", limit: int = 50):
+    """
+    Margin totals plus breakdowns by product (best `limit` by margin), category,
+    location and period (chronological).
+    """
+    period = _period_key(granularity)
+    rows = db.query(
+        DailySalesRollup.location_id,
+        DailySalesRollup.product_id,
+        period,
+        func.sum(DailySalesRollup.qty).label('qty'),
+        cast(func.sum(DailySalesRollup.revenue), Float).label('revenue'),
+        cast(func.sum(DailySalesRollup.cost), Float).label('cost')
+    ).filter(
+        DailySalesRollup.location_id.in_(location_ids),
+        DailySalesRollup.day >= start,
+        DailySalesRollup.day <= end
+    ).group_by(
+        DailySalesRollup.location_id, DailySalesRollup.product_id, period
+    ).all()
+
+    result = {"from": str(start) if start != date.min else None, "to": str(end), "granularity": granularity}
+    if not rows:
+        empty = {"quantity": 0, "revenue": 0.0, "cost": 0.0, "margin": 0.0, "margin_pct": 0.0}
+        return {**result, "totals": empty, "by_product": [], "by_category": [], "by_location": [], "by_period": []}
+
+    locations, products, periods, qty, revenue, cost = (np.array(column) for column in zip(*rows))
+    qty = qty.astype(float)
+    revenue = revenue.astype(float)
+    cost = cost.astype(float)
+
+    # Names / categories for the products and locations present (one query each)
+    product_ids, product_index = np.unique(products, return_inverse=True)
+    product_info = {
+        r.id: (r.name, r.category_id)
+        for r in db.query(Product.id, Product.name, Product.category_id).filter(Product.id.in_(product_ids.tolist()))
+    }
+    category_names = dict(db.query(Category.id, Category.name))
+    location_names = dict(db.query(Location.id, Location.name).filter(Location.id.in_(location_ids)))
+    # Category per row via the distinct products (0 = uncategorized)
+    categories = np.array([product_info.get(int(p), (None, None))[1] or 0 for p in product_ids])[product_index]
+
+    total_revenue, total_cost, total_qty = revenue.sum(), cost.sum(), qty.sum()
+    total_margin = total_revenue - total_cost
+    result["totals"] = {
+        "quantity": int(total_qty),
+        "revenue": round(float(total_revenue), 2),
+        "cost": round(float(total_cost), 2),
+        "margin": round(float(total_margin), 2),
+        "margin_pct": round(float(total_margin / total_revenue) * 100, 2) if total_revenue else 0.0
+    }
+    result["by_product"] = _rows(
+        *_breakdown(products, revenue, cost, qty),
+        label=lambda k: {"product_id": int(k), "name": product_info.get(int(k), (None, None))[0]},
+        limit=limit
+    )
+    result["by_category"] = _rows(
+        *_breakdown(categories, revenue, cost, qty),
+        label=lambda k: {"category": category_names.get(int(k), "Uncategorized")}
+    )
+    result["by_location"] = _rows(
+        *_breakdown(locations, revenue, cost, qty),
+        label=lambda k: {"location_id": int(k), "location": location_names.get(int(k))}
+    )
+    period_breakdown = _breakdown(periods, revenue, cost, qty)
+    result["by_period"] = _rows(
+        *period_breakdown,
+        label=lambda k: {"period": _period_label(k, granularity)},
+        order=np.arange(len(period_breakdown[0])) # np.unique sorted them chronologically
+    )
+    return result
+
+def get_margin(db: Session, location_ids: list[int], start: date, end: date, granularity: str = "month", limit: int = 50, watermark=None):
+    """
+    compute_margin through the cache. watermark: crud.get_sales_watermark_between
+    for the same days (computed here when omitted).
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unsupported granularity '{granularity}' (use day or month)")
+    if watermark is None:
+        watermark = crud.get_sales_watermark_between(db, location_ids, start, end)
+    key = (tuple(sorted(location_ids)), start, end, granularity, limit)
+    cached = margin_cache.get(key)
+    if cached is not None and cached[0] == watermark:
+        return cached[1]
+    result = compute_margin(db, location_ids, start, end, granularity, limit)
+    margin_cache.set(key, (watermark, result))
+    return result
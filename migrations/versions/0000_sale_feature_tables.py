@@ -0,0 +1,76 @@
+"""Tables and columns of the sales features added after the baseline schema
+
+Idempotency keys, sharded stock counters and the cart reservation snapshot.
+New tables take no locks on the sales tables; stock_levels.shard_count has a
+constant default (metadata-only in Postgres 11+) and its check constraint is
+validated without blocking writes.
+
+Databases created by init_db already have all of these; IF NOT EXISTS makes
+the upgrade a no-op there.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0000'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _has_constraint(name):
+    return op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_constraint WHERE conname = :name"
+    ), {"name": name}).scalar() is not None
+
+
+def upgrade():
+    op.create_table(
+        'sale_idempotency_keys',
+        sa.Column('key', sa.String(100), primary_key=True),
+        sa.Column('transaction_id', sa.Integer(), sa.ForeignKey('transactions.id', ondelete='CASCADE'), nullable=False),
+        sa.Column('employee_id', sa.Integer(), sa.ForeignKey('employees.id'), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+
+    op.execute("ALTER TABLE stock_levels ADD COLUMN IF NOT EXISTS shard_count INTEGER NOT NULL DEFAULT 1")
+    if not _has_constraint('check_shard_count_positive'):
+        op.execute("ALTER TABLE stock_levels ADD CONSTRAINT check_shard_count_positive CHECK (shard_count >= 1) NOT VALID")
+        op.execute("ALTER TABLE stock_levels VALIDATE CONSTRAINT check_shard_count_positive")
+
+    op.create_table(
+        'stock_shards',
+        sa.Column('id', sa.Integer(), primary_key=True),
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'), nullable=False),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), nullable=False),
+        sa.Column('shard_no', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.UniqueConstraint('location_id', 'product_id', 'shard_no', name='uq_stock_shard'),
+        sa.CheckConstraint('quantity >= 0', name='check_shard_quantity_positive'),
+        if_not_exists=True,
+    )
+    op.create_index('ix_stock_shards_id', 'stock_shards', ['id'], if_not_exists=True)
+
+    op.create_table(
+        'stock_reservations',
+        sa.Column('reservation_id', sa.String(64), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), primary_key=True),
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'), nullable=False),
+        sa.Column('employee_id', sa.Integer(), sa.ForeignKey('employees.id'), nullable=True),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+        sa.CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_table('stock_reservations')
+    op.drop_table('stock_shards')
+    op.execute("ALTER TABLE stock_levels DROP CONSTRAINT IF EXISTS check_shard_count_positive")
+    op.drop_column('stock_levels', 'shard_count')
+    op.drop_table('sale_idempotency_keys')
@@ -0,0 +1,60 @@
+"""Indexes for the hot transaction query shapes
+
+Built with CREATE INDEX CONCURRENTLY so a live database keeps taking sales
+while they build. CONCURRENTLY cannot run inside a transaction, hence the
+autocommit block. A failed concurrent build leaves an INVALID index behind;
+it is dropped first so a re-run rebuilds it instead of skipping it.
+
+Databases created by init_db already have these indexes; IF NOT EXISTS makes
+the upgrade a no-op there.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = '0000'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    dict(index_name='ix_transactions_location_status_created', table_name='transactions',
+         columns=['selling_location_id', 'status', 'created_at'],
+         postgresql_include=['total_amount']),
+    dict(index_name='ix_transactions_customer_created', table_name='transactions',
+         columns=['customer_id', 'created_at'],
+         postgresql_where=sa.text('customer_id IS NOT NULL')),
+    dict(index_name='ix_transaction_details_transaction_id', table_name='transaction_details',
+         columns=['transaction_id']),
+    dict(index_name='ix_transaction_details_product_transaction', table_name='transaction_details',
+         columns=['product_id', 'transaction_id'],
+         postgresql_include=['quantity', 'unit_price', 'unit_cost_at_sale']),
+    dict(index_name='ix_sale_idempotency_keys_transaction_id', table_name='sale_idempotency_keys',
+         columns=['transaction_id']),
+]
+
+
+def _drop_if_invalid(index_name):
+    invalid = op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+        "WHERE c.relname = :name AND NOT i.indisvalid"
+    ), {"name": index_name}).scalar()
+    if invalid:
+        op.drop_index(index_name, postgresql_concurrently=True, if_exists=True)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for index in INDEXES:
+            _drop_if_invalid(index['index_name'])
+            op.create_index(**index, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for index in reversed(INDEXES):
+            op.drop_index(index['index_name'], table_name=index['table_name'],
+                          postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,55 @@
+"""Copy the parent transaction's created_at onto transaction_details
+
+transaction_created_at is the partition key of transaction_details when the
+sales tables are partitioned (partitioning.py) and lets detail-side queries
+bound dates. The backfill runs in committed batches so it never holds long
+row locks, and NOT NULL is proven through a NOT VALID check constraint that is
+validated without blocking writes.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 50000
+
+
+def upgrade():
+    op.execute("ALTER TABLE transaction_details ADD COLUMN IF NOT EXISTS transaction_created_at TIMESTAMP WITH TIME ZONE")
+
+    bind = op.get_bind()
+    with op.get_context().autocommit_block():
+        last_id = bind.execute(sa.text("SELECT coalesce(max(id), 0) FROM transaction_details")).scalar()
+        for start in range(0, last_id + 1, BATCH_SIZE):
+            bind.execute(sa.text(
+                "UPDATE transaction_details d SET transaction_created_at = t.created_at "
+                "FROM transactions t WHERE t.id = d.transaction_id "
+                "AND d.id >= :start AND d.id < :end AND d.transaction_created_at IS NULL"
+            ), {"start": start, "end": start + BATCH_SIZE})
+
+        nullable = bind.execute(sa.text(
+            "SELECT is_nullable = 'YES' FROM information_schema.columns "
+            "WHERE table_name = 'transaction_details' AND column_name = 'transaction_created_at'"
+        )).scalar()
+        if not nullable: # Created by init_db or already partitioned
+            return
+
+        op.execute(
+            "ALTER TABLE transaction_details ADD CONSTRAINT check_transaction_created_at_not_null "
+            "CHECK (transaction_created_at IS NOT NULL) NOT VALID"
+        )
+        op.execute("ALTER TABLE transaction_details VALIDATE CONSTRAINT check_transaction_created_at_not_null")
+        # Uses the validated check instead of scanning the table
+        op.execute("ALTER TABLE transaction_details ALTER COLUMN transaction_created_at SET NOT NULL")
+        op.execute("ALTER TABLE transaction_details DROP CONSTRAINT check_transaction_created_at_not_null")
+
+
+def downgrade():
+    op.drop_column('transaction_details', 'transaction_created_at')
@@ -0,0 +1,22 @@
+"""Store timezone for local-day reporting
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Nullable, no default: metadata-only, no table rewrite
+    op.execute("ALTER TABLE locations ADD COLUMN IF NOT EXISTS timezone VARCHAR(64)")
+
+
+def downgrade():
+    op.drop_column('locations', 'timezone')
@@ -0,0 +1,52 @@
+"""Daily sales rollup tables
+
+New, empty tables: no locks on the sales tables. Backfill afterwards with
+`python rollup.py rebuild` (optionally a day range at a time).
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def _measures():
+    return [
+        sa.Column('qty', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('revenue', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('cost', sa.Numeric(14, 2), nullable=False, server_default='0'),
+        sa.Column('tx_count', sa.Integer(), nullable=False, server_default='0'),
+    ]
+
+
+def upgrade():
+    op.create_table(
+        'daily_sales_rollup',
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('product_id', sa.Integer(), sa.ForeignKey('products.id'), primary_key=True),
+        sa.Column('bucket', sa.SmallInteger(), primary_key=True),
+        *_measures(),
+        if_not_exists=True,
+    )
+    op.create_index('ix_daily_sales_rollup_product_location_day', 'daily_sales_rollup',
+                    ['product_id', 'location_id', 'day'], if_not_exists=True)
+    op.create_table(
+        'daily_location_rollup',
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('bucket', sa.SmallInteger(), primary_key=True),
+        *_measures(),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_table('daily_location_rollup')
+    op.drop_table('daily_sales_rollup')
@@ -0,0 +1,20 @@
+"""Newest transaction per store-day rollup row (HTTP cache watermark)
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE daily_location_rollup ADD COLUMN IF NOT EXISTS last_transaction_id INTEGER")
+
+
+def downgrade():
+    op.drop_column('daily_location_rollup', 'last_transaction_id')
@@ -0,0 +1,30 @@
+"""Heavy-hitter sketch snapshots
+
+New, empty table: sketches are rebuilt from the rollups until the first snapshot.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'heavy_hitter_sketches',
+        sa.Column('location_id', sa.Integer(), sa.ForeignKey('locations.id'), primary_key=True),
+        sa.Column('day', sa.Date(), primary_key=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.func.now()),
+        if_not_exists=True,
+    )
+
+
+def downgrade():
+    op.drop_table('heavy_hitter_sketches')
@@ -0,0 +1,34 @@
+"""Inserting transaction id of sales, for the incremental Parquet export
+
+transactions.created_at is the sale time, which offline batches backdate, and
+no clock value tells whether a row committed before or after an export ran.
+recorded_xid is the 64-bit id of the inserting transaction (pg_current_xact_id,
+PostgreSQL 13+); the export cuts below the oldest transaction still in flight.
+Existing rows keep NULL (no table rewrite) and count as recorded before the
+first export. The index is built CONCURRENTLY.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = '0007'
+down_revision = '0006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS recorded_xid BIGINT")
+    op.execute("ALTER TABLE transactions ALTER COLUMN recorded_xid SET DEFAULT (pg_current_xact_id()::text)::bigint")
+    with op.get_context().autocommit_block():
+        op.create_index('ix_transactions_recorded_xid', 'transactions', ['recorded_xid'],
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_transactions_recorded_xid', table_name='transactions',
+                      postgresql_concurrently=True, if_exists=True)
+    op.drop_column('transactions', 'recorded_xid')
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Numeric, Text, CheckConstraint, UniqueConstraint
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, String, Boolean, ForeignKey, Date, DateTime, Numeric, Text, CheckConstraint, UniqueConstraint, Index, text
+from sqlalchemy import event, select
+from sqlalchemy.orm import relationship, declarative_base, object_session
+from sqlalchemy.orm.util import identity_key
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
 
 Base = declarative_base()
 
@@ -15,6 +18,7 @@ class Location(Base):
     address = Column(Text, nullable=True)
     tax_id = Column(String(50), nullable=True)
     contact_info = Column(String(255), nullable=True)
+    timezone = Column(String(64), nullable=True) # IANA name, e.g. 'Europe/Madrid'; NULL = STORE_TIMEZONE
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     __table_args__ = (
@@ -36,17 +40,55 @@ class StockLevel(Base):
     product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
     current_stock = Column(Integer, default=0, nullable=False)
     reorder_point = Column(Integer, default=10, nullable=False)
+    # > 1 for hot SKUs: most of the stock then lives in StockShard rows and
+    # on-hand = current_stock + SUM(stock_shards.quantity)
+    shard_count = Column(Integer, default=1, nullable=False)
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     __table_args__ = (
         UniqueConstraint('location_id', 'product_id', name='uq_location_product'),
         CheckConstraint('reorder_point >= 0', name='check_reorder_point_positive'),
+        CheckConstraint('shard_count >= 1', name='check_shard_count_positive'),
     )
 
     location = relationship("Location", back_populates="stock_levels")
     product = relationship("Product", back_populates="stock_levels")
 
 
+class StockShard(Base):
+    __tablename__ = 'stock_shards'
+
+    # Escrow bucket of a hot SKU: concurrent sales claim different shards
+    # instead of all waiting on the single stock_levels row.
+    id = Column(Integer, primary_key=True, index=True)
+    location_id = Column(Integer, ForeignKey('locations.id'), nullable=False)
+    product_id = Column(Integer, ForeignKey('products.id'), nullable=False)
+    shard_no = Column(Integer, nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('location_id', 'product_id', 'shard_no', name='uq_stock_shard'),
+        CheckConstraint('quantity >= 0', name='check_shard_quantity_positive'),
+    )
+
+
+class StockReservation(Base):
+    __tablename__ = 'stock_reservations'
+
+    # Periodic snapshot of the in-memory reservation ledger (reservations.py),
+    # reloaded on startup so open carts survive a restart.
+    reservation_id = Column(String(64), primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    location_id = Column(Integer, ForeignKey('locations.id'), nullable=False)
+    employee_id = Column(Integer, ForeignKey('employees.id'), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint('quantity > 0', name='check_reservation_quantity_positive'),
+    )
+
+
 class StockTransfer(Base):
     __tablename__ = 'stock_transfers'
 
@@ -117,16 +159,33 @@ class Transaction(Base):
     employee_id = Column(Integer, ForeignKey('employees.id'), nullable=False)
     total_amount = Column(Numeric(10, 2), nullable=False)
     status = Column(String(20), default='completed')
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Set client-side too so the value is known after flush: details copy it (see TransactionDetail)
+    created_at = Column(DateTime(timezone=True), default=lambda: datetime.now(timezone.utc), server_default=func.now())
+    # Id of the inserting database transaction (xid8 as bigint), the incremental Parquet
+    # export cursor. created_at is the sale time, which offline batches backdate; NULL on
+    # rows older than this column.
+    recorded_xid = Column(BigInteger, server_default=text("(pg_current_xact_id()::text)::bigint"))
 
     __table_args__ = (
         CheckConstraint('total_amount >= 0', name='check_total_amount_positive'), # Assuming no negative total sales
+        # Daily stats / recent transactions / analytics: location + status + time range.
+        # total_amount is INCLUDEd so revenue sums are index-only scans.
+        Index('ix_transactions_location_status_created', 'selling_location_id', 'status', 'created_at',
+              postgresql_include=['total_amount']),
+        # Customer purchase history (recommendation_engine); most sales are anonymous
+        Index('ix_transactions_customer_created', 'customer_id', 'created_at',
+              postgresql_where=text('customer_id IS NOT NULL')),
+        # Incremental Parquet export window (parquet_export.py)
+        Index('ix_transactions_recorded_xid', 'recorded_xid'),
     )
 
     selling_location = relationship("Location", back_populates="transactions")
     customer = relationship("Customer", back_populates="transactions")
     employee = relationship("Employee", back_populates="transactions")
-    details = relationship("TransactionDetail", back_populates="transaction", cascade="all, delete-orphan")
+    # Joined on the date too, so loading lines only probes the parent's month partition
+    details = relationship("TransactionDetail", back_populates="transaction", cascade="all, delete-orphan",
+        primaryjoin="and_(Transaction.id == foreign(TransactionDetail.transaction_id), "
+                "Transaction.created_at == foreign(TransactionDetail.transaction_created_at))")
 
 
 class TransactionDetail(Base):
@@ -138,17 +197,108 @@ class TransactionDetail(Base):
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10, 2), nullable=False)
     unit_cost_at_sale = Column(Numeric(10, 2), nullable=False) # Capture cost at time of sale for margin analysis
+    # Copy of the parent's created_at: the partition key when transactions are partitioned
+    # (partitioning.py), and lets detail-side queries bound dates without the join.
+    transaction_created_at = Column(DateTime(timezone=True), nullable=False)
 
     __table_args__ = (
         CheckConstraint('quantity > 0', name='check_transaction_detail_quantity_positive'),
         CheckConstraint('unit_price >= 0', name='check_transaction_detail_price_positive'),
         CheckConstraint('unit_cost_at_sale >= 0', name='check_transaction_detail_cost_positive'),
+        # Loading a transaction's lines (details relationship, voids, reports)
+        Index('ix_transaction_details_transaction_id', 'transaction_id'),
+        # Per-product sales (top products, forecasting, upsell): covering the line values
+        Index('ix_transaction_details_product_transaction', 'product_id', 'transaction_id',
+              postgresql_include=['quantity', 'unit_price', 'unit_cost_at_sale']),
     )
 
-    transaction = relationship("Transaction", back_populates="details")
+    transaction = relationship("Transaction", back_populates="details",
+        primaryjoin="and_(Transaction.id == foreign(TransactionDetail.transaction_id), "
+                "Transaction.created_at == foreign(TransactionDetail.transaction_created_at))")
     product = relationship("Product", back_populates="transaction_details")
 
 
+@event.listens_for(TransactionDetail, "before_insert")
+def _fill_transaction_created_at(mapper, connection, target):
+    # Details added through Transaction.details get the date from the relationship;
+    # this covers rows built with a bare transaction_id.
+    if target.transaction_created_at is not None:
+        return
+    session = object_session(target)
+    parent = session.identity_map.get(identity_key(Transaction, target.transaction_id)) if session else None
+    if parent is not None and 'created_at' in parent.__dict__:
+        target.transaction_created_at = parent.created_at
+    else:
+        target.transaction_created_at = connection.execute(
+            select(Transaction.created_at).where(Transaction.id == target.transaction_id)
+        ).scalar()
+
+
+class SaleIdempotencyKey(Base):
+    __tablename__ = 'sale_idempotency_keys'
+
+    # Client-generated key sent in the Idempotency-Key header of POST /sales.
+    # Written in the same DB transaction as the sale it identifies.
+    key = Column(String(100), primary_key=True)
+    transaction_id = Column(Integer, ForeignKey('transactions.id', ondelete='CASCADE'), nullable=False)
+    employee_id = Column(Integer, ForeignKey('employees.id'), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    transaction = relationship("Transaction")
+
+    __table_args__ = (
+        # ON DELETE CASCADE from transactions looks keys up by transaction_id
+        Index('ix_sale_idempotency_keys_transaction_id', 'transaction_id'),
+    )
+
+
+# --- Reporting Rollups ---
+# Maintained in the same DB transaction as the sale / cancel / void (rollup.py).
+# `day` is the store's local day. Each sale writes a random `bucket` so concurrent
+# checkouts of one SKU do not queue on a single row lock; readers sum the buckets.
+
+class DailySalesRollup(Base):
+    __tablename__ = 'daily_sales_rollup'
+
+    location_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey('products.id'), primary_key=True)
+    bucket = Column(SmallInteger, primary_key=True, default=0)
+    qty = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+    tx_count = Column(Integer, nullable=False, default=0) # Transactions containing the product
+
+    __table_args__ = (
+        # Forecasting reads one product's history at one location
+        Index('ix_daily_sales_rollup_product_location_day', 'product_id', 'location_id', 'day'),
+    )
+
+
+class DailyLocationRollup(Base):
+    __tablename__ = 'daily_location_rollup'
+
+    # Per-store totals: transaction counts cannot be summed from the product rows
+    location_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    bucket = Column(SmallInteger, primary_key=True, default=0)
+    qty = Column(Integer, nullable=False, default=0)
+    revenue = Column(Numeric(14, 2), nullable=False, default=0)
+    cost = Column(Numeric(14, 2), nullable=False, default=0)
+    tx_count = Column(Integer, nullable=False, default=0)
+    last_transaction_id = Column(Integer, nullable=True) # Newest sale counted; part of the change watermark
+
+
+class HeavyHitterSketch(Base):
+    __tablename__ = 'heavy_hitter_sketches'
+
+    # Periodic snapshot of heavy_hitters' in-memory sketches (JSON), for warm restarts
+    location_id = Column(Integer, ForeignKey('locations.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    payload = Column(Text, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 # --- Users/Security ---
 
 class Employee(Base):
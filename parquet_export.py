@@ -0,0 +1,290 @@
+from sqlalchemy import select, or_, text
+from datetime import date, datetime, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+import json
+import logging
+import os
+import shutil
+import threading
+
+import crud
+import database
+import exports
+from database import SessionLocal
+from models import Transaction, TransactionDetail, Product, Location, Category
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Columnar export of sales facts (transaction lines x headers x products) for offline
+# analysis. Files are hive-partitioned by UTC month and location:
+#   <dir>/month=2026-07/location=3/part-<from>-<to>.parquet
+# and written from Arrow record batches, one server-side cursor batch at a time.
+#
+# sales_facts/ is the incrementally maintained dataset. Its cursor is the id of the
+# inserting database transaction (Transaction.recorded_xid), not a clock: each run
+# cuts at the oldest transaction still in flight (the xmin of its snapshot), so every
+# sale below the cut has committed or rolled back, and appends the sales between the
+# watermark (_watermark.json) and the cut. A sale that commits late, or an offline
+# batch synced with old client timestamps, lands above the last cut and is exported
+# on the next run (into its sale month's partition). Lines of already-exported sales
+# that are voided or cancelled later are picked up by `refresh_month`.
+PARQUET_EXPORT_DIR = os.getenv("PARQUET_EXPORT_DIR", "exports")
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+
+SALES_FACTS_DIR = os.path.join(PARQUET_EXPORT_DIR, "sales_facts")
+DIMENSIONS_DIR = os.path.join(PARQUET_EXPORT_DIR, "dimensions") # locations / categories, rewritten each run
+WATERMARK_FILE = "_watermark.json"
+
+SALES_FACTS_SCHEMA = pa.schema([
+    ("transaction_id", pa.int64()),
+    ("created_at", pa.timestamp("us", tz="UTC")),
+    ("location_id", pa.int32()),
+    ("employee_id", pa.int32()),
+    ("customer_id", pa.int32()),
+    ("status", pa.string()),
+    ("detail_id", pa.int64()),
+    ("product_id", pa.int32()),
+    ("product_name", pa.string()),
+    ("category_id", pa.int32()),
+    ("quantity", pa.int32()),
+    ("unit_price", pa.decimal128(10, 2)),
+    ("unit_cost_at_sale", pa.decimal128(10, 2)),
+])
+
+_COLUMNS = {
+    "transaction_id": Transaction.id,
+    "created_at": Transaction.created_at,
+    "location_id": Transaction.selling_location_id,
+    "employee_id": Transaction.employee_id,
+    "customer_id": Transaction.customer_id,
+    "status": Transaction.status,
+    "detail_id": TransactionDetail.id,
+    "product_id": TransactionDetail.product_id,
+    "product_name": Product.name,
+    "category_id": Product.category_id,
+    "quantity": TransactionDetail.quantity,
+    "unit_price": TransactionDetail.unit_price,
+    "unit_cost_at_sale": TransactionDetail.unit_cost_at_sale,
+}
+
+_export_lock = threading.Lock() # One writer per dataset in this process
+
+def snapshot_cut(db) -> int:
+    """
+    Oldest transaction id still in flight for db's server: every id below it has
+    committed or rolled back, and stays visible (or gone) for later statements.
+    """
+    return db.execute(text("SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint")).scalar()
+
+def sales_facts_query(start: datetime = None, end: datetime = None, location_ids=None,
+                      xid_from: int = None, xid_until: int = None):
+    """
+    Sales facts created in [start, end) by database transactions in [xid_from, xid_until).
+    """
+    query = (
+        select(*[_COLUMNS[field.name].label(field.name) for field in SALES_FACTS_SCHEMA])
+        .join(TransactionDetail, crud.details_join())
+        .join(Product, Product.id == TransactionDetail.product_id)
+    )
+    if start is not None:
+        query = query.where(Transaction.created_at >= start, TransactionDetail.transaction_created_at >= start)
+    if end is not None:
+        query = query.where(Transaction.created_at < end, TransactionDetail.transaction_created_at < end)
+    if location_ids is not None:
+        query = query.where(Transaction.selling_location_id.in_(location_ids))
+    if xid_from is not None:
+        query = query.where(Transaction.recorded_xid >= xid_from)
+    if xid_until is not None:
+        # Rows from before transactions.recorded_xid existed count as recorded before any export
+        query = query.where(or_(Transaction.recorded_xid < xid_until, Transaction.recorded_xid.is_(None)))
+    return query.order_by(Transaction.created_at, Transaction.id, TransactionDetail.id)
+
+def _stamp(value: datetime) -> str:
+    return value.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ") if value else "start"
+
+def _partition_dir(out_dir: str, created_at: datetime, location_id: int) -> str:
+    created_at = created_at.astimezone(timezone.utc)
+    return os.path.join(out_dir, f"month={created_at:%Y-%m}", f"location={location_id}")
+
+def write_sales_facts(out_dir: str, start: datetime = None, end: datetime = None, location_ids=None,
+                      xid_from: int = None, xid_until: int = None, db=None):
+    """
+    Writes the sales facts of sales_facts_query(...) under out_dir, one file per
+    (month, location) named after the range (the transaction id one when given).
+    Files appear only once complete (written as .tmp, renamed at the end); a failed
+    run leaves no partial files. Reads through db when given (see export_incremental).
+    Returns {"files": [...], "rows": n}.
+    """
+    if xid_until is not None:
+        file_name = f"part-xid{xid_from or 0}-{xid_until}.parquet"
+    else:
+        file_name = f"part-{_stamp(start)}-{_stamp(end)}.parquet"
+    created_index = SALES_FACTS_SCHEMA.get_field_index("created_at")
+    location_index = SALES_FACTS_SCHEMA.get_field_index("location_id")
+    writers = {}
+    rows = 0
+    try:
+        query = sales_facts_query(start, end, location_ids, xid_from, xid_until)
+        for batch in exports.iter_batches(query, db=db):
+            groups = {}
+            for row in batch:
+                groups.setdefault(_partition_dir(out_dir, row[created_index], row[location_index]), []).append(row)
+            for directory, group in groups.items():
+                if directory not in writers:
+                    os.makedirs(directory, exist_ok=True)
+                    writers[directory] = pq.ParquetWriter(
+                        os.path.join(directory, file_name + ".tmp"), SALES_FACTS_SCHEMA, compression=PARQUET_COMPRESSION
+                    )
+                columns = list(zip(*group))
+                writers[directory].write_batch(pa.RecordBatch.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, SALES_FACTS_SCHEMA)],
+                    schema=SALES_FACTS_SCHEMA
+                ))
+                rows += len(group)
+    except Exception:
+        for directory, writer in writers.items():
+            writer.close()
+            os.remove(os.path.join(directory, file_name + ".tmp"))
+        raise
+
+    files = []
+    for directory, writer in writers.items():
+        writer.close()
+        path = os.path.join(directory, file_name)
+        os.replace(path + ".tmp", path)
+        files.append(path)
+    logger.info(f"Wrote {rows} sales facts to {len(files)} Parquet files under {out_dir}.")
+    return {"files": files, "rows": rows}
+
+DIMENSION_SCHEMAS = {
+    "locations": (Location, pa.schema([("id", pa.int32()), ("name", pa.string()), ("location_type", pa.string()), ("timezone", pa.string())])),
+    "categories": (Category, pa.schema([("id", pa.int32()), ("name", pa.string())])),
+}
+
+def export_dimensions(out_dir: str = DIMENSIONS_DIR):
+    """
+    Snapshots the small lookup tables the facts refer to (names, store timezones).
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    db = SessionLocal()
+    try:
+        for name, (model, schema) in DIMENSION_SCHEMAS.items():
+            rows = db.execute(select(*[getattr(model, field.name) for field in schema])).all()
+            table = pa.Table.from_pylist([dict(row._mapping) for row in rows], schema=schema)
+            path = os.path.join(out_dir, f"{name}.parquet")
+            pq.write_table(table, path + ".tmp", compression=PARQUET_COMPRESSION)
+            os.replace(path + ".tmp", path)
+    finally:
+        db.close()
+
+def read_watermark(out_dir: str = SALES_FACTS_DIR):
+    """
+    Transaction id the dataset is exported up to (exclusive), None before the first run.
+    """
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["exported_xid"]
+
+def _write_watermark(out_dir: str, until: int):
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"exported_xid": until, "exported_at": datetime.now(timezone.utc).isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+def export_incremental(out_dir: str = SALES_FACTS_DIR):
+    """
+    Appends the sales of transactions between the watermark and the current snapshot
+    cut (everything below the cut on the first run) and moves the watermark to the
+    cut. Returns {"files", "rows", "from", "until"} (transaction ids).
+    """
+    with _export_lock:
+        start = read_watermark(out_dir)
+        # Cut and read on the same session: a replica only guarantees that the
+        # transactions below its own cut are visible to it
+        db = database.read_session()
+        try:
+            until = snapshot_cut(db)
+            if start is not None and start >= until:
+                return {"files": [], "rows": 0, "from": start, "until": start}
+            result = write_sales_facts(out_dir, xid_from=start, xid_until=until, db=db)
+        finally:
+            db.close()
+        if out_dir == SALES_FACTS_DIR:
+            export_dimensions()
+        _write_watermark(out_dir, until)
+        return {**result, "from": start, "until": until}
+
+def refresh_month(month: date, out_dir: str = SALES_FACTS_DIR):
+    """
+    Rewrites one month of the incremental dataset (up to the watermark) from the
+    database, so later cancels and voids show up in the files.
+    """
+    with _export_lock:
+        until = read_watermark(out_dir)
+        start = datetime(month.year, month.month, 1, tzinfo=timezone.utc)
+        end = datetime(month.year + month.month // 12, month.month % 12 + 1, 1, tzinfo=timezone.utc)
+        if until is None:
+            return {"files": [], "rows": 0}
+        month_dir = os.path.join(out_dir, f"month={start:%Y-%m}")
+        staging = os.path.join(out_dir, f".refresh-{start:%Y-%m}")
+        shutil.rmtree(staging, ignore_errors=True)
+        db = database.read_session()
+        if snapshot_cut(db) < until:
+            # Replica still behind the watermark: it may not see every exported sale yet
+            db.close()
+            db = SessionLocal()
+        try:
+            result = write_sales_facts(staging, start, end, xid_until=until, db=db)
+        finally:
+            db.close()
+        shutil.rmtree(month_dir, ignore_errors=True)
+        if os.path.isdir(os.path.join(staging, f"month={start:%Y-%m}")):
+            os.replace(os.path.join(staging, f"month={start:%Y-%m}"), month_dir)
+        shutil.rmtree(staging, ignore_errors=True)
+        result["files"] = [path.replace(staging, out_dir, 1) for path in result["files"]]
+        return result
+
+def range_dir(date_from: date, date_to: date, out_dir: str = PARQUET_EXPORT_DIR) -> str:
+    return os.path.join(out_dir, "ranges", f"{date_from}_{date_to}")
+
+def export_date_range(date_from: date, date_to: date, location_ids=None, tz: str = None, out_dir: str = None):
+    """
+    One-off export of the local days date_from..date_to into its own directory
+    (ranges/<from>_<to>, replaced on re-run), separate from the incremental dataset.
+    """
+    if date_to < date_from:
+        raise ValueError("date_to is before date_from")
+    start, end = crud.local_day_range(tz or crud.STORE_TIMEZONE, (date_to - date_from).days + 1, today=date_to)
+    out_dir = out_dir or range_dir(date_from, date_to)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    return write_sales_facts(out_dir, start, end, location_ids)
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    if args[:1] == ["incremental"]:
+        result = export_incremental()
+        print(f"Exported {result['rows']} rows (transactions {result['from'] or 'start'} .. {result['until']}).")
+    elif args[:1] == ["refresh"] and len(args) == 2:
+        result = refresh_month(date.fromisoformat(args[1] + "-01"))
+        print(f"Rewrote {result['rows']} rows for {args[1]}.")
+    elif args[:1] == ["range"] and len(args) in (3, 4):
+        location_ids = [int(args[3])] if len(args) == 4 else None
+        tz = crud.STORE_TIMEZONE
+        if location_ids:
+            db = SessionLocal()
+            try:
+                tz = crud.get_reporting_timezone(db, location_ids)
+            finally:
+                db.close()
+        result = export_date_range(date.fromisoformat(args[1]), date.fromisoformat(args[2]), location_ids, tz)
+        print(f"Exported {result['rows']} rows to {len(result['files'])} files.")
+    else:
+        print("Usage: python parquet_export.py [incremental | refresh YYYY-MM | range FROM_DAY TO_DAY [LOCATION_ID]]")
+        sys.exit(1)
@@ -0,0 +1,246 @@
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from datetime import date, datetime, timezone
+import logging
+import os
+import threading
+
+from database import engine
+from models import Base
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Optional monthly range partitioning of the sales history.
+# transactions is partitioned on created_at; transaction_details carries its parent's
+# created_at (transaction_created_at) and is partitioned on it, so a month of headers
+# and its lines live in matching partitions. Queries that bound created_at (and
+# transaction_created_at on the details side) only touch the months they need, and an
+# old month is dropped from the hot tables with a metadata-only DETACH.
+PARTITION_TRANSACTIONS = os.getenv("PARTITION_TRANSACTIONS", "false").lower() == "true"
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+PARTITION_CHECK_SECONDS = float(os.getenv("PARTITION_CHECK_SECONDS", "86400"))
+
+# Partitioned table -> partition key. Details come first: they reference transactions.
+PARTITIONED_TABLES = {
+    "transaction_details": "transaction_created_at",
+    "transactions": "created_at",
+}
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02d}"
+
+def _bound(month: date) -> str:
+    # Bounds are UTC midnights so they do not depend on the session TimeZone
+    return f"'{month.isoformat()} 00:00:00+00'"
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    return conn.execute(text(
+        "SELECT 1 FROM pg_partitioned_table pt JOIN pg_class c ON c.oid = pt.partrelid "
+        "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+    ), {"table": table}).scalar() is not None
+
+def list_partitions(conn: Connection, table: str) -> list[str]:
+    rows = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :table AND pg_table_is_visible(p.oid) ORDER BY c.relname"
+    ), {"table": table}).all()
+    return [row.relname for row in rows]
+
+def create_month_partitions(conn: Connection, month: date):
+    """
+    Creates the partitions of `month` for every partitioned table (if missing).
+    """
+    for table in PARTITIONED_TABLES:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} PARTITION OF {table} "
+            f"FOR VALUES FROM ({_bound(month)}) TO ({_bound(add_months(month, 1))})"
+        ))
+
+def ensure_future_partitions(bind: Engine = engine, months_ahead: int = PARTITION_MONTHS_AHEAD, today: date = None):
+    """
+    Makes sure partitions exist from the current month through `months_ahead` months
+    ahead. There is no DEFAULT partition (it would block concurrent detach), so a
+    sale dated past the last partition fails: run this at startup and daily.
+    Returns the months checked.
+    """
+    current = month_start(today or datetime.now(timezone.utc))
+    months = [add_months(current, offset) for offset in range(months_ahead + 1)]
+    with bind.begin() as conn:
+        if not is_partitioned(conn, "transactions"):
+            return []
+        for month in months:
+            create_month_partitions(conn, month)
+    return months
+
+def detach_month(bind: Engine, month: date, drop: bool = False):
+    """
+    Detaches one month from the live tables (CONCURRENTLY: sales keep flowing).
+    Details first, so no remaining detail row references the detached headers.
+    The detached tables are kept for archiving unless drop=True.
+    Idempotency keys of that month are purged: their sales are no longer replayable.
+    """
+    month = month_start(month)
+    with bind.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT") # CONCURRENTLY cannot run in a transaction
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, month)
+            if name not in list_partitions(conn, table):
+                continue
+            conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name} CONCURRENTLY"))
+            if table == "transaction_details":
+                # A detached lines table must not keep pinning the headers it is archived with
+                conn.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT IF EXISTS transaction_details_transaction_fkey"))
+            logger.info(f"Detached partition {name}.")
+            if drop:
+                conn.execute(text(f"DROP TABLE {name}"))
+        conn.execute(text(
+            "DELETE FROM sale_idempotency_keys WHERE created_at < :end"
+        ), {"end": datetime.combine(add_months(month, 1), datetime.min.time(), timezone.utc)})
+
+def _constraint_defs(conn: Connection, table: str, contype: str, exclude_ref: str = None):
+    rows = conn.execute(text(
+        "SELECT conname, pg_get_constraintdef(oid) AS definition, confrelid::regclass::text AS ref "
+        "FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = :contype"
+    ), {"table": table, "contype": contype}).all()
+    return [(row.conname, row.definition) for row in rows if row.ref != exclude_ref]
+
+def migrate_to_partitioned(bind: Engine = engine, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    """
+    Converts transactions / transaction_details into monthly partitioned tables,
+    copying existing rows (transaction_created_at is filled from the parent).
+    Runs in one transaction: it either completes or leaves the old tables untouched.
+    Rewrites both tables, so run it in a maintenance window on a large database.
+    No-op when already partitioned.
+    """
+    with bind.begin() as conn:
+        if is_partitioned(conn, "transactions"):
+            logger.info("Transactions already partitioned.")
+            return False
+
+        # Partitioned tables need the partition key in their PK and in FKs pointing
+        # at them: idempotency keys lose their FK (purged on detach instead).
+        for name, _ in _constraint_defs(conn, "sale_idempotency_keys", "f"):
+            if name == "sale_idempotency_keys_transaction_id_fkey":
+                conn.execute(text(f"ALTER TABLE sale_idempotency_keys DROP CONSTRAINT {name}"))
+
+        conn.execute(text("ALTER TABLE transaction_details RENAME TO transaction_details_unpartitioned"))
+        conn.execute(text("ALTER TABLE transactions RENAME TO transactions_unpartitioned"))
+        # Databases created before the column existed
+        conn.execute(text("ALTER TABLE transaction_details_unpartitioned ADD COLUMN IF NOT EXISTS transaction_created_at TIMESTAMP WITH TIME ZONE"))
+        header_fks = _constraint_defs(conn, "transactions_unpartitioned", "f")
+        detail_fks = _constraint_defs(conn, "transaction_details_unpartitioned", "f", exclude_ref="transactions_unpartitioned")
+
+        conn.execute(text(
+            "CREATE TABLE transactions (LIKE transactions_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (created_at)"
+        ))
+        conn.execute(text("ALTER TABLE transactions ALTER COLUMN created_at SET NOT NULL"))
+        conn.execute(text(
+            "CREATE TABLE transaction_details (LIKE transaction_details_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (transaction_created_at)"
+        ))
+        conn.execute(text("ALTER TABLE transaction_details ALTER COLUMN transaction_created_at SET NOT NULL"))
+
+        # The id sequences must outlive the old tables
+        for table in PARTITIONED_TABLES:
+            conn.execute(text(
+                f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id"
+            ))
+
+        first = conn.execute(text("SELECT min(created_at) FROM transactions_unpartitioned")).scalar()
+        month = month_start(first or datetime.now(timezone.utc))
+        last = add_months(month_start(datetime.now(timezone.utc)), months_ahead)
+        while month <= last:
+            create_month_partitions(conn, month)
+            month = add_months(month, 1)
+
+        columns = ", ".join(c.name for c in Base.metadata.tables["transactions"].columns)
+        conn.execute(text(f"INSERT INTO transactions ({columns}) SELECT {columns} FROM transactions_unpartitioned"))
+        detail_columns = [c.name for c in Base.metadata.tables["transaction_details"].columns if c.name != "transaction_created_at"]
+        conn.execute(text(
+            f"INSERT INTO transaction_details ({', '.join(detail_columns)}, transaction_created_at) "
+            f"SELECT {', '.join('d.' + c for c in detail_columns)}, t.created_at "
+            "FROM transaction_details_unpartitioned d JOIN transactions_unpartitioned t ON t.id = d.transaction_id"
+        ))
+
+        conn.execute(text("DROP TABLE transaction_details_unpartitioned"))
+        conn.execute(text("DROP TABLE transactions_unpartitioned"))
+
+        # Keys and indexes are built after the copy (and once the old names are free)
+        conn.execute(text("ALTER TABLE transactions ADD PRIMARY KEY (id, created_at)"))
+        conn.execute(text("ALTER TABLE transaction_details ADD PRIMARY KEY (id, transaction_created_at)"))
+
+        for name, definition in header_fks:
+            conn.execute(text(f"ALTER TABLE transactions ADD CONSTRAINT {name} {definition}"))
+        for name, definition in detail_fks:
+            conn.execute(text(f"ALTER TABLE transaction_details ADD CONSTRAINT {name} {definition}"))
+        conn.execute(text(
+            "ALTER TABLE transaction_details ADD CONSTRAINT transaction_details_transaction_fkey "
+            "FOREIGN KEY (transaction_id, transaction_created_at) REFERENCES transactions (id, created_at)"
+        ))
+
+        # Model indexes become partitioned indexes (one per partition, created automatically)
+        for table in PARTITIONED_TABLES:
+            for index in Base.metadata.tables[table].indexes:
+                index.create(conn)
+
+    logger.info("Transactions and transaction_details are now partitioned by month.")
+    return True
+
+class PartitionMaintainer:
+    """
+    Background thread keeping PARTITION_MONTHS_AHEAD future months created.
+    """
+
+    def __init__(self, bind: Engine = engine, interval: float = PARTITION_CHECK_SECONDS):
+        self.bind = bind
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not PARTITION_TRANSACTIONS or self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="partition-maintainer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                ensure_future_partitions(self.bind)
+            except Exception as e:
+                logger.error(f"Partition maintenance failed: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+maintainer = PartitionMaintainer()
+
+if __name__ == "__main__":
+    import sys
+    command = sys.argv[1] if len(sys.argv) > 1 else "ensure"
+    if command == "migrate":
+        migrate_to_partitioned()
+    elif command == "ensure":
+        print(f"Partitions ensured for: {ensure_future_partitions()}")
+    elif command == "detach" and len(sys.argv) > 2:
+        detach_month(engine, date.fromisoformat(sys.argv[2] + "-01"), drop="--drop" in sys.argv)
+    else:
+        print("Usage: python partitioning.py [migrate | ensure | detach YYYY-MM [--drop]]")
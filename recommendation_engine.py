@@ -51,7 +51,7 @@ def generate_upsell_offer(db: Session, location_id: int, customer_id: int, curre
             favorite_stats = db.query(
                 TransactionDetail.product_id, 
                 func.count(TransactionDetail.product_id).label('count')
-            ).join(Transaction).filter(
+            ).join(Transaction, crud.details_join()).filter(
                 Transaction.customer_id == customer_id
             ).group_by(
                 TransactionDetail.product_id
@@ -0,0 +1,270 @@
+from sqlalchemy.orm import Session
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import crud
+from database import SessionLocal
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Open carts hold stock through reservations kept in an in-memory ledger.
+# Holds expire automatically after their TTL unless extended, and the ledger is
+# snapshotted to stock_reservations periodically so a restart does not drop them.
+# The ledger is per worker process: run one worker (or pin terminals) per location.
+# Each worker's snapshot only writes the holds it changed, so workers never
+# overwrite or delete each other's rows.
+DEFAULT_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "900"))
+MAX_TTL_SECONDS = int(os.getenv("RESERVATION_MAX_TTL_SECONDS", "3600"))
+PERSIST_INTERVAL_SECONDS = float(os.getenv("RESERVATION_PERSIST_SECONDS", "10"))
+
+def _now():
+    return datetime.now(timezone.utc)
+
+class Reservation:
+    def __init__(self, reservation_id: str, location_id: int, items: dict, employee_id: int, expires_at: datetime):
+        self.id = reservation_id
+        self.location_id = location_id
+        self.items = items # {product_id: quantity}
+        self.employee_id = employee_id
+        self.expires_at = expires_at
+
+    def to_dict(self):
+        return {
+            "reservation_id": self.id,
+            "location_id": self.location_id,
+            "items": [{"product_id": pid, "quantity": qty} for pid, qty in self.items.items()],
+            "expires_at": self.expires_at
+        }
+
+class ReservationLedger:
+    """
+    Thread-safe in-memory ledger of stock holds, with per-(location, product)
+    totals so availability checks cost a dict lookup.
+    """
+
+    def __init__(self):
+        self._reservations = {}
+        self._held = {} # (location_id, product_id) -> reserved quantity
+        self._changed = set() # Reservation ids to write (or delete) on the next persist
+        self._lock = threading.RLock()
+        self.version = 0 # Bumped on every change
+
+    def _add(self, reservation: Reservation):
+        self._reservations[reservation.id] = reservation
+        self._changed.add(reservation.id)
+        for pid, qty in reservation.items.items():
+            key = (reservation.location_id, pid)
+            self._held[key] = self._held.get(key, 0) + qty
+
+    def _remove(self, reservation_id: str):
+        reservation = self._reservations.pop(reservation_id, None)
+        if reservation:
+            self._changed.add(reservation_id)
+            for pid, qty in reservation.items.items():
+                key = (reservation.location_id, pid)
+                self._held[key] -= qty
+                if self._held[key] <= 0:
+                    del self._held[key]
+        return reservation
+
+    def held(self, location_id: int, product_ids, exclude: str = None):
+        """
+        Quantities held at a location for the given products by reservations other than `exclude`.
+        """
+        with self._lock:
+            held = {pid: self._held.get((location_id, pid), 0) for pid in product_ids}
+            own = self._reservations.get(exclude) if exclude else None
+            if own and own.location_id == location_id:
+                for pid, qty in own.items.items():
+                    if pid in held:
+                        held[pid] -= qty
+            return {pid: qty for pid, qty in held.items() if qty > 0}
+
+    def reserved_for(self, location_id: int):
+        with self._lock:
+            return {pid: qty for (loc, pid), qty in self._held.items() if loc == location_id}
+
+    def get(self, reservation_id: str):
+        with self._lock:
+            reservation = self._reservations.get(reservation_id)
+            if reservation and reservation.expires_at <= _now():
+                self._remove(reservation_id)
+                self.version += 1
+                return None
+            return reservation
+
+    def reserve(self, db: Session, location_id: int, items: dict, employee_id: int = None,
+                ttl_seconds: int = DEFAULT_TTL_SECONDS, reservation_id: str = None):
+        """
+        Creates a hold (or replaces the items of an existing one, as the cart changes).
+        Availability = on-hand - held by other carts; raises ValueError if short.
+        """
+        if not items:
+            raise ValueError("Reservation has no items.")
+        if any(qty <= 0 for qty in items.values()):
+            raise ValueError("Reserved quantities must be positive.")
+        ttl_seconds = min(ttl_seconds, MAX_TTL_SECONDS)
+
+        on_hand = crud.get_on_hand_for_products(db, location_id, items.keys())
+        with self._lock:
+            existing = self._reservations.get(reservation_id) if reservation_id else None
+            if existing and existing.location_id != location_id:
+                raise ValueError("Reservation belongs to another location.")
+
+            held = self.held(location_id, items.keys(), exclude=reservation_id)
+            for pid, qty in items.items():
+                available = on_hand.get(pid, 0) - held.get(pid, 0)
+                if available < qty:
+                    raise ValueError(f"Insufficient stock for product {pid} at location {location_id}. Available: {available}, Requested: {qty}")
+
+            if existing:
+                self._remove(reservation_id)
+            reservation = Reservation(
+                reservation_id or uuid.uuid4().hex,
+                location_id,
+                dict(items),
+                employee_id,
+                _now() + timedelta(seconds=ttl_seconds)
+            )
+            self._add(reservation)
+            self.version += 1
+            return reservation
+
+    def extend(self, reservation_id: str, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+        with self._lock:
+            reservation = self.get(reservation_id)
+            if not reservation:
+                raise ValueError("Reservation not found or expired.")
+            reservation.expires_at = _now() + timedelta(seconds=min(ttl_seconds, MAX_TTL_SECONDS))
+            self._changed.add(reservation_id)
+            self.version += 1
+            return reservation
+
+    def release(self, reservation_id: str):
+        with self._lock:
+            reservation = self._remove(reservation_id)
+            if reservation:
+                self.version += 1
+            return reservation
+
+    def expire(self):
+        """
+        Drops every hold past its TTL. Returns how many were dropped.
+        """
+        now = _now()
+        with self._lock:
+            expired = [rid for rid, r in self._reservations.items() if r.expires_at <= now]
+            for rid in expired:
+                self._remove(rid)
+            if expired:
+                self.version += 1
+            return len(expired)
+
+    def persist(self, db: Session):
+        """
+        Writes the holds created, changed or released since the last call and
+        drops expired rows.
+        """
+        with self._lock:
+            changed = self._changed
+            self._changed = set()
+            rows = [{
+                'reservation_id': r.id,
+                'product_id': pid,
+                'location_id': r.location_id,
+                'employee_id': r.employee_id,
+                'quantity': qty,
+                'expires_at': r.expires_at
+            } for r in (self._reservations.get(rid) for rid in changed) if r for pid, qty in r.items.items()]
+        try:
+            crud.save_stock_reservations(db, changed, rows, _now())
+            db.commit()
+        except Exception:
+            db.rollback()
+            with self._lock:
+                self._changed |= changed
+            raise
+
+    def restore(self, db: Session):
+        rows = crud.get_active_stock_reservations(db, _now())
+        with self._lock:
+            self._reservations.clear()
+            self._held.clear()
+            grouped = {}
+            for row in rows:
+                reservation = grouped.get(row.reservation_id)
+                if not reservation:
+                    reservation = grouped[row.reservation_id] = Reservation(
+                        row.reservation_id, row.location_id, {}, row.employee_id, row.expires_at
+                    )
+                reservation.items[row.product_id] = row.quantity
+            for reservation in grouped.values():
+                self._add(reservation)
+            self._changed.clear() # Already in the table
+            self.version += 1
+        logger.info(f"Restored {len(grouped)} stock reservations.")
+
+ledger = ReservationLedger()
+
+def may_manage(reservation: Reservation, employee) -> bool:
+    """
+    Whether `employee` may extend, change or release the hold: its creator, staff
+    selling at its location, or a super admin.
+    """
+    return (
+        reservation.employee_id == employee.id
+        or employee.role == 'super_admin'
+        or employee.assigned_location_id == reservation.location_id
+    )
+
+class ReservationKeeper:
+    """
+    Background thread that expires holds and snapshots the ledger every `interval` seconds.
+    """
+
+    def __init__(self, session_factory=SessionLocal, interval: float = PERSIST_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        db = self.session_factory()
+        try:
+            ledger.restore(db)
+        except Exception as e:
+            logger.error(f"Reservation restore failed: {e}")
+        finally:
+            db.close()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reservation-keeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self._persist()
+
+    def _persist(self):
+        db = self.session_factory()
+        try:
+            ledger.expire()
+            ledger.persist(db)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Reservation persistence failed: {e}")
+        finally:
+            db.close()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._persist()
+
+keeper = ReservationKeeper()
@@ -0,0 +1,218 @@
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+import logging
+import os
+import random
+
+import crud
+import authorization
+import heavy_hitters
+import events
+from database import SessionLocal
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Incrementally maintained daily rollups (models.DailySalesRollup / DailyLocationRollup).
+# Sales, cancels and voids add their deltas in the same DB transaction, so the rollup
+# commits or rolls back with the sale. `rebuild` recomputes any day range from the
+# raw tables (backfill, or repair after manual edits).
+ROLLUP_BUCKETS = int(os.getenv("ROLLUP_BUCKETS", "4"))
+
+def local_day(db: Session, location_id: int, at: datetime) -> date:
+    """
+    The store-local day a timestamp falls on (naive timestamps are taken as UTC).
+    """
+    facts = authorization.get_location_facts(db, location_id)
+    tz = (facts.timezone if facts else None) or crud.STORE_TIMEZONE
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    return at.astimezone(ZoneInfo(tz)).date()
+
+def _money(value) -> Decimal:
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+def record(db: Session, entries: list[dict], sign: int = 1):
+    """
+    Adds sales to (sign=1) or removes them from (sign=-1) the rollups. Does NOT commit.
+    entries: dicts with location_id, created_at, lines (product_id, quantity,
+             unit_price, unit_cost_at_sale) and, for new sales, transaction_id;
+             each entry counts as one transaction.
+    All entries go out as one multi-row upsert per table.
+    """
+    products = {}
+    locations = {}
+    for entry in entries:
+        day = local_day(db, entry['location_id'], entry['created_at'])
+        bucket = random.randrange(ROLLUP_BUCKETS)
+        location = locations.setdefault((entry['location_id'], day, bucket), {
+            'location_id': entry['location_id'], 'day': day, 'bucket': bucket,
+            'qty': 0, 'revenue': Decimal(0), 'cost': Decimal(0), 'tx_count': 0, 'last_transaction_id': None
+        })
+        location['tx_count'] += sign
+        if entry.get('transaction_id'):
+            location['last_transaction_id'] = max(location['last_transaction_id'] or 0, entry['transaction_id'])
+        seen = set()
+        for line in entry['lines']:
+            quantity = sign * line['quantity']
+            revenue = quantity * _money(line['unit_price'])
+            cost = quantity * _money(line['unit_cost_at_sale'])
+            row = products.setdefault((entry['location_id'], day, line['product_id'], bucket), {
+                'location_id': entry['location_id'], 'day': day, 'product_id': line['product_id'], 'bucket': bucket,
+                'qty': 0, 'revenue': Decimal(0), 'cost': Decimal(0), 'tx_count': 0
+            })
+            row['qty'] += quantity
+            row['revenue'] += revenue
+            row['cost'] += cost
+            if line['product_id'] not in seen:
+                row['tx_count'] += sign
+                seen.add(line['product_id'])
+            location['qty'] += quantity
+            location['revenue'] += revenue
+            location['cost'] += cost
+
+    crud.increment_sales_rollup(db, list(products.values()))
+    crud.increment_location_rollup(db, list(locations.values()))
+    heavy_hitters.stage(db, [(r['location_id'], r['day'], r['product_id'], r['qty']) for r in products.values()])
+
+    # Live KPI deltas, one per store-day
+    deltas = {}
+    for row in locations.values():
+        delta = deltas.setdefault((row['location_id'], row['day']), [Decimal(0), 0])
+        delta[0] += row['revenue']
+        delta[1] += row['tx_count']
+    for (location_id, day), (revenue, tx_count) in deltas.items():
+        publish_kpi(db, location_id, day, revenue, tx_count)
+
+def publish_kpi(db: Session, location_id: int, day: date, revenue, tx_count: int):
+    events.publish(db, events.location_topic(location_id), {
+        "type": "kpi", "location_id": location_id, "day": day.isoformat(),
+        "revenue": float(revenue), "tx_count": tx_count
+    })
+
+def record_sale(db: Session, transaction_id: int, location_id: int, created_at: datetime, lines: list[dict]):
+    record(db, [{'transaction_id': transaction_id, 'location_id': location_id, 'created_at': created_at, 'lines': lines}])
+
+def _detail_lines(details):
+    return [{
+        'product_id': d.product_id, 'quantity': d.quantity,
+        'unit_price': d.unit_price, 'unit_cost_at_sale': d.unit_cost_at_sale
+    } for d in details]
+
+def record_cancel(db: Session, transaction):
+    """
+    Takes a completed transaction (its current lines) out of the rollups.
+    """
+    record(db, [{
+        'location_id': transaction.selling_location_id,
+        'created_at': transaction.created_at,
+        'lines': _detail_lines(transaction.details)
+    }], sign=-1)
+
+def record_void(db: Session, transaction, detail, quantity: int, line_removed: bool):
+    """
+    Takes `quantity` units of one line out of the rollups. The transaction still
+    counts for the store; it stops counting for the product when no line of it is left.
+    """
+    day = local_day(db, transaction.selling_location_id, transaction.created_at)
+    bucket = random.randrange(ROLLUP_BUCKETS)
+    revenue = -quantity * _money(detail.unit_price)
+    cost = -quantity * _money(detail.unit_cost_at_sale)
+    product_left = not line_removed or any(
+        d is not detail and d.product_id == detail.product_id for d in transaction.details
+    )
+    crud.increment_sales_rollup(db, [{
+        'location_id': transaction.selling_location_id, 'day': day, 'product_id': detail.product_id, 'bucket': bucket,
+        'qty': -quantity, 'revenue': revenue, 'cost': cost, 'tx_count': 0 if product_left else -1
+    }])
+    crud.increment_location_rollup(db, [{
+        'location_id': transaction.selling_location_id, 'day': day, 'bucket': bucket,
+        'qty': -quantity, 'revenue': revenue, 'cost': cost, 'tx_count': 0, 'last_transaction_id': None
+    }])
+    heavy_hitters.stage(db, [(transaction.selling_location_id, day, detail.product_id, -quantity)])
+    publish_kpi(db, transaction.selling_location_id, day, revenue, 0)
+
+def rebuild(db: Session, start: date = None, end: date = None):
+    """
+    Recomputes the rollups for days [start, end] (all days when omitted) from
+    transactions / transaction_details, and commits.
+    The rollup tables are locked against concurrent sales meanwhile: a sale that
+    commits before the lock is counted by the rebuild, one that commits after it
+    adds its own delta on top.
+    """
+    params = {'tz': crud.STORE_TIMEZONE, 'start': start or date.min, 'end': end or date.max}
+    local_day_sql = "(t.created_at AT TIME ZONE coalesce(l.timezone, :tz))::date"
+    # Plain timestamp bounds (padded a day for timezone offsets) next to the local-day
+    # test keep the scan to the affected index range / partitions
+    bounds = []
+    if start:
+        params['from_ts'] = datetime.combine(start - timedelta(days=1), datetime.min.time(), timezone.utc)
+        bounds.append("{col} >= :from_ts")
+    if end:
+        params['to_ts'] = datetime.combine(end + timedelta(days=2), datetime.min.time(), timezone.utc)
+        bounds.append("{col} < :to_ts")
+
+    def created_filter(column):
+        return " AND ".join(bound.format(col=column) for bound in bounds) or "TRUE"
+
+    try:
+        db.execute(text("LOCK TABLE daily_sales_rollup, daily_location_rollup IN SHARE ROW EXCLUSIVE MODE"))
+        db.execute(text("DELETE FROM daily_sales_rollup WHERE day BETWEEN :start AND :end"), params)
+        db.execute(text("DELETE FROM daily_location_rollup WHERE day BETWEEN :start AND :end"), params)
+
+        db.execute(text(f"""
+            INSERT INTO daily_sales_rollup (location_id, day, product_id, bucket, qty, revenue, cost, tx_count)
+            SELECT t.selling_location_id, {local_day_sql} AS day, d.product_id, 0,
+                   sum(d.quantity), sum(d.quantity * d.unit_price), sum(d.quantity * d.unit_cost_at_sale),
+                   count(DISTINCT t.id)
+            FROM transactions t
+            JOIN locations l ON l.id = t.selling_location_id
+            JOIN transaction_details d ON d.transaction_id = t.id AND d.transaction_created_at = t.created_at
+            WHERE t.status = 'completed' AND {created_filter('t.created_at')} AND {created_filter('d.transaction_created_at')}
+              AND {local_day_sql} BETWEEN :start AND :end
+            GROUP BY 1, 2, 3
+        """), params)
+        db.execute(text(f"""
+            INSERT INTO daily_location_rollup (location_id, day, bucket, qty, revenue, cost, tx_count, last_transaction_id)
+            SELECT tx.location_id, tx.day, 0, coalesce(p.qty, 0), tx.revenue, coalesce(p.cost, 0), tx.tx_count, tx.last_transaction_id
+            FROM (
+                SELECT t.selling_location_id AS location_id, {local_day_sql} AS day,
+                       sum(t.total_amount) AS revenue, count(*) AS tx_count, max(t.id) AS last_transaction_id
+                FROM transactions t
+                JOIN locations l ON l.id = t.selling_location_id
+                WHERE t.status = 'completed' AND {created_filter('t.created_at')} AND {local_day_sql} BETWEEN :start AND :end
+                GROUP BY 1, 2
+            ) tx
+            LEFT JOIN (
+                SELECT location_id, day, sum(qty) AS qty, sum(cost) AS cost
+                FROM daily_sales_rollup WHERE day BETWEEN :start AND :end
+                GROUP BY 1, 2
+            ) p ON p.location_id = tx.location_id AND p.day = tx.day
+        """), params)
+        db.commit()
+        logger.info(f"Sales rollups rebuilt for {start or 'all'} .. {end or 'all'}.")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Rollup rebuild failed: {e}")
+        raise e
+    heavy_hitters.reconcile(db) # Other processes catch up on their persister's next run
+
+if __name__ == "__main__":
+    import sys
+    args = sys.argv[1:]
+    if not args or args[0] != "rebuild":
+        print("Usage: python rollup.py rebuild [FROM_DAY [TO_DAY]]   (days as YYYY-MM-DD)")
+        sys.exit(1)
+    db = SessionLocal()
+    try:
+        rebuild(
+            db,
+            date.fromisoformat(args[1]) if len(args) > 1 else None,
+            date.fromisoformat(args[2]) if len(args) > 2 else None
+        )
+    finally:
+        db.close()
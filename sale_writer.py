@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from database import SessionLocal
+import service_logic
+import reservations
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Group commit: sales arriving within a few milliseconds of each other share one
+# database transaction (and one WAL flush). Each sale runs in its own SAVEPOINT,
+# so a failing sale is rolled back alone and the others still commit.
+GROUP_COMMIT_ENABLED = os.getenv("SALE_GROUP_COMMIT", "false").lower() == "true"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("SALE_GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("SALE_GROUP_COMMIT_MAX_BATCH", "100"))
+
+_STOP = object()
+
+class _SaleRequest:
+    def __init__(self, args: tuple, future: Future):
+        self.args = args
+        self.future = future
+
+class GroupCommitSaleWriter:
+    """
+    Single background thread that drains queued sales, applies each one inside a
+    savepoint and commits the whole group once, then resolves every waiter.
+    """
+
+    def __init__(self, session_factory=SessionLocal, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="sale-group-commit", daemon=True)
+        self._thread.start()
+        logger.info(f"Group-commit sale writer started (window {self.window * 1000:.1f} ms, max batch {self.max_batch}).")
+
+    def stop(self):
+        if self._thread:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, selling_location_id: int, employee_id: int, items: list[dict], customer_id: int = None, idempotency_key: str = None, reservation_id: str = None) -> Future:
+        """
+        Queues a sale. The returned Future resolves to the committed Transaction
+        (detached, attributes loaded) or raises the sale's own error.
+        """
+        future = Future()
+        self._queue.put(_SaleRequest((selling_location_id, employee_id, items, customer_id, idempotency_key, reservation_id), future))
+        return future
+
+    async def submit_async(self, *args, **kwargs):
+        return await asyncio.wrap_future(self.submit(*args, **kwargs))
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.window
+            stopping = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            self._commit_batch(batch)
+            if stopping:
+                return
+
+    def _commit_batch(self, batch: list):
+        db = self.session_factory()
+        outcomes = []
+        try:
+            for request in batch:
+                savepoint = db.begin_nested()
+                try:
+                    transaction = service_logic.apply_sale(db, *request.args)
+                    db.flush() # Surface constraint errors inside this sale's savepoint
+                    savepoint.commit()
+                    outcomes.append((request, transaction, None))
+                except Exception as e:
+                    savepoint.rollback()
+                    outcomes.append((request, None, e))
+
+            # One commit (one WAL flush) for the whole group
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Group commit of {len(batch)} sales failed: {e}")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+        finally:
+            db.close()
+
+        committed = 0
+        for request, transaction, error in outcomes:
+            if error is not None:
+                request.future.set_exception(error)
+            else:
+                committed += 1
+                reservation_id = request.args[5]
+                if reservation_id:
+                    reservations.ledger.release(reservation_id)
+                request.future.set_result(transaction)
+        logger.info(f"Group commit: {committed}/{len(batch)} sales committed.")
+
+writer = GroupCommitSaleWriter()
@@ -6,6 +6,8 @@ from datetime import datetime
 class Token(BaseModel):
     access_token: str
     token_type: str
+    role: Optional[str] = None
+    assigned_location_id: Optional[int] = None
 
 class TokenData(BaseModel):
     username: Optional[str] = None
@@ -16,6 +18,10 @@ class UserCreate(BaseModel):
     role: str
     target_store_id: int
 
+class UserRoleUpdate(BaseModel):
+    role: str
+    target_store_id: Optional[int] = None # Keep current store if omitted
+
 # --- Store Provisioning ---
 class StoreCreate(BaseModel):
     name: str
@@ -23,6 +29,7 @@ class StoreCreate(BaseModel):
     address: str
     tax_id: str
     contact_info: str
+    timezone: Optional[str] = None # IANA name; reports cut days in it
 
 class StoreResponse(BaseModel):
     id: int
@@ -43,6 +50,7 @@ class SaleRequest(BaseModel):
     selling_location_id: int
     items: List[SaleItem]
     customer_id: Optional[int] = None
+    reservation_id: Optional[str] = None # Cart hold to convert into this sale
 
 class TransactionResponse(BaseModel):
     id: int
@@ -53,12 +61,54 @@ class TransactionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+# --- Reservations ---
+class ReservationItem(BaseModel):
+    product_id: int
+    quantity: int
+
+class ReservationRequest(BaseModel):
+    location_id: int
+    items: List[ReservationItem]
+    ttl_seconds: Optional[int] = None
+    reservation_id: Optional[str] = None # Pass to update an open cart's hold
+
+class ReservationExtend(BaseModel):
+    ttl_seconds: Optional[int] = None
+
+class ReservationResponse(BaseModel):
+    reservation_id: str
+    location_id: int
+    items: List[ReservationItem]
+    expires_at: datetime
+
+# --- Offline Sync ---
+class OfflineSaleRequest(SaleRequest):
+    client_timestamp: Optional[datetime] = None # When the terminal rang up the sale
+    idempotency_key: Optional[str] = None
+
+class SaleBatchRequest(BaseModel):
+    sales: List[OfflineSaleRequest]
+
+class SaleBatchResult(BaseModel):
+    index: int
+    status: str # 'created', 'replayed' or 'failed'
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+class SaleBatchResponse(BaseModel):
+    results: List[SaleBatchResult]
+
 # --- Inventory ---
 class ReplenishmentRequest(BaseModel):
     source_location_id: int
     target_location_id: int
     items: List[SaleItem]
 
+class HotSkuRequest(BaseModel):
+    location_id: int
+    product_id: int
+    shard_count: int = 8 # 1 turns hot-SKU mode off
+
 # --- Recommendation ---
 class RecommendationRequest(BaseModel):
     location_id: int
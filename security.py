@@ -0,0 +1,174 @@
+import asyncio
+import logging
+import os
+import secrets
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt, JWTError
+from passlib.context import CryptContext
+
+from cache import TTLCache
+from database import SessionLocal
+import crud
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# --- Signed access tokens ---
+SECRET_KEY = os.getenv("JWT_SECRET_KEY")
+if not SECRET_KEY:
+    # Tokens then only validate on this process and die with it
+    logger.warning("JWT_SECRET_KEY not set: using a random per-process key.")
+    SECRET_KEY = secrets.token_urlsafe(32)
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "720"))
+
+# --- Principal cache ---
+# get_current_user answers from here; only a miss (first request, TTL expiry or
+# an invalidation after the employee was written) reads the employees table.
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "4096"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL)
+
+class Principal:
+    """
+    The authenticated employee as seen by the routes: the Employee fields they
+    use, detached from any DB session.
+    """
+
+    def __init__(self, id: int, username: str, role: str, assigned_location_id: int = None):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.assigned_location_id = assigned_location_id
+
+    @classmethod
+    def from_employee(cls, employee):
+        return cls(employee.id, employee.username, employee.role, employee.assigned_location_id)
+
+def create_access_token(employee, expires_delta: timedelta = None):
+    now = datetime.now(timezone.utc)
+    claims = {
+        "sub": str(employee.id),
+        "username": employee.username,
+        "role": employee.role,
+        "loc": employee.assigned_location_id,
+        "iat": now,
+        "exp": now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    }
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_access_token(token: str):
+    """
+    Verifies signature and expiry. Raises ValueError on any invalid token.
+    """
+    try:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        int(claims["sub"])
+    except (JWTError, KeyError, ValueError) as e:
+        raise ValueError(f"Invalid token: {e}")
+    return claims
+
+def get_cached_principal(employee_id: int):
+    return principal_cache.get(employee_id)
+
+def cache_principal(principal: Principal):
+    principal_cache.set(principal.id, principal)
+
+def invalidate_principal(employee_id: int):
+    """
+    Must be called whenever an employee's role or location is written, so the
+    next request re-reads it (and tokens carrying the old role are refused).
+    """
+    principal_cache.invalidate(employee_id)
+
+def claims_match(claims: dict, principal: Principal):
+    return claims.get("role") == principal.role and claims.get("loc") == principal.assigned_location_id
+
+# --- Password hashing ---
+# Raising PASSWORD_HASH_ROUNDS makes older hashes "need update": they are
+# re-hashed in the background on the employee's next successful login.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS", "29000"))
+# Hash work runs on its own small pool so a login storm can't take over the
+# event loop or Starlette's threadpool; beyond workers + queue depth, logins get 503.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+PASSWORD_HASH_QUEUE_DEPTH = int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", "64"))
+
+pwd_context = CryptContext(
+    schemes=["pbkdf2_sha256"],
+    deprecated="auto",
+    pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+    pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS
+)
+
+def hash_password(password: str):
+    return pwd_context.hash(password)
+
+def verify_password(password: str, stored_hash: str):
+    """
+    Returns (valid, needs_rehash).
+    Rows created before hashing was introduced hold the plain password: they
+    still verify, and are flagged for rehash.
+    """
+    if pwd_context.identify(stored_hash, required=False) is None:
+        valid = secrets.compare_digest(password.encode(), stored_hash.encode())
+        return valid, valid
+    valid = pwd_context.verify(password, stored_hash)
+    return valid, valid and pwd_context.needs_update(stored_hash)
+
+class HasherBusy(Exception):
+    """All hashing workers are busy and the queue is full."""
+
+class PasswordHasher:
+    """
+    Bounded executor for password hashing: `workers` hashes in parallel and at
+    most `queue_depth` more waiting.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_depth: int = PASSWORD_HASH_QUEUE_DEPTH, session_factory=SessionLocal):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + queue_depth)
+        self.session_factory = session_factory
+
+    def _submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Too many concurrent logins, retry shortly.")
+        try:
+            future = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    async def verify(self, password: str, stored_hash: str):
+        """
+        verify_password off the event loop. Raises HasherBusy when saturated.
+        """
+        return await asyncio.wrap_future(self._submit(verify_password, password, stored_hash))
+
+    def schedule_rehash(self, employee_id: int, password: str):
+        """
+        Best effort: if the pool is saturated the rehash simply happens on a later login.
+        Returns the rehash future, or None when deferred.
+        """
+        try:
+            return self._submit(self._rehash, employee_id, password)
+        except HasherBusy:
+            logger.info(f"Rehash of employee {employee_id} deferred: hasher busy.")
+            return None
+
+    def _rehash(self, employee_id: int, password: str):
+        db = self.session_factory()
+        try:
+            crud.update_employee_password(db, employee_id, hash_password(password))
+        except Exception as e:
+            logger.error(f"Rehash of employee {employee_id} failed: {e}")
+        finally:
+            db.close()
+
+hasher = PasswordHasher()
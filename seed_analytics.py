@@ -2,6 +2,7 @@ import random
 from datetime import datetime, timedelta
 from database import SessionLocal
 import crud
+import rollup
 from models import Product, Category, Transaction, TransactionDetail, Location
 
 def seed_analytics_data():
@@ -113,6 +114,7 @@ def seed_analytics_data():
             if i % 20 == 0:
                 log(f"  Generated {i} transactions...")
 
+        rollup.rebuild(db) # Dashboards read the daily rollups
         log("Seeding Complete. Analytics data ready.")
 
     except Exception as e:
@@ -1,14 +1,17 @@
 from sqlalchemy.orm import Session
 import crud
+import security
+import authorization
 
 from models import Employee, Location
+from zoneinfo import available_timezones
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def register_new_store(db: Session, admin_id: int, name: str, address: str, tax_id: str, contact_info: str, store_type: str):
+def register_new_store(db: Session, admin_id: int, name: str, address: str, tax_id: str, contact_info: str, store_type: str, timezone: str = None):
     """
     Provisions a new store.
     - Validates Supervisor is Super Admin.
@@ -16,13 +19,14 @@ def register_new_store(db: Session, admin_id: int, name: str, address: str, tax_
     """
     try:
         # 1. Auth Check (Super Admin Only)
-        admin = crud.get_employee(db, admin_id)
-        if not admin or admin.role != 'super_admin':
-            raise PermissionError("Only Super Admin can register new stores.")
+        authorization.authorize(db, admin_id, authorization.REGISTER_STORE)
             
         if store_type not in ['store', 'partner']:
             raise ValueError("Invalid Store Type. Must be 'store' (Proprietary) or 'partner' (External).")
 
+        if timezone and timezone not in available_timezones():
+            raise ValueError(f"Unknown timezone '{timezone}'.")
+
         # 2. Create Location
         location = crud.create_location(
             db, 
@@ -30,7 +34,8 @@ def register_new_store(db: Session, admin_id: int, name: str, address: str, tax_
             location_type=store_type, 
             address=address, 
             tax_id=tax_id, 
-            contact_info=contact_info
+            contact_info=contact_info,
+            timezone=timezone
         )
         
         logger.info(f"Store '{name}' ({store_type}) provisioned by Admin {admin_id}. ID: {location.id}")
@@ -40,6 +45,17 @@ def register_new_store(db: Session, admin_id: int, name: str, address: str, tax_
         logger.error(f"Register Store failed: {e}")
         raise e
 
+def _validate_role_for_store(role: str, target_store):
+    """
+    Roles allowed per location type.
+    """
+    if target_store.location_type == 'store' and role not in ['branch_manager', 'internal_cashier']:
+         raise ValueError(f"Role '{role}' invalid for Proprietary Store.")
+    if target_store.location_type == 'partner' and role not in ['partner_owner', 'external_cashier']:
+         raise ValueError(f"Role '{role}' invalid for External Partner.")
+    if target_store.location_type == 'warehouse' and role not in ['super_admin', 'logistics_manager', 'kam']:
+         raise ValueError(f"Role '{role}' invalid for Warehouse/HQ.")
+
 def create_user_profile(db: Session, creator_id: int, new_username: str, new_password: str, role: str, target_store_id: int):
     """
     Creates a new user profile with Context-Aware Role Logic.
@@ -50,11 +66,11 @@ def create_user_profile(db: Session, creator_id: int, new_username: str, new_pas
     - Branch Manager: Can create ONLY 'internal_cashier' for THEIR store.
     """
     try:
-        creator = crud.get_employee(db, creator_id)
+        creator = authorization.get_employee_facts(db, creator_id)
         if not creator:
             raise PermissionError("Creator not found.")
             
-        target_store = crud.get_location(db, target_store_id)
+        target_store = authorization.get_location_facts(db, target_store_id)
         if not target_store:
             raise ValueError("Target Store not found.")
             
@@ -63,12 +79,7 @@ def create_user_profile(db: Session, creator_id: int, new_username: str, new_pas
         # 1. Super Admin (God Mode)
         if creator.role == 'super_admin':
             # Basic validation of role vs store type
-            if target_store.location_type == 'store' and role not in ['branch_manager', 'internal_cashier']:
-                 raise ValueError(f"Role '{role}' invalid for Proprietary Store.")
-            if target_store.location_type == 'partner' and role not in ['partner_owner', 'external_cashier']:
-                 raise ValueError(f"Role '{role}' invalid for External Partner.")
-            if target_store.location_type == 'warehouse' and role not in ['super_admin', 'logistics_manager', 'kam']:
-                 raise ValueError(f"Role '{role}' invalid for Warehouse/HQ.")
+            _validate_role_for_store(role, target_store)
                  
             # Proceed
             
@@ -102,7 +113,7 @@ def create_user_profile(db: Session, creator_id: int, new_username: str, new_pas
             db, 
             username=new_username, 
             role=role, 
-            password_hash=new_password, # Placeholder hashing
+            password_hash=security.hash_password(new_password),
             location_id=target_store_id
         )
         
@@ -112,3 +123,31 @@ def create_user_profile(db: Session, creator_id: int, new_username: str, new_pas
     except Exception as e:
         logger.error(f"Create User Profile failed: {e}")
         raise e
+
+def update_user_role(db: Session, admin_id: int, employee_id: int, new_role: str, target_store_id: int = None):
+    """
+    Changes an employee's role (and optionally store). Super Admin only.
+    The cached principal is evicted on commit: tokens issued with the old role stop working.
+    """
+    try:
+        authorization.authorize(db, admin_id, authorization.CHANGE_ROLE)
+
+        employee = crud.get_employee(db, employee_id)
+        if not employee:
+            raise ValueError("User not found.")
+
+        store_id = target_store_id or employee.assigned_location_id
+        target_store = authorization.get_location_facts(db, store_id) if store_id else None
+        if not target_store:
+            raise ValueError("Target Store not found.")
+        _validate_role_for_store(new_role, target_store)
+
+        # Committing the change evicts the cached facts and principal (see authorization.py)
+        employee = crud.update_employee(db, employee_id, role=new_role, location_id=store_id)
+
+        logger.info(f"User '{employee.username}' is now {new_role} at Store {store_id} (by Admin {admin_id}).")
+        return employee
+
+    except Exception as e:
+        logger.error(f"Update User Role failed: {e}")
+        raise e
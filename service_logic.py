@@ -1,11 +1,22 @@
 from sqlalchemy.orm import Session
 import crud
+import reservations
+import authorization
+import rollup
+import events
 import logging
+import os
+from datetime import datetime, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# When enabled, stock is changed with single conditional UPDATE/UPSERT statements
+# (no read-then-write), so concurrent sales at one location neither lose updates
+# nor hold row locks between a SELECT and the write.
+ATOMIC_STOCK_UPDATES = os.getenv("ATOMIC_STOCK_UPDATES", "false").lower() == "true"
+
 # --- Authorization Logic ---
 def validate_manager_override(db: Session, supervisor_id: int, required_location_id: int = None):
     """
@@ -16,53 +27,137 @@ def validate_manager_override(db: Session, supervisor_id: int, required_location
     1. 'super_admin' -> Access ALL.
     2. 'branch_manager' -> Access ONLY their assigned_location_id.
     3. 'partner_owner' -> Access ONLY their assigned_location_id.
+
+    Decided by the authorization service: cached role facts, and at most one
+    evaluation per (supervisor, location) for the lifetime of the session.
     """
-    supervisor = crud.get_employee(db, supervisor_id)
-    if not supervisor:
-        raise PermissionError("Supervisor not found.")
-    
-    if supervisor.role == 'super_admin':
-        return True
-    
-    if supervisor.role in ['branch_manager', 'partner_owner']:
-        if required_location_id and supervisor.assigned_location_id != required_location_id:
-            raise PermissionError("Supervisor does not have authority over this location.")
-        return True
-        
-    raise PermissionError(f"User role '{supervisor.role}' is not authorized for Manager Override.")
+    return authorization.authorize(db, supervisor_id, authorization.MANAGER_OVERRIDE, required_location_id)
 
 # --- Transaction Operations ---
-def process_sale(db: Session, selling_location_id: int, employee_id: int, items: list[dict], customer_id: int = None):
+def _aggregate_quantities(items: list[dict]):
+    """
+    Sums requested quantities per product (a cart may scan the same product on several lines).
+    """
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return quantities
+
+def _price_items(items: list[dict], products: dict):
+    """
+    Checks every cart line refers to a loaded product and fills missing unit prices
+    with the product's current price.
+    """
+    for item in items:
+        product = products.get(item['product_id'])
+        if not product:
+            raise ValueError(f"Product {item['product_id']} not found")
+        if item.get('unit_price') is None:
+            item['unit_price'] = float(product.price)
+
+def _check_reservations(db: Session, selling_location_id: int, quantities: dict, reservation_id: str = None):
+    """
+    Keeps a sale from taking stock that other open carts hold.
+    Free when nothing is reserved for these products (no query at all).
+    """
+    held = reservations.ledger.held(selling_location_id, quantities.keys(), exclude=reservation_id)
+    if not held:
+        return
+    on_hand = crud.get_on_hand_for_products(db, selling_location_id, held.keys())
+    for product_id, qty_held in held.items():
+        available = on_hand.get(product_id, 0) - qty_held
+        if available < quantities[product_id]:
+            raise ValueError(f"Insufficient stock for product {product_id} at location {selling_location_id}. Available: {available} ({qty_held} reserved), Requested Change: {-quantities[product_id]}")
+
+def _publish_low_stock(db: Session, location_id: int, product, stock_after: int, quantity: int, reorder_point: int):
+    # Only the sale that takes the product to its reorder point raises the event
+    if stock_after <= reorder_point < stock_after + quantity:
+        events.publish(db, events.location_topic(location_id), {
+            "type": "low_stock", "location_id": location_id, "product_id": product.id,
+            "name": product.name, "stock": stock_after, "reorder_point": reorder_point
+        })
+
+def apply_sale(db: Session, selling_location_id: int, employee_id: int, items: list[dict], customer_id: int = None, idempotency_key: str = None, reservation_id: str = None):
+    """
+    Stages a sale in the current DB transaction WITHOUT committing:
+    1. Loads every product and StockLevel row of the cart (one query each).
+    2. Validates availability in memory and decrements stock
+       (or with one conditional UPDATE when ATOMIC_STOCK_UPDATES is on).
+    3. Creates transaction record (details bulk-inserted) and adds it to the daily rollups.
+
+    Items without a unit_price are priced at the product's current price.
+    An idempotency_key, if given, is stored with the sale.
+    Stock held by other carts' reservations is not sold; the cart's own
+    reservation (reservation_id) is released by the caller after the commit.
+    Used by process_sale and by the group-commit writer (sale_writer.py).
+    """
+    # 1. Load the cart set-wise
+    quantities = _aggregate_quantities(items)
+    products = crud.get_products_by_ids(db, quantities.keys())
+
+    _price_items(items, products)
+    _check_reservations(db, selling_location_id, quantities, reservation_id)
+
+    # 2. Validate & Decrement Stock
+    if ATOMIC_STOCK_UPDATES:
+        # Database-side check: one conditional UPDATE for the whole cart;
+        # rows that come back short may be hot SKUs holding their stock in shards
+        levels, short = crud.decrement_stock_bulk(db, selling_location_id, quantities, raise_on_short=False, with_reorder_points=True)
+        for product_id, (stock_after, reorder_point) in levels.items():
+            _publish_low_stock(db, selling_location_id, products[product_id], stock_after, quantities[product_id], reorder_point)
+        for product_id in short:
+            crud.claim_stock_sharded(db, selling_location_id, product_id, quantities[product_id])
+    else:
+        # In memory (flushed with the transaction below)
+        stock_levels = crud.get_stock_levels_for_products(db, selling_location_id, quantities.keys())
+        for product_id, quantity in quantities.items():
+            stock = stock_levels.get(product_id)
+            if stock and stock.shard_count > 1:
+                # Hot SKU: claim from a shard instead of locking the shared row
+                crud.claim_stock_sharded(db, selling_location_id, product_id, quantity)
+                continue
+            if not stock or stock.current_stock < quantity:
+                current = stock.current_stock if stock else 0
+                raise ValueError(f"Insufficient stock for product {product_id} at location {selling_location_id}. Current: {current}, Requested Change: {-quantity}")
+            stock.current_stock -= quantity
+            _publish_low_stock(db, selling_location_id, products[product_id], stock.current_stock, quantity, stock.reorder_point)
+        
+    # 3. Record Transaction (commit=False so the caller decides when to commit)
+    transaction = crud.create_transaction_with_details(
+        db, 
+        selling_location_id, 
+        employee_id, 
+        items, 
+        customer_id,
+        commit=False,
+        products=products
+    )
+    rollup.record_sale(db, transaction.id, selling_location_id, transaction.created_at, [{
+        'product_id': item['product_id'],
+        'quantity': item['quantity'],
+        'unit_price': item['unit_price'],
+        'unit_cost_at_sale': products[item['product_id']].cost_price or 0
+    } for item in items])
+    if idempotency_key:
+        crud.create_idempotency_key(db, idempotency_key, transaction.id, employee_id)
+    return transaction
+
+def process_sale(db: Session, selling_location_id: int, employee_id: int, items: list[dict], customer_id: int = None, idempotency_key: str = None, reservation_id: str = None):
     """
     Orchestrates a sale atomically:
-    1. Decrements stock for all items (validating availability).
-    2. Creates transaction record.
-    3. Commits only if EVERYTHING succeeds.
+    1. Stages stock decrements and the transaction record (see apply_sale).
+    2. Commits only if EVERYTHING succeeds.
+    3. Releases the cart's reservation, now turned into a sale.
     """
     try:
         # Start Atomic Block
-        # 1. Decrement Stock (commit=False to defer persistence)
-        for item in items:
-            crud.update_stock(db, selling_location_id, item['product_id'], -item['quantity'], commit=False)
-            
-        # 2. Record Transaction (commit=False internal to function or just flush)
-        # Note: crud.create_transaction_with_details handles flush, but we must ensure it doesn't auto-commit if we want full atomicity here.
-        # Looking at crud.py, create_transaction_with_details DOES commit by default. 
-        # We need to pass commit=False to it if it supports it, or rely on Session transaction management.
-        # The prompt specified modifying crud to support commit=False or assuming it supports it.
-        # Let's check crud.py again or just pass commit=False if the signature allows (it does, based on previous read).
-        transaction = crud.create_transaction_with_details(
-            db, 
-            selling_location_id, 
-            employee_id, 
-            items, 
-            customer_id,
-            commit=False
-        )
+        transaction = apply_sale(db, selling_location_id, employee_id, items, customer_id, idempotency_key, reservation_id)
         
-        # 3. Final Atomic Commit
+        # Final Atomic Commit
         db.commit()
         db.refresh(transaction)
+        if reservation_id:
+            reservations.ledger.release(reservation_id)
         
         logger.info(f"Sale processed successfully. Transaction ID: {transaction.id}")
         return transaction
@@ -76,13 +171,154 @@ def process_sale(db: Session, selling_location_id: int, employee_id: int, items:
         logger.error(f"Sale processing failed (Unexpected): {e}")
         raise e
 
+MAX_SALES_PER_BATCH = int(os.getenv("MAX_SALES_PER_BATCH", "1000"))
+
+def process_sale_batch(db: Session, employee_id: int, sales: list[dict]):
+    """
+    Replays a queue of offline sales from one terminal in a single commit.
+    sales: ordered dicts with selling_location_id, items, customer_id,
+           client_timestamp (optional) and idempotency_key (optional).
+
+    1. Loads products, customers, known idempotency keys and the affected
+       StockLevel rows (locked) with one query each.
+    2. Walks the sales in order, validating each against the running stock;
+       a failing sale is reported and skipped, it does not abort the batch.
+    3. Writes stock, headers, details, keys and rollup deltas with multi-row statements.
+    4. Commits once.
+
+    Returns one result dict per sale, in order:
+    {'index', 'status' ('created' | 'replayed' | 'failed'), 'transaction_id', 'transaction_status',
+     'total_amount', 'created_at', 'error'}
+    """
+    if len(sales) > MAX_SALES_PER_BATCH:
+        raise ValueError(f"Batch too large: {len(sales)} sales (max {MAX_SALES_PER_BATCH}).")
+
+    try:
+        # 1. Load everything the batch touches, set-wise
+        product_ids = {item['product_id'] for sale in sales for item in sale['items']}
+        pairs = {(sale['selling_location_id'], item['product_id']) for sale in sales for item in sale['items']}
+        products = crud.get_products_by_ids(db, product_ids)
+        customers = crud.get_customers_by_ids(db, [s['customer_id'] for s in sales if s.get('customer_id')])
+        known_keys = crud.get_idempotency_keys(db, [s['idempotency_key'] for s in sales if s.get('idempotency_key')])
+        stock_levels = crud.get_stock_levels_for_pairs(db, pairs, for_update=True)
+        # Hot SKUs keep most of their stock in shards: validate against the summed value
+        shard_totals = crud.get_shard_totals(db, [pair for pair, row in stock_levels.items() if row.shard_count > 1])
+        available = {pair: row.current_stock + shard_totals.get(pair, 0) for pair, row in stock_levels.items()}
+        # Stock held by open carts is not available to the replayed sales
+        for (location_id, product_id) in available:
+            available[(location_id, product_id)] -= reservations.ledger.held(location_id, [product_id]).get(product_id, 0)
+        sold = {}
+
+        results = []
+        accepted = [] # (result, header_row, detail_rows, idempotency_key)
+        batch_keys = {}
+
+        # 2. Validate in order against the running stock
+        for index, sale in enumerate(sales):
+            result = {'index': index, 'status': 'failed', 'transaction_id': None, 'transaction_status': None,
+                      'total_amount': None, 'created_at': None, 'error': None}
+            results.append(result)
+            key = sale.get('idempotency_key')
+
+            if key and key in known_keys:
+                record = known_keys[key]
+                if record.employee_id != employee_id:
+                    result['error'] = "Idempotency-Key already used by another employee."
+                    continue
+                result.update(status='replayed', transaction_id=record.transaction_id, transaction_status=record.transaction.status,
+                              total_amount=float(record.transaction.total_amount), created_at=record.transaction.created_at)
+                continue
+            if key and key in batch_keys:
+                # Same sale queued twice on the terminal: resolved after the insert
+                result['status'] = 'replayed'
+                result['replay_of'] = batch_keys[key]
+                continue
+
+            try:
+                location_id = sale['selling_location_id']
+                items = sale['items']
+                if not items:
+                    raise ValueError("Sale has no items.")
+                if sale.get('customer_id') and sale['customer_id'] not in customers:
+                    raise ValueError(f"Customer {sale['customer_id']} not found")
+                _price_items(items, products)
+
+                quantities = _aggregate_quantities(items)
+                for product_id, quantity in quantities.items():
+                    current = available.get((location_id, product_id), 0)
+                    if current < quantity:
+                        raise ValueError(f"Insufficient stock for product {product_id} at location {location_id}. Current: {current}, Requested Change: {-quantity}")
+            except ValueError as ve:
+                result['error'] = str(ve)
+                continue
+
+            for product_id, quantity in quantities.items():
+                available[(location_id, product_id)] -= quantity
+                sold[(location_id, product_id)] = sold.get((location_id, product_id), 0) + quantity
+
+            total_amount = sum(item['quantity'] * item['unit_price'] for item in items)
+            header = {
+                'selling_location_id': location_id,
+                'employee_id': employee_id,
+                'customer_id': sale.get('customer_id'),
+                'total_amount': total_amount,
+                'status': 'completed',
+                'created_at': sale.get('client_timestamp') or datetime.now(timezone.utc)
+            }
+            detail_rows = [{
+                'product_id': item['product_id'],
+                'quantity': item['quantity'],
+                'unit_price': item['unit_price'],
+                'unit_cost_at_sale': products[item['product_id']].cost_price or 0
+            } for item in items]
+            accepted.append((result, header, detail_rows, key))
+            if key:
+                batch_keys[key] = index
+
+        # 3. Multi-row writes (plain stock rows are flushed with the commit)
+        for (location_id, product_id), quantity in sold.items():
+            stock = stock_levels[(location_id, product_id)]
+            if stock.shard_count > 1:
+                crud.claim_stock_sharded(db, location_id, product_id, quantity)
+            else:
+                stock.current_stock -= quantity
+                _publish_low_stock(db, location_id, products[product_id], stock.current_stock, quantity, stock.reorder_point)
+        created = crud.create_transactions_bulk(db, [a[1] for a in accepted], [a[2] for a in accepted])
+        key_rows = []
+        for (result, header, _, key), (tx_id, created_at) in zip(accepted, created):
+            result.update(status='created', transaction_id=tx_id, transaction_status='completed',
+                          total_amount=float(header['total_amount']), created_at=created_at)
+            if key:
+                key_rows.append({'key': key, 'transaction_id': tx_id, 'employee_id': employee_id})
+        crud.create_idempotency_keys_bulk(db, key_rows)
+        rollup.record(db, [
+            {'transaction_id': tx_id, 'location_id': header['selling_location_id'], 'created_at': created_at, 'lines': detail_rows}
+            for (_, header, detail_rows, _), (tx_id, created_at) in zip(accepted, created)
+        ])
+
+        for result in results:
+            if 'replay_of' in result:
+                original = results[result.pop('replay_of')]
+                result.update(transaction_id=original['transaction_id'], transaction_status=original['transaction_status'],
+                              total_amount=original['total_amount'], created_at=original['created_at'])
+
+        # 4. One commit for the whole batch
+        db.commit()
+        logger.info(f"Sale batch processed: {len(created)} created, {len(sales) - len(created)} replayed/failed.")
+        return results
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Sale batch failed: {e}")
+        raise e
+
 def cancel_transaction(db: Session, transaction_id: int, supervisor_id: int):
     """
     Voids a transaction. Requires Manager Override.
     1. Validate Supervisor.
     2. Fetch Transaction.
     3. Reverse Stock (Increment back to selling location).
-    4. Update Status to 'cancelled'.
+    4. Update Status to 'cancelled' and take the sale out of the daily rollups.
     """
     try:
         transaction = crud.get_transaction(db, transaction_id)
@@ -102,10 +338,12 @@ def cancel_transaction(db: Session, transaction_id: int, supervisor_id: int):
                 transaction.selling_location_id, 
                 detail.product_id, 
                 detail.quantity, # Add back
-                commit=False
+                commit=False,
+                atomic=ATOMIC_STOCK_UPDATES
             )
             
         # 3. Update Status
+        rollup.record_cancel(db, transaction)
         transaction.status = 'cancelled'
         db.commit()
         db.refresh(transaction)
@@ -125,7 +363,7 @@ def void_line_item(db: Session, transaction_id: int, product_id: int, quantity_t
     2. Check item exists and has enough quantity.
     3. Reverse Stock (Increment).
     4. Update Transaction Detail (Decrement quantity or remove).
-    5. Update Transaction Total.
+    5. Update Transaction Total and the daily rollups.
     """
     try:
         transaction = crud.get_transaction(db, transaction_id)
@@ -151,11 +389,13 @@ def void_line_item(db: Session, transaction_id: int, product_id: int, quantity_t
             transaction.selling_location_id, 
             product_id, 
             quantity_to_void, 
-            commit=False
+            commit=False,
+            atomic=ATOMIC_STOCK_UPDATES
         )
         
         # 4. Update Detail & Total
         refund_amount = quantity_to_void * detail.unit_price
+        rollup.record_void(db, transaction, detail, quantity_to_void, line_removed=detail.quantity == quantity_to_void)
         
         if detail.quantity == quantity_to_void:
             db.delete(detail) # Remove line entirely
@@ -180,9 +420,7 @@ def delete_product_secure(db: Session, product_id: int, supervisor_id: int):
     Deletes a product. Requires GLOBAL Admin privileges (super_admin).
     """
     try:
-        supervisor = crud.get_employee(db, supervisor_id)
-        if not supervisor or supervisor.role != 'super_admin':
-            raise PermissionError("Only Super Admin can delete products.")
+        authorization.authorize(db, supervisor_id, authorization.DELETE_PRODUCT)
             
         success = crud.delete_product(db, product_id)
         db.commit()
@@ -215,8 +453,11 @@ def create_wholesale_order(db: Session, source_location_id: int, partner_locatio
             
         # 1. Prepare Items with Wholesale Price
         sale_items = []
+        products = crud.get_products_by_ids(db, [item['product_id'] for item in items])
         for item in items:
-            product = crud.get_product(db, item['product_id'])
+            product = products.get(item['product_id'])
+            if not product:
+                raise ValueError(f"Product {item['product_id']} not found")
             # Priority: item['unit_price'] (manual override) -> product.wholesale_price -> product.price
             unit_price = item.get('unit_price') or product.wholesale_price or product.price
             
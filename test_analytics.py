@@ -0,0 +1,84 @@
+import init_db
+from database import SessionLocal
+import crud
+import authorization
+import rollup
+import os
+import traceback
+from datetime import date, datetime, timezone
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_local_day_range():
+    # Madrid is UTC+2 in summer: the local day starts at 22:00 UTC the day before
+    start, end = crud.local_day_range("Europe/Madrid", 1, today=date(2026, 7, 15))
+    assert start == datetime(2026, 7, 14, 22, tzinfo=timezone.utc)
+    assert end == datetime(2026, 7, 15, 22, tzinfo=timezone.utc)
+    # DST change (29 Mar 2026) makes that local day 23 hours long
+    start, end = crud.local_day_range("Europe/Madrid", 1, today=date(2026, 3, 29))
+    assert (end - start).total_seconds() == 23 * 3600
+    print("SUCCESS: Local day bounds")
+
+def test_location_scoped_analytics():
+    print("\n--- Test: Location-Scoped Analytics ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store_a = crud.create_location(db, "Analytics Store A", "store", timezone="America/New_York")
+        store_b = crud.create_location(db, "Analytics Store B", "store", timezone="Asia/Tokyo")
+        admin = crud.create_employee(db, "analytics_admin", "super_admin", "pwd")
+        manager = crud.create_employee(db, "analytics_manager", "branch_manager", "pwd", store_a.id)
+        cashier = crud.create_employee(db, "analytics_cashier", "internal_cashier", "pwd", store_a.id)
+        prod = crud.create_product(db, "Analytics Tea", 3.0, cost_price=1.0)
+
+        crud.create_transaction_with_details(db, store_a.id, cashier.id, [{"product_id": prod.id, "quantity": 2, "unit_price": 3.0}])
+        crud.create_transaction_with_details(db, store_b.id, admin.id, [{"product_id": prod.id, "quantity": 1, "unit_price": 3.0}])
+        rollup.rebuild(db)
+
+        # 1. Location sets follow the role
+        assert authorization.analytics_location_ids(db, manager.id) == [store_a.id]
+        assert set(authorization.analytics_location_ids(db, admin.id)) == {store_a.id, store_b.id}
+        for employee_id, location_id in [(manager.id, store_b.id), (cashier.id, None)]:
+            try:
+                authorization.analytics_location_ids(db, employee_id, location_id)
+                print("FAILED: Analytics scope NOT enforced")
+            except PermissionError as e:
+                print(f"SUCCESS: Analytics scope enforced ({e})")
+
+        # 2. Results only cover the location set
+        assert crud.get_reporting_timezone(db, [store_a.id]) == "America/New_York"
+        assert crud.get_reporting_timezone(db, [store_a.id, store_b.id]) == crud.STORE_TIMEZONE
+        kpis = crud.get_dashboard_kpis(db, [store_a.id])
+        assert kpis["count_today"] == 1 and kpis["revenue_today"] == 6.0, kpis
+        top = crud.get_top_products(db, [store_a.id, store_b.id])
+        assert top[0]["quantity"] == 3, top
+        # New York and Tokyo are on different local days half the time: each store's
+        # today counts, whatever the reporting timezone says
+        kpis = crud.get_dashboard_kpis(db, [store_a.id, store_b.id])
+        assert kpis["count_today"] == 2 and kpis["revenue_today"] == 9.0, kpis
+        assert sum(p["count"] for p in crud.get_sales_over_time(db, [store_a.id, store_b.id], days=1)) == 2
+        assert len(crud.get_revenue_by_location(db, [store_b.id])) == 1
+        print("SUCCESS: Analytics scoped by location")
+
+        # 3. The one-call dashboard agrees with the individual panels
+        both = [store_a.id, store_b.id]
+        dashboard = crud.get_dashboard(db, both)
+        assert dashboard["kpis"] == crud.get_dashboard_kpis(db, both)
+        assert dashboard["sales_over_time"] == crud.get_sales_over_time(db, both)
+        assert dashboard["top_products"] == crud.get_top_products(db, both)
+        assert sorted(dashboard["locations"], key=lambda r: r["location"]) == sorted(crud.get_revenue_by_location(db, both), key=lambda r: r["location"])
+        assert len(dashboard["daily"]["recent_transactions"]) == 2
+        print("SUCCESS: Dashboard payload matches panels")
+
+    except Exception:
+        traceback.print_exc()
+        raise
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_local_day_range()
+    test_location_scoped_analytics()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+os.environ["PARQUET_EXPORT_DIR"] = tempfile.mkdtemp() # before the export modules read it
+
+import init_db
+import crud
+import rollup
+import parquet_export
+import analytics_duckdb
+import traceback
+from database import SessionLocal
+
+def test_duckdb_matches_postgres():
+    print("\n--- Test: DuckDB Analytics Backend ---")
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    db = SessionLocal()
+    try:
+        store_a = crud.create_location(db, "Duck Store A", "store", timezone="Europe/Madrid")
+        store_b = crud.create_location(db, "Duck Store B", "store", timezone="Asia/Tokyo") # Own local day
+        admin = crud.create_employee(db, "duck_admin", "super_admin", "pwd")
+        category = crud.create_category(db, "Duck Drinks")
+        tea = crud.create_product(db, "Duck Tea", 3.0, category_id=category.id, cost_price=1.0)
+        cake = crud.create_product(db, "Duck Cake", 4.5, category_id=category.id, cost_price=2.0)
+        crud.create_transaction_with_details(db, store_a.id, admin.id, [
+            {"product_id": tea.id, "quantity": 2, "unit_price": 3.0},
+            {"product_id": cake.id, "quantity": 1, "unit_price": 4.5}
+        ])
+        crud.create_transaction_with_details(db, store_b.id, admin.id, [{"product_id": tea.id, "quantity": 5, "unit_price": 3.0}])
+        rollup.rebuild(db)
+        parquet_export.export_incremental()
+
+        # 1. Same shapes and numbers as the rollup-backed panels
+        both = [store_a.id, store_b.id]
+        assert analytics_duckdb.get_dashboard_kpis(db, both) == crud.get_dashboard_kpis(db, both)
+        assert analytics_duckdb.get_sales_over_time(db, both) == crud.get_sales_over_time(db, both)
+        assert analytics_duckdb.get_top_products(db, both) == crud.get_top_products(db, both)
+        assert analytics_duckdb.get_sales_by_category(db, both) == crud.get_sales_by_category(db, both)
+        by_name = lambda rows: sorted(rows, key=lambda r: r["location"])
+        assert by_name(analytics_duckdb.get_revenue_by_location(db, both)) == by_name(crud.get_revenue_by_location(db, both))
+        assert analytics_duckdb.get_top_products(db, [store_a.id]) == crud.get_top_products(db, [store_a.id])
+        print("SUCCESS: DuckDB panels match Postgres")
+
+        # 2. Heavy reports
+        hours = analytics_duckdb.get_margin_by_hour(db, both)
+        assert sum(h["revenue"] for h in hours) == 25.5 and sum(h["margin"] for h in hours) == 16.5, hours
+        yoy = analytics_duckdb.get_category_location_yoy(db, both)
+        assert {r["location"] for r in yoy} == {"Duck Store A", "Duck Store B"} and all(r["growth"] is None for r in yoy)
+        print("SUCCESS: Heavy reports")
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_duckdb_matches_postgres()
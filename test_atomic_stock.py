@@ -0,0 +1,67 @@
+import init_db
+from database import SessionLocal
+import crud
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_atomic_stock():
+    print("\n--- Test: Atomic Stock Updates ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Atomic Store", "store")
+        soda = crud.create_product(db, "Atomic Soda", 2.0)
+        chips = crud.create_product(db, "Atomic Chips", 3.0)
+
+        # 1. Upsert creates the row
+        level = crud.update_stock(db, store.id, soda.id, 10, atomic=True)
+        print(f"Soda after upsert: {level} (Expected 10)")
+        assert level == 10
+
+        # 2. Upsert adds to an existing row
+        level = crud.update_stock(db, store.id, soda.id, 5, atomic=True)
+        assert level == 15
+
+        # 3. Conditional decrement
+        level = crud.update_stock(db, store.id, soda.id, -4, atomic=True)
+        assert level == 11
+
+        # 4. Decrement below zero is refused by the database
+        try:
+            crud.update_stock(db, store.id, soda.id, -50, atomic=True)
+            print("FAILED: Oversell NOT blocked")
+        except ValueError as e:
+            print(f"SUCCESS: Oversell blocked ({e})")
+            db.rollback()
+
+        # 5. Bulk decrement (whole cart in one statement)
+        crud.update_stock(db, store.id, chips.id, 3, atomic=True)
+        levels = crud.decrement_stock_bulk(db, store.id, {soda.id: 1, chips.id: 3})
+        db.commit()
+        assert levels == {soda.id: 10, chips.id: 0}
+
+        # 6. Bulk decrement reports short products and is rolled back by the caller
+        try:
+            crud.decrement_stock_bulk(db, store.id, {soda.id: 1, chips.id: 1})
+            print("FAILED: Short cart NOT blocked")
+        except ValueError:
+            db.rollback()
+
+        stock = crud.get_stock_level(db, store.id, soda.id)
+        print(f"Soda after rollback: {stock.current_stock} (Expected 10)")
+        assert stock.current_stock == 10
+
+        print("SUCCESS: Atomic stock updates verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_atomic_stock()
@@ -0,0 +1,81 @@
+from fastapi.testclient import TestClient
+from api import app
+import init_db
+import os
+import crud
+import security
+from database import SessionLocal
+
+# Setup DB for Test
+os.environ["ALLOW_SCHEMA_DROP"] = "true"
+init_db.init_db()
+os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+client = TestClient(app)
+
+def test_signed_tokens():
+    print("\n--- Test: Signed Tokens & Principal Cache ---")
+    db = SessionLocal()
+    hq = crud.create_location(db, "Auth HQ", "warehouse")
+    store = crud.create_location(db, "Auth Store", "store")
+    crud.create_employee(db, "auth_admin", "super_admin", security.hash_password("adminpass"), hq.id)
+    cashier = crud.create_employee(db, "auth_cashier", "internal_cashier", security.hash_password("pwd"), store.id)
+    db.close()
+
+    # 1. Token is a signed JWT carrying id, role and store
+    response = client.post("/token", data={"username": "auth_cashier", "password": "pwd"})
+    assert response.status_code == 200
+    token = response.json()["access_token"]
+    claims = security.decode_access_token(token)
+    assert claims["sub"] == str(cashier.id)
+    assert claims["role"] == "internal_cashier" and claims["loc"] == store.id
+
+    # 2. Tampered and username-style tokens are refused
+    assert client.get("/inventory", headers={"Authorization": f"Bearer {token}x"}).status_code == 401
+    assert client.get("/inventory", headers={"Authorization": "Bearer auth_cashier"}).status_code == 401
+
+    # 3. Authenticated request is served from the cached principal
+    assert client.get("/inventory", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert security.get_cached_principal(cashier.id).role == "internal_cashier"
+
+    # 4. Role change invalidates the cache; the old token stops working
+    admin_token = client.post("/token", data={"username": "auth_admin", "password": "adminpass"}).json()["access_token"]
+    response = client.patch(f"/admin/users/{cashier.id}", headers={"Authorization": f"Bearer {admin_token}"},
+                            json={"role": "branch_manager"})
+    assert response.status_code == 200
+    assert client.get("/inventory", headers={"Authorization": f"Bearer {token}"}).status_code == 401
+
+    print("SUCCESS: Signed tokens verified.")
+
+def test_password_hashing():
+    print("\n--- Test: Password Hashing ---")
+    db = SessionLocal()
+    store = crud.create_location(db, "Hash Store", "store")
+    crud.create_employee(db, "hashed_user", "internal_cashier", security.hash_password("s3cret"), store.id)
+    legacy = crud.create_employee(db, "legacy_user", "internal_cashier", "plainpass", store.id)
+    db.close()
+
+    # 1. Hashed password verifies; a wrong one doesn't
+    assert client.post("/token", data={"username": "hashed_user", "password": "s3cret"}).status_code == 200
+    assert client.post("/token", data={"username": "hashed_user", "password": "wrong"}).status_code == 401
+
+    # 2. Plain-text legacy row still logs in and is re-hashed in the background
+    rehashes = []
+    schedule_rehash = security.hasher.schedule_rehash
+    security.hasher.schedule_rehash = lambda *args: rehashes.append(schedule_rehash(*args))
+    try:
+        assert client.post("/token", data={"username": "legacy_user", "password": "plainpass"}).status_code == 200
+    finally:
+        security.hasher.schedule_rehash = schedule_rehash
+    assert len(rehashes) == 1 and rehashes[0] is not None
+    rehashes[0].result() # Wait for the rehash to commit
+    db = SessionLocal()
+    stored = crud.get_employee(db, legacy.id).password_hash
+    db.close()
+    assert stored != "plainpass" and security.verify_password("plainpass", stored) == (True, False)
+
+    print("SUCCESS: Password hashing verified.")
+
+if __name__ == "__main__":
+    test_signed_tokens()
+    test_password_hashing()
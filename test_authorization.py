@@ -0,0 +1,50 @@
+import init_db
+from database import SessionLocal
+import crud
+import authorization
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_authorization_cache():
+    print("\n--- Test: Authorization Service ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store_a = crud.create_location(db, "Authz Store A", "store")
+        store_b = crud.create_location(db, "Authz Store B", "store")
+        manager = crud.create_employee(db, "authz_manager", "branch_manager", "pwd", store_a.id)
+
+        # 1. Decision evaluated once per session
+        assert authorization.authorize(db, manager.id, authorization.MANAGER_OVERRIDE, store_a.id)
+        assert authorization.authorize(db, manager.id, authorization.MANAGER_OVERRIDE, store_a.id)
+        assert len(db.info['authz_decisions']) == 1
+        assert authorization.employee_facts.get(manager.id).role == 'branch_manager'
+
+        # 2. Denials are memoized too
+        for _ in range(2):
+            try:
+                authorization.authorize(db, manager.id, authorization.MANAGER_OVERRIDE, store_b.id)
+                print("FAILED: Wrong store NOT blocked")
+            except PermissionError as e:
+                print(f"SUCCESS: Wrong store blocked ({e})")
+        assert len(db.info['authz_decisions']) == 2
+
+        # 3. Writing the employee evicts facts and decisions
+        crud.update_employee(db, manager.id, location_id=store_b.id)
+        assert authorization.employee_facts.get(manager.id) is None
+        assert authorization.authorize(db, manager.id, authorization.MANAGER_OVERRIDE, store_b.id)
+
+        print("SUCCESS: Authorization cache verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_authorization_cache()
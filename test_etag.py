@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+from api import app
+import init_db
+import os
+import crud
+import rollup
+import traceback
+from database import SessionLocal
+
+def setup():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "ETag Store", "store")
+        admin = crud.create_employee(db, "etag_admin", "super_admin", "adminpass", store.id)
+        prod = crud.create_product(db, "ETag Prod", 4.0, cost_price=1.0)
+        return store.id, admin.id, prod.id
+    finally:
+        db.close()
+
+def sell(store_id, employee_id, prod_id):
+    db = SessionLocal()
+    try:
+        lines = [{"product_id": prod_id, "quantity": 1, "unit_price": 4.0}]
+        tx = crud.create_transaction_with_details(db, store_id, employee_id, lines, commit=False)
+        rollup.record_sale(db, tx.id, store_id, tx.created_at, [dict(lines[0], unit_cost_at_sale=1.0)])
+        db.commit()
+    finally:
+        db.close()
+
+def test_analytics_etag():
+    print("\n--- Test: Analytics ETag / 304 ---")
+    try:
+        store_id, admin_id, prod_id = setup()
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "etag_admin", "password": "adminpass"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        # 1. First read is tagged, the revalidation is answered with 304
+        first = client.get("/analytics/kpis", headers=headers)
+        assert first.status_code == 200 and "ETag" in first.headers
+        etag = first.headers["ETag"]
+        again = client.get("/analytics/kpis", headers={**headers, "If-None-Match": etag})
+        assert again.status_code == 304, again.status_code
+        print("SUCCESS: Unchanged data answered with 304")
+
+        # 2. Different query -> different tag
+        other = client.get("/analytics/top-products?days=7", headers=headers)
+        assert other.headers["ETag"] != etag
+        print("SUCCESS: ETag depends on the query")
+
+        # 3. A sale moves the watermark
+        sell(store_id, admin_id, prod_id)
+        after = client.get("/analytics/kpis", headers={**headers, "If-None-Match": etag})
+        assert after.status_code == 200 and after.headers["ETag"] != etag
+        assert after.json()["count_today"] == 1
+        print("SUCCESS: New sale invalidates the ETag")
+
+        # 4. Inventory is tagged too
+        inventory = client.get("/inventory", headers=headers)
+        cached = client.get("/inventory", headers={**headers, "If-None-Match": inventory.headers["ETag"]})
+        assert cached.status_code == 304
+        print("SUCCESS: Inventory answered with 304")
+    except Exception:
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    test_analytics_etag()
@@ -0,0 +1,73 @@
+import init_db
+from database import SessionLocal
+import crud
+import events
+import service_logic
+import asyncio
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+async def _collect(subscription, timeout=0.5):
+    received = []
+    while True:
+        event = await subscription.get(timeout)
+        if event is None:
+            return received
+        received.append(event)
+
+def test_sale_events():
+    print("\n--- Test: Live Sale Events ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Events Store", "store")
+        other = crud.create_location(db, "Events Other", "store")
+        manager = crud.create_employee(db, "events_manager", "branch_manager", "pwd", store.id)
+        cashier = crud.create_employee(db, "events_cashier", "internal_cashier", "pwd", store.id)
+        soda = crud.create_product(db, "Events Soda", 2.5, cost_price=1.0)
+        crud.update_stock(db, store.id, soda.id, 12) # Default reorder point: 10
+
+        async def scenario():
+            subscription = events.broker.subscribe([events.location_topic(store.id)])
+            elsewhere = events.broker.subscribe([events.location_topic(other.id)])
+            try:
+                # 1. A committed sale pushes a KPI delta; crossing the reorder point a low_stock event
+                t1 = service_logic.process_sale(db, store.id, cashier.id, [{"product_id": soda.id, "quantity": 3}])
+                received = await _collect(subscription)
+                kpi = [e for e in received if e["type"] == "kpi"]
+                low = [e for e in received if e["type"] == "low_stock"]
+                assert len(kpi) == 1 and kpi[0]["revenue"] == 7.5 and kpi[0]["tx_count"] == 1, received
+                assert len(low) == 1 and low[0]["stock"] == 9, received
+                assert await _collect(elsewhere) == []
+                print("SUCCESS: Sale pushed KPI delta and low-stock alert")
+
+                # 2. A failed sale publishes nothing
+                try:
+                    service_logic.process_sale(db, store.id, cashier.id, [{"product_id": soda.id, "quantity": 500}])
+                except ValueError:
+                    pass
+                assert await _collect(subscription) == []
+                print("SUCCESS: Rolled back sale published nothing")
+
+                # 3. Cancel takes the sale back out
+                service_logic.cancel_transaction(db, t1.id, manager.id)
+                received = await _collect(subscription)
+                assert [(e["revenue"], e["tx_count"]) for e in received if e["type"] == "kpi"] == [(-7.5, -1)], received
+                print("SUCCESS: Cancel pushed negative delta")
+            finally:
+                events.broker.unsubscribe(subscription)
+                events.broker.unsubscribe(elsewhere)
+
+        asyncio.run(scenario())
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_sale_events()
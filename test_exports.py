@@ -0,0 +1,70 @@
+from fastapi.testclient import TestClient
+from api import app
+import init_db
+import os
+import json
+import crud
+import exports
+import traceback
+from datetime import date
+from database import SessionLocal
+
+def test_stream_formats():
+    print("\n--- Test: Export Stream Formats ---")
+    batches = [[(1, date(2026, 1, 2), 3)], [(2, date(2026, 1, 3), 4)]]
+    chunks = list(exports.stream_csv(iter(batches)))
+    # Header rides with the first batch, then one chunk per batch
+    assert len(chunks) == 2, chunks
+    assert chunks[0].startswith("transaction_id,created_at,")
+    assert list(exports.stream_csv(iter([]))) == [",".join(n for n, _ in exports.EXPORT_COLUMNS) + "\r\n"]
+    print("SUCCESS: CSV chunked per batch")
+
+def test_export_endpoint():
+    print("\n--- Test: Transaction Export Endpoint ---")
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Export Store", "store")
+        admin = crud.create_employee(db, "export_admin", "super_admin", "adminpass", store.id)
+        prod = crud.create_product(db, "Export Prod", 2.5, cost_price=1.0)
+        for _ in range(3):
+            crud.create_transaction_with_details(db, store.id, admin.id, [
+                {"product_id": prod.id, "quantity": 1, "unit_price": 2.5},
+                {"product_id": prod.id, "quantity": 2, "unit_price": 2.5}
+            ])
+        store_id = store.id
+    finally:
+        db.close()
+
+    try:
+        client = TestClient(app)
+        token = client.post("/token", data={"username": "export_admin", "password": "adminpass"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        today = crud.local_today(crud.STORE_TIMEZONE)
+        params = {"location_id": store_id, "date_from": str(today), "date_to": str(today)}
+
+        # 1. CSV: header + one row per line
+        response = client.get("/exports/transactions", headers=headers, params=params)
+        assert response.status_code == 200 and response.headers["content-type"].startswith("text/csv")
+        lines = response.text.strip().splitlines()
+        assert len(lines) == 7, lines
+        print("SUCCESS: CSV export")
+
+        # 2. NDJSON
+        response = client.get("/exports/transactions", headers=headers, params={**params, "format": "ndjson"})
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 6 and rows[0]["unit_price"] == "2.50", rows[0]
+        print("SUCCESS: NDJSON export")
+
+        # 3. Bad input
+        assert client.get("/exports/transactions", headers=headers, params={**params, "format": "xml"}).status_code == 400
+        assert client.get("/exports/transactions", headers=headers, params={**params, "date_from": "2999-01-01"}).status_code == 400
+        print("SUCCESS: Invalid export requests rejected")
+    except Exception:
+        traceback.print_exc()
+
+if __name__ == "__main__":
+    test_stream_formats()
+    test_export_endpoint()
@@ -0,0 +1,87 @@
+import init_db
+from database import SessionLocal
+import crud
+import rollup
+import service_logic
+import heavy_hitters
+import os
+import random
+import traceback
+from collections import Counter
+from datetime import datetime, timezone
+
+def test_space_saving_bounds():
+    print("\n--- Test: Space-Saving / Count-Min Bounds ---")
+    random.seed(7)
+    # Skewed stream over 500 items into 32 counters
+    stream = [min(int(random.paretovariate(1.2)), 500) for _ in range(20000)]
+    exact = Counter(stream)
+    sketch = heavy_hitters.ProductSketch()
+    sketch.summary.capacity = 32
+    for item in stream:
+        sketch.update(item, 1)
+    for item, count, error in sketch.summary.top(10):
+        assert count - error <= exact[item] <= count, (item, count, error, exact[item])
+    assert [item for item, _, _ in sketch.summary.top(3)] == [item for item, _ in exact.most_common(3)]
+    assert all(sketch.cms.estimate(item) >= exact[item] for item in exact)
+    print("SUCCESS: Counts bounded, top items found")
+
+    # Merging two days gives the combined ranking
+    day1, day2 = heavy_hitters.SpaceSaving(4), heavy_hitters.SpaceSaving(4)
+    for item, weight in [(1, 5), (2, 3), (3, 1)]:
+        day1.update(item, weight)
+    for item, weight in [(2, 4), (4, 2)]:
+        day2.update(item, weight)
+    merged = heavy_hitters.SpaceSaving.merge([day1, day2], 4)
+    assert merged.top(2) == [(2, 7, 0), (1, 5, 0)], merged.top(2)
+    print("SUCCESS: Summaries merge")
+
+def test_sketch_follows_commits():
+    print("\n--- Test: Sketches Updated on Commit ---")
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    heavy_hitters.registry = heavy_hitters.HeavyHitters()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Sketch Store", "store")
+        cashier = crud.create_employee(db, "sketch_cashier", "internal_cashier", "pwd", store.id)
+        tea = crud.create_product(db, "Sketch Tea", 2.0, cost_price=1.0)
+        cake = crud.create_product(db, "Sketch Cake", 3.0, cost_price=1.0)
+        crud.update_stock(db, store.id, tea.id, 50)
+        crud.update_stock(db, store.id, cake.id, 50)
+
+        service_logic.process_sale(db, store.id, cashier.id, [{"product_id": tea.id, "quantity": 4}, {"product_id": cake.id, "quantity": 1}])
+        service_logic.process_sale(db, store.id, cashier.id, [{"product_id": cake.id, "quantity": 2}])
+
+        # 1. A rolled back sale never reaches the sketch
+        rollup.record_sale(db, 0, store.id, datetime.now(timezone.utc), [{"product_id": cake.id, "quantity": 10, "unit_price": 3.0, "unit_cost_at_sale": 1.0}])
+        db.rollback()
+
+        top = heavy_hitters.top_products(db, [store.id], limit=2, days=7)
+        assert [(r["name"], r["quantity"]) for r in top] == [("Sketch Tea", 4), ("Sketch Cake", 3)], top
+        assert [(r["name"], r["quantity"]) for r in top] == [(r["name"], r["quantity"]) for r in crud.get_top_products(db, [store.id], limit=2, days=7)]
+        print("SUCCESS: Sketch matches exact top products")
+
+        # 2. Snapshot and warm start
+        heavy_hitters.registry.persist(db, heavy_hitters.oldest_day())
+        restarted = heavy_hitters.HeavyHitters()
+        restarted.load(db, heavy_hitters.oldest_day())
+        today = crud.local_today(crud.STORE_TIMEZONE)
+        assert [entry[:2] for entry in restarted.top([({store.id}, today, today)], 2)] == [(tea.id, 4), (cake.id, 3)]
+        print("SUCCESS: Sketches persisted and reloaded")
+
+        # 3. Store-days that drift from the rollup (a rebuild elsewhere) are re-seeded
+        restarted.apply([(store.id, today, cake.id, 5)])
+        assert restarted.reconcile(db, heavy_hitters.oldest_day()) == 1
+        assert restarted.reconcile(db, heavy_hitters.oldest_day()) == 0
+        assert [entry[:2] for entry in restarted.top([({store.id}, today, today)], 2)] == [(tea.id, 4), (cake.id, 3)]
+        print("SUCCESS: Drifted sketches re-seeded")
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_space_saving_bounds()
+    test_sketch_follows_commits()
@@ -0,0 +1,65 @@
+import init_db
+from database import SessionLocal
+import crud
+import hot_stock
+import service_logic
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_hot_sku():
+    print("\n--- Test: Hot SKU Shards ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        cat = crud.create_category(db, "Drinks")
+        store = crud.create_location(db, "Hot Store", "store")
+        cashier = crud.create_employee(db, "hot_cashier", "internal_cashier", "pwd", store.id)
+        soda = crud.create_product(db, "Hot Soda", 1.5, cat.id)
+        crud.update_stock(db, store.id, soda.id, 40)
+
+        hot_stock.enable_hot_sku(db, store.id, soda.id, shard_count=4)
+        stock = crud.get_stock_level(db, store.id, soda.id)
+        assert stock.shard_count == 4 and stock.current_stock == 0
+        assert crud.get_on_hand(db, store.id, soda.id) == 40
+
+        # Sales claim from the shards
+        service_logic.process_sale(db, store.id, cashier.id, [{'product_id': soda.id, 'quantity': 8, 'unit_price': None}])
+        # Bigger than any single shard (at most 10 each): slow path drains several
+        service_logic.process_sale(db, store.id, cashier.id, [{'product_id': soda.id, 'quantity': 25, 'unit_price': None}])
+        assert crud.get_on_hand(db, store.id, soda.id) == 7
+
+        # Oversell still refused on the summed value
+        try:
+            service_logic.process_sale(db, store.id, cashier.id, [{'product_id': soda.id, 'quantity': 8, 'unit_price': None}])
+            print("FAILED: Oversell NOT blocked")
+        except ValueError:
+            print("SUCCESS: Oversell blocked")
+
+        # Inventory and reorder logic see the sum
+        inventory = crud.get_inventory_levels(db, store.id)
+        assert inventory[0]['stock'] == 7
+        low = crud.get_low_stock_items(db, store.id)
+        assert [item['id'] for item in low] == [soda.id]
+
+        # Rebalance keeps the total
+        assert hot_stock.rebalance(db, store.id, soda.id) == 7
+        hot_stock.disable_hot_sku(db, store.id, soda.id)
+        db.expire_all()
+        stock = crud.get_stock_level(db, store.id, soda.id)
+        print(f"Stock after disable: {stock.current_stock} (Expected 7)")
+        assert stock.current_stock == 7
+
+        print("SUCCESS: Hot SKU shards verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_hot_sku()
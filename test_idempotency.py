@@ -0,0 +1,53 @@
+from fastapi.testclient import TestClient
+from api import app
+import init_db
+import os
+import crud
+from database import SessionLocal
+
+# Setup DB for Test
+os.environ["ALLOW_SCHEMA_DROP"] = "true"
+init_db.init_db()
+os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+client = TestClient(app)
+
+def test_idempotent_sale():
+    print("\n--- Test: Idempotent Sales ---")
+    db = SessionLocal()
+    store = crud.create_location(db, "Idem Store", "store")
+    crud.create_employee(db, "idem_cashier", "internal_cashier", "pwd", store.id)
+    crud.create_employee(db, "idem_other", "internal_cashier", "pwd", store.id)
+    prod = crud.create_product(db, "Idem Prod", 5.0)
+    crud.update_stock(db, store.id, prod.id, 10)
+    db.close()
+
+    token = client.post("/token", data={"username": "idem_cashier", "password": "pwd"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}", "Idempotency-Key": "cart-0001"}
+    payload = {"selling_location_id": store.id, "items": [{"product_id": prod.id, "quantity": 3}]}
+
+    # 1. First attempt sells
+    first = client.post("/sales", headers=headers, json=payload)
+    assert first.status_code == 201
+
+    # 2. Retry replays the original response
+    retry = client.post("/sales", headers=headers, json=payload)
+    assert retry.status_code == 201
+    assert retry.json()["id"] == first.json()["id"]
+
+    # 3. Stock was only decremented once
+    db = SessionLocal()
+    stock = crud.get_stock_level(db, store.id, prod.id)
+    print(f"Stock after retry: {stock.current_stock} (Expected 7)")
+    assert stock.current_stock == 7
+    db.close()
+
+    # 4. Another employee cannot reuse the key
+    other = client.post("/token", data={"username": "idem_other", "password": "pwd"}).json()["access_token"]
+    response = client.post("/sales", headers={"Authorization": f"Bearer {other}", "Idempotency-Key": "cart-0001"}, json=payload)
+    assert response.status_code == 409
+
+    print("SUCCESS: Idempotency-Key verified.")
+
+if __name__ == "__main__":
+    test_idempotent_sale()
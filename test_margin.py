@@ -0,0 +1,70 @@
+import os
+import init_db
+import crud
+import rollup
+import margin_analytics
+import traceback
+from datetime import date
+from database import SessionLocal
+
+def test_margin_breakdowns():
+    print("\n--- Test: Gross Margin Analytics ---")
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    db = SessionLocal()
+    try:
+        store_a = crud.create_location(db, "Margin Store A", "store")
+        store_b = crud.create_location(db, "Margin Store B", "store")
+        admin = crud.create_employee(db, "margin_admin", "super_admin", "pwd")
+        drinks = crud.create_category(db, "Margin Drinks")
+        food = crud.create_category(db, "Margin Food")
+        tea = crud.create_product(db, "Margin Tea", 3.0, category_id=drinks.id, cost_price=1.0)
+        cake = crud.create_product(db, "Margin Cake", 4.5, category_id=food.id, cost_price=2.0)
+        crud.create_transaction_with_details(db, store_a.id, admin.id, [
+            {"product_id": tea.id, "quantity": 2, "unit_price": 3.0},
+            {"product_id": cake.id, "quantity": 1, "unit_price": 4.5}
+        ])
+        crud.create_transaction_with_details(db, store_b.id, admin.id, [{"product_id": tea.id, "quantity": 5, "unit_price": 3.0}])
+        rollup.rebuild(db)
+
+        # 1. Totals and breakdowns (revenue 25.5, cost 9.0)
+        both = [store_a.id, store_b.id]
+        start, end = margin_analytics.period_range(db, both, days=30)
+        result = margin_analytics.get_margin(db, both, start, end)
+        assert result["totals"] == {"quantity": 8, "revenue": 25.5, "cost": 9.0, "margin": 16.5, "margin_pct": 64.71}, result["totals"]
+        assert [p["name"] for p in result["by_product"]] == ["Margin Tea", "Margin Cake"]
+        assert {c["category"]: c["margin"] for c in result["by_category"]} == {"Margin Drinks": 14.0, "Margin Food": 2.5}
+        assert {l["location"]: l["margin"] for l in result["by_location"]} == {"Margin Store A": 6.5, "Margin Store B": 10.0}
+        assert len(result["by_period"]) == 1 and result["by_period"][0]["margin"] == 16.5
+        daily = margin_analytics.get_margin(db, both, start, end, granularity="day")
+        assert daily["by_period"][0]["period"] == str(end) and daily["by_period"][0]["margin"] == 16.5
+        print("SUCCESS: Margin breakdowns")
+
+        # 2. Cached until a sale changes the period's watermark
+        assert margin_analytics.get_margin(db, both, start, end) is result
+        crud.create_transaction_with_details(db, store_a.id, admin.id, [{"product_id": cake.id, "quantity": 2, "unit_price": 4.5}])
+        rollup.rebuild(db)
+        fresh = margin_analytics.get_margin(db, both, start, end)
+        assert fresh is not result and fresh["totals"]["margin"] == 21.5, fresh["totals"]
+        print("SUCCESS: Cache follows the sales watermark")
+
+        # 3. Bad input
+        try:
+            margin_analytics.get_margin(db, both, start, end, granularity="week")
+            assert False, "unsupported granularity accepted"
+        except ValueError:
+            pass
+        try:
+            margin_analytics.period_range(db, both, date_from=date(2026, 2, 1), date_to=date(2026, 1, 1))
+            assert False, "reversed range accepted"
+        except ValueError:
+            pass
+        print("SUCCESS: Invalid periods rejected")
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_margin_breakdowns()
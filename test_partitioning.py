@@ -0,0 +1,69 @@
+import init_db
+from database import SessionLocal, engine
+from sqlalchemy import text
+from datetime import date, datetime, timedelta, timezone
+import crud
+import partitioning
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_month_math():
+    assert partitioning.add_months(date(2025, 11, 1), 3) == date(2026, 2, 1)
+    assert partitioning.add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert partitioning.partition_name("transactions", date(2026, 2, 1)) == "transactions_y2026m02"
+    print("SUCCESS: Month arithmetic")
+
+def test_partitioned_sales():
+    print("\n--- Test: Partitioned Transactions ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Partition Store", "store")
+        emp = crud.create_employee(db, "partition_cashier", "cashier", "pwd", store.id)
+        prod = crud.create_product(db, "Partition Cola", 2.0, cost_price=1.0)
+        last_month = datetime.now(timezone.utc).replace(day=1) - timedelta(days=1)
+
+        # 1. Existing rows are carried over by the migration
+        old = crud.create_transaction_with_details(db, store.id, emp.id, [{"product_id": prod.id, "quantity": 1, "unit_price": 2.0}])
+        db.execute(text("UPDATE transaction_details SET transaction_created_at = :d WHERE transaction_id = :id"), {"d": last_month, "id": old.id})
+        db.execute(text("UPDATE transactions SET created_at = :d WHERE id = :id"), {"d": last_month, "id": old.id})
+        db.commit()
+        db.close()
+
+        assert partitioning.migrate_to_partitioned(engine)
+        assert not partitioning.migrate_to_partitioned(engine) # Idempotent
+
+        db = SessionLocal()
+        with engine.connect() as conn:
+            months = partitioning.list_partitions(conn, "transactions")
+            assert partitioning.partition_name("transactions", partitioning.month_start(last_month)) in months
+            assert len(months) >= partitioning.PARTITION_MONTHS_AHEAD + 2
+
+        # 2. New sales land in the current month, details co-located
+        tx = crud.create_transaction_with_details(db, store.id, emp.id, [{"product_id": prod.id, "quantity": 2, "unit_price": 2.0}])
+        assert tx.details[0].transaction_created_at == tx.created_at
+        current = partitioning.partition_name("transaction_details", partitioning.month_start(tx.created_at))
+        assert db.execute(text(f"SELECT count(*) FROM {current}")).scalar() == 1
+        print("SUCCESS: Sale routed to the current partition")
+
+        # 3. Detaching last month leaves the current month untouched
+        db.close()
+        partitioning.detach_month(engine, last_month, drop=True)
+        db = SessionLocal()
+        assert crud.get_transaction(db, old.id) is None
+        assert crud.get_transaction(db, tx.id) is not None
+        print("SUCCESS: Old month detached")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_month_math()
+    test_partitioned_sales()
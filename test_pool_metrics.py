@@ -0,0 +1,67 @@
+from fastapi.testclient import TestClient
+from api import app
+from database import engine, pool_status, POOL_METRICS, SessionLocal
+from sqlalchemy import text
+import init_db
+import os
+import crud
+import traceback
+
+def test_pool_metrics():
+    print("\n--- Test: Pool Metrics ---")
+    metrics = POOL_METRICS["primary"]
+    metrics.reset()
+    try:
+        # 1. Checkouts are counted and timed
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+            status = pool_status()["primary"]
+            assert status["checked_out"] >= 1
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+        status = pool_status()["primary"]
+        assert status["checkouts"] == 2, status
+        assert sum(status["wait_histogram"].values()) == 2
+        assert status["timeouts"] == 0
+        print(f"SUCCESS: Pool status {status}")
+
+        # 2. Recreated pools keep reporting into the same metrics
+        engine.dispose()
+        with engine.connect() as conn:
+            conn.execute(text("SELECT 1"))
+        assert pool_status()["primary"]["checkouts"] == 3
+        print("SUCCESS: Metrics survive pool recreation")
+    except Exception:
+        traceback.print_exc()
+
+def test_pool_metrics_endpoint():
+    print("\n--- Test: Pool Metrics Endpoint ---")
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Pool Store", "store")
+        crud.create_employee(db, "pool_admin", "super_admin", "adminpass", store.id)
+        crud.create_employee(db, "pool_cashier", "cashier", "cashierpass", store.id)
+    finally:
+        db.close()
+
+    try:
+        client = TestClient(app)
+        # Admin only: pool sizes and timeouts are not for every caller
+        assert client.get("/metrics/pool").status_code == 401
+        token = client.post("/token", data={"username": "pool_cashier", "password": "cashierpass"}).json()["access_token"]
+        assert client.get("/metrics/pool", headers={"Authorization": f"Bearer {token}"}).status_code == 403
+        token = client.post("/token", data={"username": "pool_admin", "password": "adminpass"}).json()["access_token"]
+        response = client.get("/metrics/pool", headers={"Authorization": f"Bearer {token}"})
+        assert response.status_code == 200 and "primary" in response.json(), response.text
+        print("SUCCESS: Pool metrics restricted to admins")
+    except Exception:
+        traceback.print_exc()
+        raise
+
+if __name__ == "__main__":
+    test_pool_metrics()
+    test_pool_metrics_endpoint()
@@ -0,0 +1,87 @@
+import init_db
+from database import SessionLocal
+import crud
+import service_logic
+from reservations import ledger, ReservationLedger, may_manage
+import os
+import traceback
+from datetime import datetime, timezone
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_reservations():
+    print("\n--- Test: Cart Reservations ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Reserve Store", "store")
+        cashier = crud.create_employee(db, "reserve_cashier", "internal_cashier", "pwd", store.id)
+        prod = crud.create_product(db, "Reserve Prod", 3.0)
+        crud.update_stock(db, store.id, prod.id, 10)
+
+        # 1. Cart A holds 6
+        cart_a = ledger.reserve(db, store.id, {prod.id: 6}, cashier.id, ttl_seconds=60)
+        assert ledger.reserved_for(store.id) == {prod.id: 6}
+
+        # 2. Cart B cannot hold more than the remaining 4
+        try:
+            ledger.reserve(db, store.id, {prod.id: 5}, cashier.id)
+            print("FAILED: Over-reservation NOT blocked")
+        except ValueError as e:
+            print(f"SUCCESS: Over-reservation blocked ({e})")
+
+        # 3. A walk-in sale cannot take the held stock
+        try:
+            service_logic.process_sale(db, store.id, cashier.id, [{'product_id': prod.id, 'quantity': 5, 'unit_price': None}])
+            print("FAILED: Held stock sold")
+        except ValueError:
+            print("SUCCESS: Held stock protected")
+
+        # 4. Cart A pays: its hold becomes the sale and is released
+        service_logic.process_sale(db, store.id, cashier.id, [{'product_id': prod.id, 'quantity': 6, 'unit_price': None}],
+                                   reservation_id=cart_a.id)
+        assert ledger.get(cart_a.id) is None
+        assert crud.get_on_hand(db, store.id, prod.id) == 4
+
+        # 5. Expired holds free their stock
+        cart_b = ledger.reserve(db, store.id, {prod.id: 4}, cashier.id, ttl_seconds=0)
+        assert ledger.expire() == 1
+        assert ledger.get(cart_b.id) is None
+
+        # 6. Snapshot round-trip
+        cart_c = ledger.reserve(db, store.id, {prod.id: 2}, cashier.id, ttl_seconds=60)
+        ledger.persist(db)
+        ledger.restore(db)
+        assert ledger.get(cart_c.id).items == {prod.id: 2}
+
+        # 7. Only the creator, staff of the store or a super admin may change a hold
+        other_store = crud.create_location(db, "Reserve Other Store", "store")
+        colleague = crud.create_employee(db, "reserve_colleague", "internal_cashier", "pwd", store.id)
+        outsider = crud.create_employee(db, "reserve_outsider", "internal_cashier", "pwd", other_store.id)
+        admin = crud.create_employee(db, "reserve_admin", "super_admin", "pwd")
+        assert may_manage(cart_c, cashier) and may_manage(cart_c, colleague) and may_manage(cart_c, admin)
+        assert not may_manage(cart_c, outsider)
+
+        # 8. Another worker's snapshot keeps this worker's holds, and vice versa
+        other_worker = ReservationLedger()
+        cart_d = other_worker.reserve(db, store.id, {prod.id: 1}, cashier.id, ttl_seconds=60)
+        other_worker.persist(db)
+        ledger.release(cart_c.id)
+        ledger.persist(db)
+        saved = {r.reservation_id for r in crud.get_active_stock_reservations(db, datetime.now(timezone.utc))}
+        assert saved == {cart_d.id}, saved
+        other_worker.release(cart_d.id)
+        other_worker.persist(db)
+
+        print("SUCCESS: Reservations verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_reservations()
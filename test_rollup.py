@@ -0,0 +1,70 @@
+import init_db
+from database import SessionLocal
+from sqlalchemy import func
+from models import DailySalesRollup, DailyLocationRollup
+import crud
+import rollup
+import service_logic
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def _totals(db, location_id):
+    product = db.query(
+        DailySalesRollup.product_id, func.sum(DailySalesRollup.qty), func.sum(DailySalesRollup.revenue), func.sum(DailySalesRollup.tx_count)
+    ).filter(DailySalesRollup.location_id == location_id).group_by(DailySalesRollup.product_id).all()
+    location = db.query(
+        func.sum(DailyLocationRollup.qty), func.sum(DailyLocationRollup.revenue), func.sum(DailyLocationRollup.tx_count)
+    ).filter(DailyLocationRollup.location_id == location_id).one()
+    return {row[0]: (int(row[1]), float(row[2]), int(row[3])) for row in product}, (int(location[0]), float(location[1]), int(location[2]))
+
+def test_rollup_maintenance():
+    print("\n--- Test: Daily Sales Rollup ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Rollup Store", "store")
+        manager = crud.create_employee(db, "rollup_manager", "branch_manager", "pwd", store.id)
+        cashier = crud.create_employee(db, "rollup_cashier", "internal_cashier", "pwd", store.id)
+        cola = crud.create_product(db, "Rollup Cola", 2.0, cost_price=1.0)
+        chips = crud.create_product(db, "Rollup Chips", 3.0, cost_price=1.5)
+        crud.update_stock(db, store.id, cola.id, 50)
+        crud.update_stock(db, store.id, chips.id, 50)
+
+        # 1. Sales add to the rollup in their own DB transaction
+        t1 = service_logic.process_sale(db, store.id, cashier.id, [{"product_id": cola.id, "quantity": 3}, {"product_id": chips.id, "quantity": 1}])
+        service_logic.process_sale(db, store.id, cashier.id, [{"product_id": cola.id, "quantity": 1}])
+        products, location = _totals(db, store.id)
+        assert products[cola.id] == (4, 8.0, 2), products
+        assert location == (5, 11.0, 2), location
+
+        # 2. Voids and cancels take it back out
+        service_logic.void_line_item(db, t1.id, chips.id, 1, manager.id)
+        products, location = _totals(db, store.id)
+        assert products[chips.id] == (0, 0.0, 0), products
+        assert location == (4, 8.0, 2), location
+        service_logic.cancel_transaction(db, t1.id, manager.id)
+        products, location = _totals(db, store.id)
+        assert products[cola.id] == (1, 2.0, 1), products
+        assert location == (1, 2.0, 1), location
+        print("SUCCESS: Rollup follows sales, voids and cancels")
+
+        # 3. A rebuild from the raw tables agrees
+        rollup.rebuild(db)
+        rebuilt_products, rebuilt_location = _totals(db, store.id)
+        assert rebuilt_products[cola.id] == products[cola.id]
+        assert rebuilt_location == location
+        assert crud.get_dashboard_kpis(db, [store.id])["count_today"] == 1
+        print("SUCCESS: Rebuild matches incremental rollup")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_rollup_maintenance()
@@ -0,0 +1,65 @@
+import init_db
+from database import SessionLocal
+import crud
+import service_logic
+import os
+import traceback
+from datetime import datetime, timedelta, timezone
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_sale_batch():
+    print("\n--- Test: Offline Sale Batch ---")
+    setup_db()
+    db = SessionLocal()
+    try:
+        store = crud.create_location(db, "Batch Store", "store")
+        cashier = crud.create_employee(db, "batch_cashier", "internal_cashier", "pwd", store.id)
+        prod = crud.create_product(db, "Batch Prod", 4.0, cost_price=1.0)
+        crud.update_stock(db, store.id, prod.id, 10)
+
+        rang_up = datetime.now(timezone.utc) - timedelta(hours=2)
+        sales = [
+            {'selling_location_id': store.id, 'customer_id': None, 'client_timestamp': rang_up,
+             'idempotency_key': 'offline-1', 'items': [{'product_id': prod.id, 'quantity': 6, 'unit_price': None}]},
+            # Only 4 left: must fail without aborting the batch
+            {'selling_location_id': store.id, 'customer_id': None, 'client_timestamp': None,
+             'idempotency_key': 'offline-2', 'items': [{'product_id': prod.id, 'quantity': 5, 'unit_price': None}]},
+            {'selling_location_id': store.id, 'customer_id': None, 'client_timestamp': None,
+             'idempotency_key': 'offline-3', 'items': [{'product_id': prod.id, 'quantity': 4, 'unit_price': None}]},
+            # Queued twice on the terminal
+            {'selling_location_id': store.id, 'customer_id': None, 'client_timestamp': None,
+             'idempotency_key': 'offline-3', 'items': [{'product_id': prod.id, 'quantity': 4, 'unit_price': None}]},
+        ]
+
+        results = service_logic.process_sale_batch(db, cashier.id, sales)
+        print([r['status'] for r in results])
+        assert [r['status'] for r in results] == ['created', 'failed', 'created', 'replayed']
+        assert results[0]['total_amount'] == 24.0
+        assert results[3]['transaction_id'] == results[2]['transaction_id']
+
+        tx = crud.get_transaction(db, results[0]['transaction_id'])
+        assert abs((tx.created_at - rang_up).total_seconds()) < 1
+        assert len(tx.details) == 1
+
+        db.expire_all()
+        stock = crud.get_stock_level(db, store.id, prod.id)
+        print(f"Stock after batch: {stock.current_stock} (Expected 0)")
+        assert stock.current_stock == 0
+
+        # Replaying the same batch creates nothing new
+        results = service_logic.process_sale_batch(db, cashier.id, sales)
+        assert [r['status'] for r in results] == ['replayed', 'failed', 'replayed', 'replayed']
+
+        print("SUCCESS: Offline sale batch verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    test_sale_batch()
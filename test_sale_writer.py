@@ -0,0 +1,56 @@
+import init_db
+from database import SessionLocal
+import crud
+from sale_writer import GroupCommitSaleWriter
+import os
+import traceback
+
+def setup_db():
+    os.environ["ALLOW_SCHEMA_DROP"] = "true"
+    init_db.init_db()
+    os.environ.pop("ALLOW_SCHEMA_DROP", None)
+
+def test_group_commit():
+    print("\n--- Test: Group-Commit Sale Writer ---")
+    setup_db()
+    db = SessionLocal()
+    writer = GroupCommitSaleWriter(window_ms=50, max_batch=10)
+    try:
+        store = crud.create_location(db, "Group Store", "store")
+        cashier = crud.create_employee(db, "group_cashier", "internal_cashier", "pwd", store.id)
+        prod = crud.create_product(db, "Group Prod", 1.0)
+        crud.update_stock(db, store.id, prod.id, 5)
+
+        writer.start()
+        # Submitted together: collected into the same group
+        ok_1 = writer.submit(store.id, cashier.id, [{'product_id': prod.id, 'quantity': 2, 'unit_price': None}])
+        too_big = writer.submit(store.id, cashier.id, [{'product_id': prod.id, 'quantity': 10, 'unit_price': None}])
+        ok_2 = writer.submit(store.id, cashier.id, [{'product_id': prod.id, 'quantity': 3, 'unit_price': None}])
+
+        tx_1 = ok_1.result(timeout=5)
+        tx_2 = ok_2.result(timeout=5)
+        print(f"Committed: {tx_1.id}, {tx_2.id}")
+        assert tx_1.id and tx_2.id
+
+        # The failing sale is isolated by its savepoint
+        try:
+            too_big.result(timeout=5)
+            print("FAILED: Oversell NOT blocked")
+        except ValueError as e:
+            print(f"SUCCESS: Oversell isolated ({e})")
+
+        db.expire_all()
+        stock = crud.get_stock_level(db, store.id, prod.id)
+        print(f"Stock after group: {stock.current_stock} (Expected 0)")
+        assert stock.current_stock == 0
+
+        print("SUCCESS: Group commit verified.")
+
+    except Exception:
+        traceback.print_exc()
+    finally:
+        writer.stop()
+        db.close()
+
+if __name__ == "__main__":
+    test_group_commit()